@@ -1,14 +1,28 @@
 import os
+import json
 import argparse
 import asyncio
-import aiohttp
 import logging
-from typing import Optional
+from typing import List, Optional, Tuple
 from datetime import datetime, timedelta
-from fastapi import FastAPI, BackgroundTasks, HTTPException
-from pydantic import BaseModel, HttpUrl
+from fastapi import FastAPI, Header, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, HttpUrl
 import uvicorn
 from booker import book_restaurant
+from browser_pool import BrowserPool
+from job_queue import BookingQueue, QueueFullError
+from llm_registry import get_registry
+from llm_usage import LLMUsage
+from job_store import TERMINAL_STATUSES, JobRecord, create_job_store
+from events import EventBus, format_sse
+from ids import new_batch_id, new_booking_id
+from batches import BatchTracker
+from callbacks import CallbackOutbox
+from idempotency import InFlightRequests, create_idempotency_keys, request_hash
+from catalog import get_catalog
+from outcomes import get_outcome_log
+from result_cache import ResultCache, is_cacheable, request_cache_key
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -36,6 +50,9 @@ class BookingRequest(BaseModel):
     restaurant_name: Optional[str] = None
     latitude: Optional[float] = None
     longitude: Optional[float] = None
+    # Preferences used to rank known restaurants
+    max_price_level: Optional[int] = Field(None, ge=1, le=4)
+    cuisine: Optional[str] = None
     # Callback URL for webhook notifications
     callback_url: Optional[HttpUrl] = None
 
@@ -45,35 +62,322 @@ class BookingResponse(BaseModel):
     message: str
     booking_id: Optional[str] = None
     details: Optional[dict] = None
+    queue_position: Optional[int] = None
+    estimated_start_time: Optional[str] = None
 
-# Global store for booking results
-booking_results = {}
+# Define the batch request model
+class BatchBookingRequest(BaseModel):
+    bookings: List[BookingRequest]
+    # Queue the bookings that fit instead of rejecting the whole batch
+    allow_partial: bool = False
+    # Maximum number of bookings of this batch processed at the same time
+    max_concurrency: Optional[int] = Field(None, ge=1)
+    # Callback URL notified once when every booking of the batch has finished
+    callback_url: Optional[HttpUrl] = None
+
+# Define the batch response model
+class BatchBookingResponse(BaseModel):
+    status: str
+    message: str
+    batch_id: str
+    bookings: List[BookingResponse]
+    # Indexes of the requested bookings that were not queued
+    deferred: List[int] = []
+
+# Define the bulk status request model
+class StatusBatchRequest(BaseModel):
+    booking_ids: List[str]
+
+# Define the bulk status response model
+class StatusBatchResponse(BaseModel):
+    bookings: List[BookingResponse]
+    not_found: List[str] = []
+    expired: List[str] = []
+
+# Define the booking listing response model
+class BookingListResponse(BaseModel):
+    bookings: List[BookingResponse]
+    # Cursor of the next page, or None on the last page
+    next_cursor: Optional[str] = None
+
+# Store for booking jobs, evicting finished jobs by size and age (in memory or in SQLite)
+job_store = create_job_store()
+
+# Live status and agent step events of the bookings handled by this process
+event_bus = EventBus()
+
+# Seconds between keep-alive messages on idle event streams
+SSE_KEEPALIVE_INTERVAL = float(os.environ.get('SSE_KEEPALIVE_INTERVAL', '15'))
+
+# Most booking IDs accepted by one bulk status request
+STATUS_BATCH_MAX_SIZE = int(os.environ.get('STATUS_BATCH_MAX_SIZE', '1000'))
+
+# Longest time a /status request may wait for a change
+LONG_POLL_MAX_WAIT = float(os.environ.get('LONG_POLL_MAX_WAIT', '60'))
+
+# Durable outbox delivering webhook callbacks in the background
+callback_outbox = CallbackOutbox.from_env()
+
+# Bookings created for Idempotency-Key headers, and identical test mode requests in flight
+idempotency_keys = create_idempotency_keys()
+in_flight = InFlightRequests()
+
+# Cache of test mode results, answering repeated requests without an agent run
+result_cache = ResultCache.from_env() if os.environ.get('RESULT_CACHE_ENABLED', 'true').lower() == 'true' else None
+
+# Batches whose bookings are still in progress
+batch_tracker = BatchTracker()
+
+# Shared pool of warm browsers, created on startup
+browser_pool: Optional[BrowserPool] = None
+
+# Bounded queue of booking jobs, drained by a fixed number of workers
+booking_queue: Optional[BookingQueue] = None
+
+async def notify_interrupted(records: List[JobRecord]):
+    """Tell the callers of jobs left unfinished by a stopped process that they have failed."""
+    for record in records:
+        if record.request.get("callback_url"):
+            await send_callback(record.request["callback_url"], {
+                "status": record.status,
+                "message": record.message,
+                "booking_id": record.booking_id,
+                "details": record.details()
+            })
+
+@app.on_event("startup")
+async def start_workers():
+    global browser_pool, booking_queue
+    await callback_outbox.start()
+    await job_store.start(on_interrupted=notify_interrupted)
+    if os.environ.get('BROWSER_POOL_ENABLED', 'true').lower() == 'true':
+        browser_pool = BrowserPool.from_env()
+        await browser_pool.start()
+    booking_queue = BookingQueue.from_env(process_booking)
+    await booking_queue.start()
+    preconnect_models = [model for model in os.environ.get('LLM_PRECONNECT', '').split(',') if model]
+    if preconnect_models:
+        await get_registry().preconnect(preconnect_models)
+
+@app.on_event("shutdown")
+async def stop_workers():
+    if booking_queue is not None:
+        await booking_queue.close()
+    if browser_pool is not None:
+        await browser_pool.close()
+    await get_registry().close()
+    await callback_outbox.close()
+    await job_store.close()
 
 @app.get("/")
 async def root():
     return {"status": "ok", "message": "Restaurant Booking API is running"}
 
+@app.get("/metrics")
+async def metrics():
+    return {
+        "browser_pool": browser_pool.stats() if browser_pool is not None else None,
+        "queue": booking_queue.stats(),
+        "job_store": job_store.stats(),
+        "events": event_bus.stats(),
+        "batches": batch_tracker.stats(),
+        "idempotency": idempotency_keys.stats(),
+        "coalescing": in_flight.stats(),
+        "result_cache": result_cache.stats() if result_cache is not None else None,
+        "catalog": get_catalog().stats(),
+        "booking_outcomes": get_outcome_log().stats(),
+        "callbacks": callback_outbox.stats(),
+        "llm_rate_limits": get_registry().rate_limiters.utilization()
+    }
+
 @app.post("/book", response_model=BookingResponse)
-async def create_booking(request: BookingRequest, background_tasks: BackgroundTasks):
-    # Generate a booking ID
-    booking_id = f"booking_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+async def create_booking(request: BookingRequest, response: Response,
+                         idempotency_key: Optional[str] = Header(None, max_length=255)):
+    """
+    Queue a booking.
     
-    # Set default date to tomorrow if not provided
-    if not request.date:
-        tomorrow = datetime.now() + timedelta(days=1)
-        request.date = tomorrow.strftime('%Y-%m-%d')
+    A retry carrying the Idempotency-Key of an accepted request returns the
+    booking of that request instead of booking again. Identical test mode
+    requests submitted while one of them is running share its agent run.
+    """
+    # Retries are compared as the client sent them, before defaults that change over time are applied
+    fingerprint = request_hash(json.loads(request.json()))
     
-    # Store initial status
-    booking_results[booking_id] = {
-        "status": "pending",
-        "message": f"{'Test mode - Restaurant information retrieval' if request.test_mode else 'Booking process'} started",
-        "details": request.dict()
-    }
+    if idempotency_key:
+        existing = await idempotency_keys.get(idempotency_key)
+        if existing is not None:
+            return replay_idempotent(existing, fingerprint, response)
+    
+    set_default_date(request)
+    coalesce_key = request_hash(json.loads(request.json()))
+    
+    # Look up test mode requests in the result cache
+    cache_key = None
+    if request.test_mode and result_cache is not None:
+        cache_key = request_cache_key(city=request.city, latitude=request.latitude, longitude=request.longitude,
+                                      purpose=request.purpose, restaurant_name=request.restaurant_name,
+                                      date=request.date)
+        cached, refresh = result_cache.get(cache_key)
+        if cached is not None:
+            return await complete_from_cache(request, cached, refresh, cache_key, idempotency_key, fingerprint,
+                                             response)
+    
+    booking_id, kwargs = create_job(request)
+    if idempotency_key:
+        # Another process may have taken the key since it was looked up
+        existing = await idempotency_keys.claim(idempotency_key, booking_id, fingerprint)
+        if existing is not None:
+            job_store.delete(booking_id)
+            return replay_idempotent(existing, fingerprint, response)
+    kwargs["cache_key"] = cache_key
+    
+    # Wait for the result of an identical test mode request that is already in flight
+    if request.test_mode:
+        leader = in_flight.join(coalesce_key, booking_id)
+        if leader is not None:
+            job_store.update(booking_id, message=f"Test mode - Waiting for the identical booking {leader}")
+            return accepted_response(request, booking_id, booking_queue.position(leader))
+        kwargs["coalesce_key"] = coalesce_key
+    
+    # Queue the booking process, rejecting the request when the queue is full
+    try:
+        position = await booking_queue.submit(booking_id, **kwargs)
+    except QueueFullError as e:
+        job_store.delete(booking_id)
+        if idempotency_key:
+            await idempotency_keys.discard(idempotency_key)
+        if request.test_mode:
+            # Identical requests may have joined while this one waited for admission
+            for follower_id in in_flight.finish(coalesce_key):
+                update_job(follower_id, status="failed", message="Operation failed: booking queue is full")
+        raise HTTPException(status_code=429, detail="Too many bookings in progress, please retry later",
+                            headers={"Retry-After": str(e.retry_after)})
+    
+    return accepted_response(request, booking_id, position)
+
+def replay_idempotent(existing: Tuple[str, str], fingerprint: str, response: Response) -> BookingResponse:
+    """Answer a retry with the booking that holds its Idempotency-Key, or reject it."""
+    booking_id, existing_fingerprint = existing
+    if existing_fingerprint != fingerprint:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+    record = job_store.get(booking_id)
+    if record is None:
+        # Booking again could make a second real reservation
+        if job_store.is_expired(booking_id):
+            raise HTTPException(status_code=410, detail=f"The booking {booking_id} of this Idempotency-Key has expired")
+        # The booking may also still be on its way to the database from another process
+        raise HTTPException(status_code=409, detail=f"The booking {booking_id} of this Idempotency-Key is not available, please retry later")
+    idempotency_keys.replayed += 1
+    response.headers["Idempotent-Replayed"] = "true"
+    return status_response(record)
+
+async def complete_from_cache(request: BookingRequest, cached: str, refresh: bool, cache_key: str,
+                              idempotency_key: Optional[str], fingerprint: str,
+                              response: Response) -> BookingResponse:
+    """
+    Answer a test mode request with a cached result.
+    
+    The booking is stored as completed right away. When the cached result is
+    stale, a refresh run is queued in the background to replace it.
+    """
+    booking_id, _ = create_job(request)
+    if idempotency_key:
+        existing = await idempotency_keys.claim(idempotency_key, booking_id, fingerprint)
+        if existing is not None:
+            job_store.delete(booking_id)
+            return replay_idempotent(existing, fingerprint, response)
+    update_job(booking_id, status="completed", message="Restaurant information retrieval completed (cached)",
+               result=cached)
+    record = job_store.get(booking_id)
+    
+    if request.callback_url:
+        await send_callback(request.callback_url, {
+            "status": "completed",
+            "message": record.message,
+            "booking_id": booking_id,
+            "details": record.details()
+        })
+    
+    if refresh:
+        refresh_id, kwargs = create_job(request.copy(update={"callback_url": None}))
+        job_store.update(refresh_id, message="Test mode - Refresh of a cached result queued")
+        try:
+            await booking_queue.submit(refresh_id, **kwargs, cache_key=cache_key)
+        except QueueFullError:
+            # Keep serving the stale result; a later request will try again
+            job_store.delete(refresh_id)
+            result_cache.refresh_done(cache_key)
+    
+    return status_response(record)
+
+@app.post("/book/batch", response_model=BatchBookingResponse)
+async def create_booking_batch(request: BatchBookingRequest):
+    """
+    Queue a list of bookings in one request.
+    
+    Admission is all or nothing: if the queue cannot take every booking the
+    request is rejected with 429, unless allow_partial is set, in which case
+    the bookings that fit are queued and the indexes of the others are
+    returned as deferred. max_concurrency limits how many bookings of the
+    batch run at the same time, and callback_url receives one callback once
+    every queued booking of the batch has finished.
+    """
+    if not request.bookings:
+        raise HTTPException(status_code=422, detail="A batch needs at least one booking")
+    
+    batch_id = new_batch_id()
+    jobs = [create_job(booking, batch_id) for booking in request.bookings]
+    
+    try:
+        positions = await booking_queue.submit_many(jobs, group=batch_id,
+                                                    group_limit=request.max_concurrency,
+                                                    allow_partial=request.allow_partial)
+    except QueueFullError as e:
+        for booking_id, _ in jobs:
+            job_store.delete(booking_id)
+        raise HTTPException(status_code=429, detail="Too many bookings in progress, please retry later",
+                            headers={"Retry-After": str(e.retry_after)})
+    
+    # Forget the bookings that did not fit into the queue
+    admitted = jobs[:len(positions)]
+    for booking_id, _ in jobs[len(positions):]:
+        job_store.delete(booking_id)
+    
+    batch_tracker.create(batch_id, [booking_id for booking_id, _ in admitted],
+                         str(request.callback_url) if request.callback_url else None)
     
-    # Run the booking process in the background
-    background_tasks.add_task(
-        process_booking, 
+    deferred = list(range(len(positions), len(jobs)))
+    return BatchBookingResponse(
+        status="accepted" if not deferred else "partially_accepted",
+        message=f"{len(admitted)} of {len(jobs)} bookings queued",
+        batch_id=batch_id,
+        bookings=[accepted_response(booking, booking_id, position)
+                  for booking, (booking_id, _), position in zip(request.bookings, admitted, positions)],
+        deferred=deferred
+    )
+
+def create_job(request: BookingRequest, batch_id: Optional[str] = None) -> Tuple[str, dict]:
+    """
+    Store the initial record of a booking request.
+    
+    Returns:
+        tuple: (booking_id, keyword arguments for process_booking)
+    """
+    # Generate a unique, time-sortable booking ID
+    booking_id = new_booking_id()
+    set_default_date(request)
+    
+    # Store initial status, with the request fields in their JSON form so the
+    # record can be persisted and sent in callbacks as is
+    request_fields = json.loads(request.json())
+    job_store.create(JobRecord(
         booking_id=booking_id,
+        status="pending",
+        message=f"{'Test mode - Restaurant information retrieval' if request.test_mode else 'Booking process'} queued",
+        request={**request_fields, "batch_id": batch_id} if batch_id else request_fields
+    ))
+    
+    kwargs = dict(
         city=request.city,
         date=request.date,
         time=request.time,
@@ -89,32 +393,176 @@ async def create_booking(request: BookingRequest, background_tasks: BackgroundTa
         restaurant_name=request.restaurant_name,
         latitude=request.latitude,
         longitude=request.longitude,
-        callback_url=request.callback_url
+        max_price_level=request.max_price_level,
+        cuisine=request.cuisine,
+        callback_url=request.callback_url,
+        batch_id=batch_id
     )
-    
+    return booking_id, kwargs
+
+def set_default_date(request: BookingRequest):
+    """Set the booking date to tomorrow if not provided."""
+    if not request.date:
+        tomorrow = datetime.now() + timedelta(days=1)
+        request.date = tomorrow.strftime('%Y-%m-%d')
+
+def accepted_response(request: BookingRequest, booking_id: str, position: Optional[int]) -> BookingResponse:
+    """Build the response for a booking that was queued."""
     return BookingResponse(
         status="accepted",
-        message=f"{'Test mode - Restaurant information retrieval' if request.test_mode else 'Booking process'} started. You can check the status using the booking ID.",
-        booking_id=booking_id
+        message=f"{'Test mode - Restaurant information retrieval' if request.test_mode else 'Booking process'} queued. You can check the status using the booking ID.",
+        booking_id=booking_id,
+        queue_position=position,
+        estimated_start_time=estimated_start_time(position)
     )
 
-@app.get("/status/{booking_id}", response_model=BookingResponse)
-async def get_booking_status(booking_id: str):
-    if booking_id not in booking_results:
+def estimated_start_time(position: Optional[int]) -> Optional[str]:
+    """Convert a queue position into an ISO timestamp of the expected start."""
+    if position is None:
+        return None
+    wait = booking_queue.estimated_wait(position)
+    return (datetime.now() + timedelta(seconds=wait)).isoformat(timespec='seconds')
+
+def get_record_or_404(booking_id: str) -> JobRecord:
+    """Return the job record of a booking, or raise 410 if it expired and 404 if it never existed."""
+    record = job_store.get(booking_id)
+    if record is None:
+        if job_store.is_expired(booking_id):
+            raise HTTPException(status_code=410, detail="Booking ID expired")
         raise HTTPException(status_code=404, detail="Booking ID not found")
+    return record
+
+@app.get("/status/{booking_id}", response_model=BookingResponse)
+async def get_booking_status(booking_id: str, response: Response,
+                             wait: Optional[float] = Query(None, ge=0),
+                             since: Optional[int] = Query(None)):
+    """
+    Return the status of a booking.
+    
+    With wait and since, the request is held for up to wait seconds until the
+    version of the booking is newer than since, so clients can long-poll for
+    the next change. The version is returned in the X-Booking-Version header.
+    """
+    record = get_record_or_404(booking_id)
     
-    result = booking_results[booking_id]
+    if wait and since is not None:
+        deadline = asyncio.get_running_loop().time() + min(wait, LONG_POLL_MAX_WAIT)
+        while record.version <= since and record.status not in TERMINAL_STATUSES:
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                break
+            # Jobs run by another API process publish no events here, so wake
+            # up periodically to re-read the store
+            await event_bus.wait_for_status(booking_id, min(remaining, SSE_KEEPALIVE_INTERVAL))
+            record = get_record_or_404(booking_id)
+    
+    response.headers["X-Booking-Version"] = str(record.version)
+    return status_response(record)
+
+@app.post("/status/batch", response_model=StatusBatchResponse)
+async def get_booking_statuses(request: StatusBatchRequest):
+    """Return the status of many bookings in one request."""
+    if len(request.booking_ids) > STATUS_BATCH_MAX_SIZE:
+        raise HTTPException(status_code=422, detail=f"At most {STATUS_BATCH_MAX_SIZE} booking IDs per request")
+    
+    records = job_store.get_many(request.booking_ids)
+    missing = [booking_id for booking_id in request.booking_ids if booking_id not in records]
+    return StatusBatchResponse(
+        bookings=[status_response(records[booking_id]) for booking_id in request.booking_ids
+                  if booking_id in records],
+        not_found=[booking_id for booking_id in missing if not job_store.is_expired(booking_id)],
+        expired=[booking_id for booking_id in missing if job_store.is_expired(booking_id)]
+    )
+
+@app.get("/bookings", response_model=BookingListResponse)
+async def list_bookings(status: Optional[str] = None, since: Optional[datetime] = None,
+                        limit: int = Query(100, ge=1, le=500), cursor: Optional[str] = None):
+    """
+    List bookings, newest first, optionally filtered by status and creation time.
+    
+    Pass the next_cursor of a response as cursor to fetch the following page.
+    """
+    records = job_store.list_recent(limit=limit + 1, since=since.timestamp() if since else None,
+                                    status=status, before=cursor)
+    page = records[:limit]
+    return BookingListResponse(
+        bookings=[status_response(record) for record in page],
+        next_cursor=page[-1].booking_id if len(records) > limit else None
+    )
+
+def status_response(record: JobRecord) -> BookingResponse:
+    """Build the status response of a job record, with the queue position while it is waiting."""
+    position = booking_queue.position(record.booking_id) if record.status == "pending" else None
     
     return BookingResponse(
-        status=result["status"],
-        message=result["message"],
-        booking_id=booking_id,
-        details=result["details"]
+        status=record.status,
+        message=record.message,
+        booking_id=record.booking_id,
+        details=record.details(),
+        queue_position=position,
+        estimated_start_time=estimated_start_time(position)
     )
 
+@app.get("/status/{booking_id}/events")
+async def stream_booking_events(booking_id: str):
+    """
+    Stream the status transitions and agent steps of a booking as Server-Sent Events.
+    
+    The stream starts with the current status and ends after the booking has
+    completed or failed.
+    """
+    record = get_record_or_404(booking_id)
+    
+    async def events():
+        with event_bus.subscribe(booking_id) as queue:
+            # Read the record again now that no transition can be missed
+            current = job_store.get(booking_id) or record
+            last_sent = (current.status, current.message)
+            yield format_sse(status_event(current))
+            while last_sent[0] not in TERMINAL_STATUSES:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    # Jobs run by another API process publish no events here, so
+                    # re-read the store while idle to pick up their transitions
+                    current = job_store.get(booking_id)
+                    if current is not None and (current.status, current.message) != last_sent:
+                        last_sent = (current.status, current.message)
+                        yield format_sse(status_event(current))
+                    else:
+                        yield ": keep-alive\n\n"
+                    continue
+                yield format_sse(event)
+                if event["type"] == "status":
+                    last_sent = (event["status"], event["message"])
+    
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def status_event(record: JobRecord) -> dict:
+    """Build the status event published for a job record."""
+    return {
+        "type": "status",
+        "booking_id": record.booking_id,
+        "status": record.status,
+        "message": record.message,
+        "version": record.version,
+        "details": record.details()
+    }
+
+def update_job(booking_id: str, **fields):
+    """Update a job record and publish the new status to its subscribers."""
+    job_store.update(booking_id, **fields)
+    record = job_store.get(booking_id)
+    if record is not None:
+        event_bus.publish(booking_id, status_event(record))
+
 async def send_callback(callback_url: str, data: dict):
     """
-    Send booking results to the provided callback URL.
+    Queue booking results for delivery to the provided callback URL.
+    
+    The callback is stored in the outbox and delivered in the background, with
+    retries, so the caller does not wait for the receiver.
     
     Args:
         callback_url: The URL to send the callback to
@@ -122,35 +570,37 @@ async def send_callback(callback_url: str, data: dict):
     """
     if not callback_url:
         return
-        
+    
     try:
-        logging.info(f"Sending callback to {callback_url}")
-        async with aiohttp.ClientSession() as session:
-            async with session.post(callback_url, json=data) as response:
-                if response.status >= 400:
-                    logging.error(f"Callback to {callback_url} failed with status {response.status}")
-                else:
-                    logging.info(f"Callback to {callback_url} succeeded with status {response.status}")
+        await callback_outbox.enqueue(str(callback_url), data)
     except Exception as e:
-        logging.error(f"Error sending callback to {callback_url}: {str(e)}")
+        logging.error(f"Error queueing callback to {callback_url}: {str(e)}")
 
 async def process_booking(booking_id: str, **kwargs):
+    batch_id = kwargs.pop('batch_id', None)
+    coalesce_key = kwargs.pop('coalesce_key', None)
+    cache_key = kwargs.pop('cache_key', None)
     try:
         # Update status to processing
         test_mode = kwargs.get('test_mode', False)
         callback_url = kwargs.pop('callback_url', None)  # Remove callback_url so it's not passed to book_restaurant
         operation_type = "Restaurant information retrieval" if test_mode else "Booking"
         
-        booking_results[booking_id]["status"] = "processing"
-        booking_results[booking_id]["message"] = f"{operation_type} in progress..."
+        update_job(booking_id, status="processing", message=f"{operation_type} in progress...")
+        
+        # Publish the agent's progress to the event stream of this booking
+        def publish_step(step: dict):
+            event_bus.publish(booking_id, {"type": "step", "booking_id": booking_id, **step})
         
         # Call the actual booking function
-        result = await book_restaurant(**kwargs)
+        usage = LLMUsage()
+        result = await book_restaurant(**kwargs, browser_pool=browser_pool, usage=usage, on_step=publish_step)
         
         # Update with results
-        booking_results[booking_id]["status"] = "completed"
-        booking_results[booking_id]["message"] = f"{operation_type} completed"
-        booking_results[booking_id]["details"]["result"] = result
+        update_job(booking_id, status="completed", message=f"{operation_type} completed",
+                   result=result, usage=usage.as_dict())
+        if cache_key and result_cache is not None and is_cacheable(result):
+            result_cache.put(cache_key, result)
         
         # Send callback if URL was provided
         if callback_url:
@@ -158,14 +608,13 @@ async def process_booking(booking_id: str, **kwargs):
                 "status": "completed",
                 "message": f"{operation_type} completed",
                 "booking_id": booking_id,
-                "details": booking_results[booking_id]["details"]
+                "details": job_store.get(booking_id).details()
             }
             await send_callback(callback_url, callback_data)
         
     except Exception as e:
         # Handle errors
-        booking_results[booking_id]["status"] = "failed"
-        booking_results[booking_id]["message"] = f"Operation failed: {str(e)}"
+        update_job(booking_id, status="failed", message=f"Operation failed: {str(e)}")
         
         # Send error callback if URL was provided
         if callback_url:
@@ -173,9 +622,61 @@ async def process_booking(booking_id: str, **kwargs):
                 "status": "failed",
                 "message": f"Operation failed: {str(e)}",
                 "booking_id": booking_id,
-                "details": booking_results[booking_id]["details"]
+                "details": job_store.get(booking_id).details()
             }
             await send_callback(callback_url, callback_data)
+    
+    finally:
+        if cache_key and result_cache is not None:
+            result_cache.refresh_done(cache_key)
+        if coalesce_key:
+            await fan_out(booking_id, in_flight.finish(coalesce_key))
+        if batch_id:
+            await finish_batch(batch_id, booking_id)
+
+async def fan_out(booking_id: str, followers: List[str]):
+    """Copy the outcome of a booking to the identical bookings that waited for it."""
+    leader = job_store.get(booking_id)
+    if leader is None:
+        return
+    
+    for follower_id in followers:
+        update_job(follower_id, status=leader.status, message=leader.message, result=leader.result)
+        follower = job_store.get(follower_id)
+        if follower is not None and follower.request.get("callback_url"):
+            await send_callback(follower.request["callback_url"], {
+                "status": follower.status,
+                "message": follower.message,
+                "booking_id": follower_id,
+                "details": follower.details()
+            })
+
+async def finish_batch(batch_id: str, booking_id: str):
+    """Send the aggregated callback of a batch once its last booking has finished."""
+    batch = batch_tracker.finish(batch_id, booking_id)
+    if batch is None or not batch.callback_url:
+        return
+    
+    bookings = []
+    summary = {"completed": 0, "failed": 0}
+    for batch_booking_id in batch.booking_ids:
+        record = job_store.get(batch_booking_id)
+        status = record.status if record is not None else "expired"
+        summary[status] = summary.get(status, 0) + 1
+        bookings.append({
+            "booking_id": batch_booking_id,
+            "status": status,
+            "message": record.message if record is not None else "Booking ID expired",
+            "details": record.details() if record is not None else None
+        })
+    
+    await send_callback(batch.callback_url, {
+        "status": "completed",
+        "message": f"Batch finished: {summary['completed']} completed, {summary['failed']} failed",
+        "batch_id": batch_id,
+        "summary": summary,
+        "bookings": bookings
+    })
 
 if __name__ == "__main__":
     # Run the API server
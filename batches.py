@@ -0,0 +1,50 @@
+import time
+from typing import Dict, List, Optional
+
+
+class Batch:
+    """A group of bookings submitted together, reported with one callback when all have finished."""
+
+    __slots__ = ("batch_id", "booking_ids", "callback_url", "remaining", "created_at")
+
+    def __init__(self, batch_id: str, booking_ids: List[str], callback_url: Optional[str] = None):
+        self.batch_id = batch_id
+        self.booking_ids = booking_ids
+        self.callback_url = callback_url
+        self.remaining = set(booking_ids)
+        self.created_at = time.time()
+
+
+class BatchTracker:
+    """Tracks the unfinished bookings of every batch in progress."""
+
+    def __init__(self):
+        self._batches: Dict[str, Batch] = {}
+
+    def create(self, batch_id: str, booking_ids: List[str], callback_url: Optional[str] = None) -> Batch:
+        """Start tracking a batch of admitted bookings."""
+        batch = Batch(batch_id, booking_ids, callback_url)
+        self._batches[batch_id] = batch
+        return batch
+
+    def finish(self, batch_id: str, booking_id: str) -> Optional[Batch]:
+        """
+        Mark a booking of a batch as finished.
+
+        Returns:
+            Batch: The batch if this was its last unfinished booking, otherwise None
+        """
+        batch = self._batches.get(batch_id)
+        if batch is None:
+            return None
+        batch.remaining.discard(booking_id)
+        if batch.remaining:
+            return None
+        return self._batches.pop(batch_id)
+
+    def stats(self) -> dict:
+        """Return the number of batches and bookings in progress for monitoring."""
+        return {
+            "batches": len(self._batches),
+            "bookings": sum(len(batch.remaining) for batch in self._batches.values())
+        }
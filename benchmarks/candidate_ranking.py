@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Benchmark the vectorized restaurant candidate ranking.
+
+Scores synthetic candidates around Amsterdam with the NumPy ranker and with
+an equivalent per-row Python loop, and checks that both pick the same top-k.
+The candidates are stored in a temporary catalog; fetching their rows and
+building the candidate arrays from them happen once per booking and are
+reported separately from scoring.
+"""
+
+import os
+import sys
+import math
+import random
+import sqlite3
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog import RestaurantCatalog, distance_km, geohash_encode, restaurant_key
+from ranking import CandidateRanker, CandidateSet, RankingWeights
+
+CENTER = (52.3676, 4.9041)
+SIZES = (100, 1000, 5000)
+K = 5
+CUISINES = ["Italian", "French", "Dutch", "Japanese", "Indian", "Seafood", None]
+
+
+def synthetic_catalog(path, count, seed=42):
+    """Fill a catalog with restaurants around the centre; return random success rates of half of them."""
+    rng = random.Random(seed)
+    rows = []
+    for index in range(count):
+        latitude = CENTER[0] + rng.uniform(-0.02, 0.02)
+        longitude = CENTER[1] + rng.uniform(-0.03, 0.03)
+        rows.append((restaurant_key(f"Restaurant {index}", "Main"), f"Restaurant {index}", "Main",
+                     rng.choice([None, round(rng.uniform(3.0, 5.0), 1)]),
+                     rng.choice([None, "$", "$$", "$$$", "€€€€"]), rng.choice(CUISINES),
+                     latitude, longitude, geohash_encode(latitude, longitude)))
+    RestaurantCatalog(path)
+    with sqlite3.connect(path) as connection:
+        connection.executemany(
+            "INSERT INTO restaurants (key, name, address, rating, price_range, cuisine_type, latitude, longitude, "
+            "approximate, geohash, last_seen) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0, ?, 0)", rows
+        )
+    return {row[0]: rng.random() for row in rows if rng.random() < 0.5}
+
+
+def python_top_k(restaurants, k, weights, max_price_level, cuisine):
+    """Reference implementation scoring one row at a time."""
+    scores = []
+    for restaurant in restaurants:
+        rating = restaurant["rating"] if restaurant["rating"] is not None else 4.0
+        score = weights.rating * min(max((rating - 3.0) / 2.0, 0.0), 1.0)
+        distance = distance_km(*CENTER, restaurant["latitude"], restaurant["longitude"])
+        score += weights.distance * math.exp(-distance / weights.distance_scale_km)
+        score += weights.success * (restaurant["success_rate"] if restaurant["success_rate"] is not None else 0.5)
+        score += weights.popularity * (1.0 - 1.0 / (1.0 + restaurant["times_chosen"]))
+        level = sum(restaurant["price_range"].count(symbol) for symbol in "$€£¥") if restaurant["price_range"] else 0
+        score += weights.price * ((level <= max_price_level) if level else 0.5)
+        score += weights.cuisine * (cuisine.casefold() in (restaurant["cuisine_type"] or "").casefold())
+        scores.append(score)
+    return sorted(range(len(restaurants)), key=lambda index: -scores[index])[:k]
+
+
+def main():
+    weights = RankingWeights()
+    ranker = CandidateRanker(weights)
+    preferences = dict(max_price_level=2, cuisine="italian")
+
+    print(f"Top-{K} ranking time per call\n")
+    print(f"{'candidates':>10}{'fetch':>12}{'build':>12}{'numpy':>12}{'python':>12}{'speedup':>10}  same top-k")
+    for size in SIZES:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "catalog.db")
+            success_rates = synthetic_catalog(path, size)
+            catalog = RestaurantCatalog(path)
+            runs = 50
+            # The synthetic restaurants lie within about 2.3 km of the centre
+            fetch = timeit.timeit(lambda: catalog.nearby_rows(*CENTER, radius_km=3, limit=size), number=runs) / runs
+            columns, rows = catalog.nearby_rows(*CENTER, radius_km=3, limit=size)
+            build = timeit.timeit(lambda: CandidateSet(columns, rows), number=runs) / runs
+            candidates = CandidateSet(columns, rows)
+            candidates.set_success_rates(success_rates)
+            restaurants = [candidates.restaurant(index) for index in range(len(candidates))]
+            vectorized = timeit.timeit(lambda: ranker.top_k(candidates, K, *CENTER, **preferences), number=runs) / runs
+            loop = timeit.timeit(lambda: python_top_k(restaurants, K, weights, **preferences), number=5) / 5
+            same = list(ranker.top_k(candidates, K, *CENTER, **preferences)) == python_top_k(restaurants, K, weights,
+                                                                                              **preferences)
+        print(f"{len(candidates):>10}{fetch * 1e3:>10.3f}ms{build * 1e3:>10.3f}ms{vectorized * 1e3:>10.3f}ms"
+              f"{loop * 1e3:>10.3f}ms{loop / vectorized:>9.1f}x  {same}")
+
+
+if __name__ == "__main__":
+    main()
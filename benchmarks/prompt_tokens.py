@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Benchmark the prompt tokens sent on every agent step.
+
+Compares the original prompt, which embedded a hand-written JSON example of the
+output, with the current prompt, which uses the compact schema derived from
+the BookingResult models. Both the booking and the test-mode variants are
+measured. Tokens are counted with tiktoken when it is installed, otherwise
+estimated at four characters per token.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from prompts import BOOKING_INSTRUCTIONS, START_URL, TEST_MODE_INSTRUCTIONS, build_booking_prompt
+
+JOB = dict(city="Amsterdam", date="2025-05-23", time="18:00", party_size=2, purpose="dinner",
+           latitude=52.3676, longitude=4.9041, first_name="Jane", last_name="Doe",
+           email="jane@example.com", phone_number="+31612345678",
+           booking_description="Window seat preferred", restaurant_name=None)
+
+# The prompt as it was built before the output schema was derived from the models
+LEGACY_BOOKING_STEPS = [
+    "1. Go to " + START_URL + " in the browser.",
+    "2. Consent any cookie consent popups or similar dialogs that may appear.",
+    "3. Make sure the rating filter is set to 4.5 to find top restaurants for {purpose} in the city '{city}' on the map.",
+    "4. From the resulting restaurant list, select a popular restaurant that seems suitable for {purpose} and click reserve a table.",
+    "5. Go to the 'Reserve a table' or something similar section and verify that the booking is free (no prepayment or credit card required).",
+    "6. If it is not free or no reservation, go back to the results and repeat step 4 with another random restaurant.",
+    "7. set the date to '{date}', the time to '{time}', and the number of people to {party_size}.",
+    "8. If the restaurant is fully booked, go back to the results and repeat step 4 with another random restaurant.",
+    "9. Fill in the contact information form if required with First name: '{first_name}', Last name: '{last_name}', Email: '{email}', and Phone number: '{phone_number}'.",
+    "10. If a special request field or booking description field is available, enter: '{booking_description}'.",
+    "11. Proceed to confirm the booking and wait for the booking confirmation to appear.",
+    "12. Capture the confirmation details or booking reference.",
+    "13. Format the output as a JSON object with the following structure:",
+    '''   {{
+             "restaurant": {{
+               "name": "Restaurant Name",
+               "address": "Restaurant Address",
+               "phone_number": "Restaurant Phone Number",
+               "rating": 4.5,
+               "price_range": "$$$",
+               "cuisine_type": "Cuisine Type",
+               "popular_dishes": ["Dish 1", "Dish 2"],
+               "opening_hours": "Opening Hours"
+             }},
+             "booking": {{
+               "confirmation_number": "Confirmation reference if available",
+               "date": "{date}",
+               "time": "{time}",
+               "party_size": {party_size},
+               "first_name": "{first_name}",
+               "last_name": "{last_name}",
+               "special_requests": "{booking_description}",
+               "status": "confirmed"
+             }},
+             "additional_notes": "Any additional relevant information"
+           }}'''
+]
+
+LEGACY_TEST_MODE_STEPS = [
+    "1. Go to " + START_URL + " in the browser.",
+    "2. Consent any cookie consent popups or similar dialogs that may appear.",
+    "3. Make sure the rating filter is set to 4.5 to find top restaurants for {purpose} in the city '{city}' on the map.",
+    "4. From the resulting restaurant list, select a popular restaurant that seems suitable for {purpose}.",
+    "5. Collect and return detailed information about the selected restaurant including:",
+    "   - Restaurant name",
+    "   - Address",
+    "   - Phone number (if available)",
+    "   - Rating",
+    "   - Price range",
+    "   - Popular dishes or menu highlights (if available)",
+    "   - Opening hours for the requested date",
+    "6. Format the output as a JSON object with the following structure:",
+    '''   {{
+                 "restaurant": {{
+                   "name": "Restaurant Name",
+                   "address": "Restaurant Address",
+                   "phone_number": "Restaurant Phone Number",
+                   "rating": 4.5,
+                   "price_range": "$$$",
+                   "cuisine_type": "Cuisine Type",
+                   "popular_dishes": ["Dish 1", "Dish 2"],
+                   "opening_hours": "Opening Hours"
+                 }},
+                 "additional_notes": "Any additional information"
+               }}''',
+    "7. STOP HERE - TEST MODE ACTIVE. Do not proceed with the booking process."
+]
+
+
+def token_counter():
+    """Return a function counting tokens, and the name of the method used."""
+    try:
+        import tiktoken
+        encoding = tiktoken.get_encoding("o200k_base")
+        return (lambda text: len(encoding.encode(text))), "tiktoken o200k_base"
+    except ImportError:
+        return (lambda text: len(text) // 4), "estimate (4 characters per token)"
+
+
+def legacy_prompt(steps):
+    return "\n".join(step.format(**JOB) for step in steps)
+
+
+def current_prompt(test_mode):
+    instructions, task = build_booking_prompt(test_mode=test_mode, **JOB)
+    return instructions + "\n" + task
+
+
+def current_output_section(instructions, start, end=None):
+    """Cut the output format step out of the current instructions."""
+    section = instructions[instructions.index(start):]
+    return section[:section.index(end)] if end else section
+
+
+def main():
+    count, method = token_counter()
+    variants = (
+        ("booking", LEGACY_BOOKING_STEPS, False, LEGACY_BOOKING_STEPS[12:],
+         current_output_section(BOOKING_INSTRUCTIONS, "11. ")),
+        ("test mode", LEGACY_TEST_MODE_STEPS, True, LEGACY_TEST_MODE_STEPS[12:14],
+         current_output_section(TEST_MODE_INSTRUCTIONS, "6. ", "7. "))
+    )
+
+    print(f"Prompt tokens per agent step, counted with {method}\n")
+    print(f"{'variant':<12}{'part':<16}{'legacy':>8}{'current':>9}{'saved':>8}{'reduction':>11}")
+    for variant, steps, test_mode, legacy_section, current_section in variants:
+        rows = (
+            ("output format", count(legacy_prompt(legacy_section)), count(current_section)),
+            ("whole prompt", count(legacy_prompt(steps)), count(current_prompt(test_mode)))
+        )
+        for part, legacy, current in rows:
+            saved = legacy - current
+            print(f"{variant:<12}{part:<16}{legacy:>8}{current:>9}{saved:>8}{saved / legacy:>10.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,24 @@
 import os
 import argparse
 from datetime import datetime, timedelta
-from langchain_openai import ChatOpenAI
-from langchain_anthropic import ChatAnthropic
 from browser_use import Agent, Browser, BrowserConfig, Controller
 import asyncio
 from dotenv import load_dotenv
 import warnings
 import random
-from geopy.geocoders import Nominatim
-from geopy.exc import GeocoderTimedOut, GeocoderUnavailable
+import numpy as np
 from typing import List, Optional, Dict, Any
-from pydantic import BaseModel
+from models import RestaurantDetails, BookingDetails, BookingResult, ProbeResult
+from geocoding import get_coordinates
+from gazetteer import lookup_city
+from llm_registry import get_llm
+from llm_usage import LLMUsage, current_usage
+from prompts import build_booking_prompt, build_probe_prompt
+from probing import first_passing
+from catalog import get_catalog, restaurant_key, distance_km, is_trusted_page
+from opening_hours import OpeningHours
+from outcomes import get_outcome_log
+from ranking import CandidateSet, rank_restaurants
 
 # Load environment variables from .env file
 load_dotenv()
@@ -19,31 +26,11 @@ load_dotenv()
 # Suppress warnings
 warnings.filterwarnings("ignore")
 
-# Define the output format as Pydantic models
-class RestaurantDetails(BaseModel):
-    name: str
-    address: str
-    phone_number: Optional[str] = None
-    rating: Optional[float] = None
-    price_range: Optional[str] = None
-    cuisine_type: Optional[str] = None
-    popular_dishes: Optional[List[str]] = None
-    opening_hours: Optional[str] = None
+# Known restaurants of the requested name farther than this from the search location are ignored
+NAMED_RESTAURANT_RADIUS_KM = 25
 
-class BookingDetails(BaseModel):
-    confirmation_number: Optional[str] = None
-    date: str
-    time: str
-    party_size: int
-    first_name: Optional[str] = None
-    last_name: Optional[str] = None
-    special_requests: Optional[str] = None
-    status: str = "confirmed"
-
-class BookingResult(BaseModel):
-    restaurant: RestaurantDetails
-    booking: Optional[BookingDetails] = None
-    additional_notes: Optional[str] = None
+class RestaurantClosedError(Exception):
+    """Raised when every known restaurant that could serve a booking is closed at the requested time."""
 
 def parse_arguments():
     """Parse command line arguments for the restaurant booking."""
@@ -67,13 +54,40 @@ def parse_arguments():
     parser.add_argument("--booking-description", help="Additional description or special requests for the booking")
     parser.add_argument("--latitude", type=float, help="Latitude coordinate for the search location")
     parser.add_argument("--longitude", type=float, help="Longitude coordinate for the search location")
+    parser.add_argument("--max-price-level", type=int, help="Preferred highest price level, e.g. 2 for $$")
+    parser.add_argument("--cuisine", help="Preferred cuisine, e.g. italian")
     
     return parser.parse_args()
 
+def describe_candidate(restaurant):
+    """Describe a catalog restaurant in one line for the agent's task."""
+    description = f"{restaurant['name']}, {restaurant['address']}"
+    if restaurant.get("rating"):
+        description += f" (rating {restaurant['rating']})"
+    if is_trusted_page(restaurant.get("maps_url")):
+        description += f" - {restaurant['maps_url']}"
+    return description
+
+def start_page(restaurant):
+    """Return the known reservation page (or else Maps page) of a catalog restaurant, if any."""
+    for url in (restaurant.get("reservation_url"), restaurant.get("maps_url")):
+        if is_trusted_page(url):
+            return url
+    return None
+
+def open_at(opening_intervals, date, time):
+    """Tell whether a catalog restaurant with these stored hours is open at a date and time, or None if unknown."""
+    try:
+        opening_hours = OpeningHours.from_json(opening_intervals)
+        return opening_hours.is_open_at(date, time) if opening_hours else None
+    except ValueError:
+        return None
+
 async def book_restaurant(*, city="Amsterdam", date=None, time="18:00",
                     party_size=2, purpose="dinner", model="gpt-4.1", test_mode=False,
                     first_name=None, last_name=None, email=None, phone_number=None,
-                    booking_description=None, restaurant_name=None, latitude=None, longitude=None):
+                    booking_description=None, restaurant_name=None, latitude=None, longitude=None,
+                    max_price_level=None, cuisine=None, browser_pool=None, usage=None, on_step=None):
     """Book a restaurant.
     
     Args:
@@ -92,183 +106,298 @@ async def book_restaurant(*, city="Amsterdam", date=None, time="18:00",
         restaurant_name (str, optional): Specific restaurant name to search for
         latitude (float, optional): Latitude coordinate for the search location
         longitude (float, optional): Longitude coordinate for the search location
+        max_price_level (int, optional): Preferred highest price level (number of currency symbols),
+            used to rank known restaurants
+        cuisine (str, optional): Preferred cuisine, used to rank known restaurants
+        browser_pool (BrowserPool, optional): Shared pool of warm browsers; when omitted a
+            dedicated browser is launched for this call and closed afterwards
+        usage (LLMUsage, optional): Collects the token usage and prompt cache hits of this job
+        on_step (callable, optional): Called with a dict describing each agent step (step number,
+            page URL, evaluation of the previous goal, next goal and actions) as it completes
     
     Returns:
         str: JSON-formatted BookingResult containing restaurant details and booking information (if not in test mode)
     """
     
-    # Initialize browser - use environment variable for headless mode if available
-    headless = os.environ.get('BROWSER_HEADLESS', 'false').lower() == 'true'
-    browser_config = BrowserConfig(headless=headless)
-    browser = Browser(config=browser_config)
+    # Reuse the process-wide client for the requested model
+    llm = get_llm(model)
     
-    # Select LLM based on provided model parameter
-    if model.startswith("gpt"):
-        llm = ChatOpenAI(model=model)
-    else:
-        llm = ChatAnthropic(model_name=model)
+    # Attribute the token usage of the shared client to this job
+    usage = usage if usage is not None else LLMUsage()
+    current_usage.set(usage)
     
-    # Add geocoding functionality to convert city name to coordinates
-
-    def get_coordinates(city_name):
-        """
-        Get latitude and longitude coordinates for a given city name.
-        
-        Args:
-            city_name (str): Name of the city
-            
-        Returns:
-            tuple: (latitude, longitude) or (None, None) if not found
-        """
-        try:
-            # Initialize Nominatim geocoder with a user agent
-            geolocator = Nominatim(user_agent="restaurant-booking-app")
-            
-            # Get location information
-            location = geolocator.geocode(city_name)
-            
-            if location:
-                return (location.latitude, location.longitude)
-            else:
-                print(f"Could not find coordinates for {city_name}")
-                return (None, None)
-        except (GeocoderTimedOut, GeocoderUnavailable) as e:
-            print(f"Geocoding error: {e}")
-            return (None, None)
-
     # Use provided coordinates if available, otherwise geocode the city
     if latitude is not None and longitude is not None:
         print(f"Using provided coordinates: {latitude}, {longitude}")
     else:
-        # Get coordinates for the specified city
-        latitude, longitude = get_coordinates(city)
+        # Resolve well-known cities offline and only geocode remotely on a miss
+        coordinates = lookup_city(city)
+        if coordinates is not None:
+            latitude, longitude = coordinates
+        else:
+            latitude, longitude = await get_coordinates(city)
 
         # If coordinates are not found, use default Amsterdam coordinates
         if latitude is None or longitude is None:
             print(f"Using default coordinates for Amsterdam")
             latitude, longitude = 52.373992, 4.8858433
 
-    # Define the booking steps
-    steps = [
-        "1. Go to https://www.google.com/maps/search/restaurants/@{latitude},{longitude},14z/data=!3m1!4b1!4m4!2m3!5m1!4e9!6e5 in the browser.",
-        "2. Consent any cookie consent popups or similar dialogs that may appear.",
-        "3. Make sure the rating filter is set to 4.5 to find top restaurants for {purpose} in the city '{city}' on the map."
-    ]
+    # Build the prompt: static instructions go into the system message so every
+    # job shares a cacheable prefix, and the job parameters form the task
+    test_mode = test_mode or os.environ.get('TEST_MODE', 'false').lower() == 'true'
+    catalog_enabled = os.environ.get('RESTAURANT_CATALOG_ENABLED', 'true').lower() == 'true'
     
-    # If restaurant name is provided, add a step to search for it specifically
-    if restaurant_name:
-        steps.append(f"4. Search for '{restaurant_name}' in the search bar and select it from the results.")
-    else:
-        steps.append("4. From the resulting restaurant list, select a popular restaurant that seems suitable for {purpose} and click reserve a table.")
+    deep_links_enabled = os.environ.get('DEEP_LINKS_ENABLED', 'true').lower() == 'true'
     
-    # Continue with the rest of the steps
-    steps.extend([
-        "5. Go to the 'Reserve a table' or something similar section and verify that the booking is free (no prepayment or credit card required).",
-        "6. If it is not free or no reservation, go back to the results and repeat step 4 with another random restaurant.",
-        "7. set the date to '{date}', the time to '{time}', and the number of people to {party_size}.",
-        "8. If the restaurant is fully booked, go back to the results and repeat step 4 with another random restaurant.",
-        "9. Fill in the contact information form if required with First name: '{first_name}', Last name: '{last_name}', Email: '{email}', and Phone number: '{phone_number}'.",
-        "10. If a special request field or booking description field is available, enter: '{booking_description}'.",
-        "11. Proceed to confirm the booking and wait for the booking confirmation to appear.",
-        "12. Capture the confirmation details or booking reference.",
-        "13. Format the output as a JSON object with the following structure:",
-        '''   {{
-             "restaurant": {{
-               "name": "Restaurant Name",
-               "address": "Restaurant Address",
-               "phone_number": "Restaurant Phone Number",
-               "rating": 4.5,
-               "price_range": "$$$",
-               "cuisine_type": "Cuisine Type",
-               "popular_dishes": ["Dish 1", "Dish 2"],
-               "opening_hours": "Opening Hours"
-             }},
-             "booking": {{
-               "confirmation_number": "Confirmation reference if available",
-               "date": "{date}",
-               "time": "{time}",
-               "party_size": {party_size},
-               "first_name": "{first_name}",
-               "last_name": "{last_name}",
-               "special_requests": "{booking_description}",
-               "status": "confirmed"
-             }},
-             "additional_notes": "Any additional relevant information"
-           }}'''
-    ])
+    # Reject a named restaurant that is known to be closed at the requested time
+    known_restaurant = None
+    if catalog_enabled and not test_mode and restaurant_name:
+        try:
+            named = await asyncio.to_thread(get_catalog().named, restaurant_name)
+        except Exception as e:
+            print(f"Could not look up {restaurant_name} in the catalog: {e}")
+            named = []
+        known = [restaurant for restaurant in named
+                 if distance_km(latitude, longitude, restaurant["latitude"], restaurant["longitude"])
+                 <= NAMED_RESTAURANT_RADIUS_KM]
+        if date and known and all(open_at(restaurant.get("opening_intervals"), date, time) is False for restaurant in known):
+            raise RestaurantClosedError(f"{restaurant_name} is closed on {date} at {time}")
+        # Open the page of the closest known restaurant of that name directly
+        known.sort(key=lambda restaurant: distance_km(latitude, longitude, restaurant["latitude"], restaurant["longitude"]))
+        known_restaurant = next((restaurant for restaurant in known if start_page(restaurant)), None)
     
-    # Modify the steps for test mode
-    if test_mode or os.environ.get('TEST_MODE', 'false').lower() == 'true':
-        steps = [
-            "1. Go to https://www.google.com/maps/search/restaurants/@{latitude},{longitude},14z/data=!3m1!4b1!4m4!2m3!5m1!4e9!6e5 in the browser.",
-            "2. Consent any cookie consent popups or similar dialogs that may appear.",
-            "3. Make sure the rating filter is set to 4.5 to find top restaurants for {purpose} in the city '{city}' on the map.",
-            "4. From the resulting restaurant list, select a popular restaurant that seems suitable for {purpose}.",
-            "5. Collect and return detailed information about the selected restaurant including:",
-            "   - Restaurant name",
-            "   - Address",
-            "   - Phone number (if available)",
-            "   - Rating",
-            "   - Price range",
-            "   - Popular dishes or menu highlights (if available)",
-            "   - Opening hours for the requested date",
-            "6. Format the output as a JSON object with the following structure:",
-            '''   {{
-                 "restaurant": {{
-                   "name": "Restaurant Name",
-                   "address": "Restaurant Address",
-                   "phone_number": "Restaurant Phone Number",
-                   "rating": 4.5,
-                   "price_range": "$$$",
-                   "cuisine_type": "Cuisine Type",
-                   "popular_dishes": ["Dish 1", "Dish 2"],
-                   "opening_hours": "Opening Hours"
-                 }},
-                 "additional_notes": "Any additional information"
-               }}''',
-            "7. STOP HERE - TEST MODE ACTIVE. Do not proceed with the booking process."
-        ]
+    # Point the agent at the best known restaurants nearby instead of browsing the result list
+    ranked = []
+    if catalog_enabled and not test_mode and not restaurant_name:
+        radius_km = float(os.environ.get('CATALOG_SEARCH_RADIUS_KM', '2'))
+        try:
+            columns, rows = await asyncio.to_thread(
+                get_catalog().nearby_rows, latitude, longitude,
+                radius_km=radius_km,
+                purpose=purpose,
+                limit=int(os.environ.get('CATALOG_RANKING_POOL', '1000'))
+            )
+        except Exception as e:
+            print(f"Could not look up known restaurants nearby: {e}")
+            columns, rows = [], []
+        nearby = CandidateSet(columns, rows).within(latitude, longitude, radius_km)
+        # Drop restaurants known to be closed at the requested time before any browser work
+        if len(nearby) and date:
+            closed = np.fromiter((open_at(intervals, date, time) is False
+                                  for intervals in nearby.column("opening_intervals")), bool, len(nearby))
+            if closed.all() and len(nearby) >= int(os.environ.get('OPENING_HOURS_REJECT_MIN_KNOWN', '5')):
+                raise RestaurantClosedError(f"All {len(nearby)} known restaurants nearby are closed on {date} at {time}")
+            if closed.any():
+                print(f"Skipping {closed.sum()} known restaurants that are closed at the requested time")
+                nearby = nearby.select(~closed)
+        # Skip restaurants known to be fully booked for this slot or to ask for prepayment
+        if len(nearby) and date:
+            try:
+                dead_ends = await asyncio.to_thread(
+                    get_catalog().unavailable, nearby.keys.tolist(), date, time, party_size
+                )
+            except Exception as e:
+                print(f"Could not look up known dead ends: {e}")
+                dead_ends = {}
+            if dead_ends:
+                print(f"Skipping {len(dead_ends)} known dead ends from the catalog")
+                nearby = nearby.select(~np.isin(nearby.keys, list(dead_ends)))
+        # Rank by how often each restaurant took a free reservation for slots like this one
+        if len(nearby) and date:
+            try:
+                success_rates = await asyncio.to_thread(
+                    get_outcome_log().success_rates, nearby.keys.tolist(), date, time, party_size
+                )
+            except Exception as e:
+                print(f"Could not look up booking success rates: {e}")
+                success_rates = {}
+            nearby.set_success_rates(success_rates)
+        ranked = rank_restaurants(nearby, latitude, longitude, k=int(os.environ.get('CATALOG_MAX_CANDIDATES', '3')),
+                                  max_price_level=max_price_level, cuisine=cuisine)
+        if ranked:
+            print(f"Known candidates from the catalog: {[describe_candidate(restaurant) for restaurant in ranked]}")
     
-    # Format each step with the user's parameters
-    formatted_steps = [step.format(
-        city=city,
-        date=date,
-        time=time,
-        party_size=party_size,
-        purpose=purpose,
-        latitude=latitude,
-        longitude=longitude,
-        first_name=first_name or "N/A",
-        last_name=last_name or "N/A",
-        email=email or "N/A",
-        phone_number=phone_number or "N/A",
-        booking_description=booking_description or "No special requests",
-        restaurant_name=restaurant_name or "N/A"
-    ) for step in steps]
+    def build_prompt(restaurant_name=restaurant_name, candidates=ranked, restaurant_page=None):
+        return build_booking_prompt(
+            test_mode=test_mode,
+            city=city,
+            date=date,
+            time=time,
+            party_size=party_size,
+            purpose=purpose,
+            latitude=latitude,
+            longitude=longitude,
+            first_name=first_name,
+            last_name=last_name,
+            email=email,
+            phone_number=phone_number,
+            booking_description=booking_description,
+            restaurant_name=restaurant_name,
+            candidates=[describe_candidate(restaurant) for restaurant in candidates],
+            restaurant_page=restaurant_page
+        )
     
-    # Define the restaurant booking task
-    booking_task = "\n".join(formatted_steps)
+    def initial_actions(page):
+        """Open a known restaurant page before the first agent step, skipping the Maps search."""
+        return [{"go_to_url": {"url": page}}] if page else None
     
     # Initialize controller with output model
     controller = Controller(output_model=BookingResult)
+    probe_controller = Controller(output_model=ProbeResult)
     
-    # Initialize and run the agent
-    agent = Agent(
-        task=booking_task,
-        llm=llm,
-        browser=browser,
-        controller=controller,
-        enable_memory=True
-    )
+    async def record_outcome(name, address, success):
+        """Count whether a restaurant took a free reservation for this slot."""
+        if not (catalog_enabled and address and date):
+            return
+        try:
+            await asyncio.to_thread(get_outcome_log().record, restaurant_key(name, address), date, time,
+                                    party_size, success)
+        except Exception as e:
+            print(f"Could not record the booking outcome of {name}: {e}")
     
-    try:
+    async def remember_dead_end(name, address, reason, requires_prepayment=False):
+        """Record in the catalog that a restaurant could not be booked for this slot."""
+        if not (catalog_enabled and address and date):
+            return
+        await record_outcome(name, address, success=False)
+        try:
+            await asyncio.to_thread(get_catalog().mark_unavailable, name, address, date, time, party_size,
+                                    reason, requires_prepayment)
+        except Exception as e:
+            print(f"Could not remember that {name} is unavailable: {e}")
+    
+    def report_step(state, model_output, step):
+        """Pass a summary of an agent step to the on_step callback."""
+        on_step({
+            "step": step,
+            "url": state.url,
+            "evaluation_previous_goal": model_output.current_state.evaluation_previous_goal,
+            "next_goal": model_output.current_state.next_goal,
+            "actions": [name for action in model_output.action
+                        for name in action.model_dump(exclude_unset=True)]
+        })
+    
+    async def run_agent(browser, browser_context=None, restaurant=None, candidates=ranked):
+        """Run the booking agent on the given browser (and context, if provided).
+        
+        When a catalog restaurant is given, it is booked by name, starting on its known page.
+        """
+        target = restaurant or known_restaurant
+        page = start_page(target) if target and deep_links_enabled else None
+        instructions, booking_task = build_prompt(
+            describe_candidate(restaurant) if restaurant else restaurant_name, candidates, page
+        )
+        agent = Agent(
+            task=booking_task,
+            extend_system_message=instructions,
+            llm=llm,
+            browser=browser,
+            browser_context=browser_context,
+            controller=controller,
+            register_new_step_callback=report_step if on_step else None,
+            enable_memory=True,
+            initial_actions=initial_actions(page)
+        )
         history = await agent.run()
+        print(f"LLM usage: {usage.as_dict()}")
         result = history.final_result()
         if result:
-            # Parse the result as a BookingResult
+            # Remember the restaurant for later searches around the same place
+            if catalog_enabled:
+                try:
+                    await asyncio.to_thread(get_catalog().record, result, latitude, longitude, purpose, date)
+                except Exception as e:
+                    print(f"Could not add the restaurant to the catalog: {e}")
+            # Remember the restaurants the agent had to skip, and the one that took the booking
+            try:
+                booking_result = BookingResult.model_validate_json(result)
+            except ValueError:
+                booking_result = None
+            # A probe winner's success was already counted by its probe
+            if booking_result is not None and booking_result.booking is not None \
+                    and booking_result.booking.status == "confirmed" and not test_mode \
+                    and (restaurant is None or restaurant["key"]
+                         != restaurant_key(booking_result.restaurant.name, booking_result.restaurant.address)):
+                await record_outcome(booking_result.restaurant.name, booking_result.restaurant.address, success=True)
+            skipped = (booking_result.skipped_restaurants or []) if booking_result is not None else []
+            for restaurant in skipped:
+                await remember_dead_end(restaurant.name, restaurant.address, restaurant.reason,
+                                        requires_prepayment=restaurant.reason == "requires_prepayment")
             return result
         else:
             return '{"error": "No result returned from agent"}'
+    
+    async def probe(browser, candidate):
+        """Check in a separate context whether a candidate can be booked for free."""
+        page = start_page(candidate) if deep_links_enabled else None
+        probe_instructions, probe_task = build_probe_prompt(
+            restaurant=describe_candidate(candidate), date=date, time=time, party_size=party_size,
+            latitude=latitude, longitude=longitude, restaurant_page=page
+        )
+        probe_context = await browser.new_context()
+        try:
+            agent = Agent(
+                task=probe_task,
+                extend_system_message=probe_instructions,
+                llm=llm,
+                browser=browser,
+                browser_context=probe_context,
+                controller=probe_controller,
+                initial_actions=initial_actions(page)
+            )
+            history = await agent.run(max_steps=int(os.environ.get('PROBE_MAX_STEPS', '15')))
+            result = history.final_result()
+            return ProbeResult.model_validate_json(result) if result else None
+        finally:
+            await probe_context.close()
+    
+    async def run_booking(browser, browser_context=None):
+        """Probe the known candidates in parallel, then book the first one that is available."""
+        probe_enabled = os.environ.get('PROBE_ENABLED', 'true').lower() == 'true'
+        probe_count = int(os.environ.get('PROBE_CANDIDATES', '3'))
+        if not probe_enabled or len(ranked) < 2 or probe_count < 2:
+            return await run_agent(browser, browser_context)
+        
+        winner, outcomes = await first_passing(
+            ranked[:probe_count],
+            lambda candidate: probe(browser, candidate),
+            passed=lambda result: result.available,
+            concurrency=int(os.environ.get('PROBE_CONCURRENCY', '2'))
+        )
+        for candidate, result in outcomes:
+            print(f"Probe of {candidate['name']}: {result}")
+            if result is not None and result.available:
+                await record_outcome(candidate["name"], candidate["address"], success=True)
+            elif result is not None and (result.requires_prepayment or result.fully_booked):
+                # Other failed probes may just not have loaded the page, so they are not remembered
+                reason = "requires_prepayment" if result.requires_prepayment else "fully_booked"
+                await remember_dead_end(candidate["name"], candidate["address"], reason,
+                                        requires_prepayment=result.requires_prepayment)
+        if winner is not None:
+            print(f"Booking {winner['name']}, the first candidate that passed its probe")
+            return await run_agent(browser, browser_context, restaurant=winner)
+        
+        # No probed candidate can be booked; let the agent browse the results instead
+        probed = {candidate["key"] for candidate, _ in outcomes}
+        return await run_agent(browser, browser_context,
+                               candidates=[candidate for candidate in ranked if candidate["key"] not in probed])
+
+    # Reuse a warm browser from the pool when one is available
+    if browser_pool is not None:
+        async with browser_pool.acquire() as browser:
+            browser_context = await browser.new_context()
+            try:
+                return await run_booking(browser, browser_context)
+            finally:
+                await browser_context.close()
+
+    # Initialize browser - use environment variable for headless mode if available
+    headless = os.environ.get('BROWSER_HEADLESS', 'false').lower() == 'true'
+    browser_config = BrowserConfig(headless=headless)
+    browser = Browser(config=browser_config)
+    
+    try:
+        return await run_booking(browser)
     finally:
         # Ensure browser is closed even if an error occurs
         await browser.close()
@@ -323,7 +452,9 @@ async def main():
         email=args.email,
         phone_number=args.phone_number,
         booking_description=args.booking_description,
-        restaurant_name=args.restaurant_name
+        restaurant_name=args.restaurant_name,
+        max_price_level=args.max_price_level,
+        cuisine=args.cuisine
     )
     
     if test_mode:
@@ -0,0 +1,200 @@
+import os
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import List
+from browser_use import Browser, BrowserConfig
+
+logger = logging.getLogger(__name__)
+
+
+class PooledBrowser:
+    """A warm Chromium instance managed by the BrowserPool."""
+
+    __slots__ = ("browser", "jobs_served", "in_use")
+
+    def __init__(self, browser: Browser):
+        self.browser = browser
+        self.jobs_served = 0
+        self.in_use = False
+
+    def is_healthy(self) -> bool:
+        """Check that the underlying Playwright browser is still connected."""
+        playwright_browser = self.browser.playwright_browser
+        return playwright_browser is not None and playwright_browser.is_connected()
+
+
+class BrowserPool:
+    """
+    Process-wide pool of warm browsers.
+
+    Each job leases one browser exclusively and works in its own isolated browser
+    context, so cookies and storage never leak between bookings. Browsers are
+    launched ahead of time (up to min_size), health-checked on every lease and
+    recycled after max_jobs_per_browser jobs to keep Chromium memory in check.
+    """
+
+    def __init__(self, min_size: int = 1, max_size: int = 4, max_jobs_per_browser: int = 20,
+                 headless: bool = True):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Browser pool requires 0 <= min_size <= max_size and max_size >= 1")
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_jobs_per_browser = max_jobs_per_browser
+        self.headless = headless
+        self._browsers: List[PooledBrowser] = []
+        self._launching = 0
+        self._condition = asyncio.Condition()
+        self._closed = False
+
+    @classmethod
+    def from_env(cls) -> "BrowserPool":
+        """Create a pool configured from BROWSER_POOL_* environment variables."""
+        return cls(
+            min_size=int(os.environ.get('BROWSER_POOL_MIN_SIZE', '1')),
+            max_size=int(os.environ.get('BROWSER_POOL_MAX_SIZE', '4')),
+            max_jobs_per_browser=int(os.environ.get('BROWSER_POOL_MAX_JOBS', '20')),
+            headless=os.environ.get('BROWSER_HEADLESS', 'false').lower() == 'true'
+        )
+
+    async def _launch(self) -> PooledBrowser:
+        """Start a new Chromium instance and wait until it is ready."""
+        browser = Browser(config=BrowserConfig(headless=self.headless))
+        try:
+            await browser.get_playwright_browser()
+        except Exception:
+            await browser.close()
+            raise
+        return PooledBrowser(browser)
+
+    async def _discard(self, pooled: PooledBrowser):
+        """Close a browser that is unhealthy or has served enough jobs."""
+        try:
+            await pooled.browser.close()
+        except Exception as e:
+            logger.warning(f"Error closing pooled browser: {e}")
+
+    async def start(self):
+        """Warm up the pool by launching min_size browsers."""
+        launched = await asyncio.gather(
+            *(self._launch() for _ in range(self.min_size)),
+            return_exceptions=True
+        )
+        async with self._condition:
+            for pooled in launched:
+                if isinstance(pooled, Exception):
+                    logger.error(f"Failed to pre-launch browser: {pooled}")
+                else:
+                    self._browsers.append(pooled)
+            self._condition.notify_all()
+        logger.info(f"Browser pool started with {len(self._browsers)} warm browser(s)")
+
+    async def _checkout(self) -> PooledBrowser:
+        """Take an idle healthy browser, launching a new one if the pool has room."""
+        async with self._condition:
+            while True:
+                if self._closed:
+                    raise RuntimeError("Browser pool is closed")
+
+                stale = []
+                for pooled in self._browsers:
+                    if pooled.in_use:
+                        continue
+                    if pooled.is_healthy():
+                        pooled.in_use = True
+                        break
+                    stale.append(pooled)
+                else:
+                    pooled = None
+
+                for dead in stale:
+                    self._browsers.remove(dead)
+                    asyncio.create_task(self._discard(dead))
+
+                if pooled is not None:
+                    return pooled
+
+                if len(self._browsers) + self._launching < self.max_size:
+                    self._launching += 1
+                    break
+
+                await self._condition.wait()
+
+        pooled = None
+        try:
+            pooled = await self._launch()
+            pooled.in_use = True
+        finally:
+            # Add the browser in the same critical section that releases its launch
+            # slot, so no other checkout sees room for one browser too many
+            async with self._condition:
+                self._launching -= 1
+                if pooled is not None:
+                    self._browsers.append(pooled)
+                self._condition.notify_all()
+        return pooled
+
+    async def _checkin(self, pooled: PooledBrowser):
+        """Return a browser to the pool, recycling it when it has served enough jobs."""
+        pooled.jobs_served += 1
+        recycle = (self._closed
+                   or pooled.jobs_served >= self.max_jobs_per_browser
+                   or not pooled.is_healthy())
+
+        async with self._condition:
+            pooled.in_use = False
+            if recycle and pooled in self._browsers:
+                self._browsers.remove(pooled)
+            self._condition.notify_all()
+
+        if recycle:
+            await self._discard(pooled)
+            if not self._closed and len(self._browsers) + self._launching < self.min_size:
+                asyncio.create_task(self._replenish())
+
+    async def _replenish(self):
+        """Launch a replacement browser so the pool stays at min_size."""
+        async with self._condition:
+            if len(self._browsers) + self._launching >= self.min_size:
+                return
+            self._launching += 1
+        pooled = None
+        try:
+            pooled = await self._launch()
+        except Exception as e:
+            logger.error(f"Failed to replenish browser pool: {e}")
+        finally:
+            async with self._condition:
+                self._launching -= 1
+                if pooled is not None:
+                    self._browsers.append(pooled)
+                self._condition.notify_all()
+
+    @asynccontextmanager
+    async def acquire(self):
+        """Lease a warm browser for the duration of one job."""
+        pooled = await self._checkout()
+        try:
+            yield pooled.browser
+        finally:
+            await self._checkin(pooled)
+
+    def stats(self) -> dict:
+        """Return the current pool utilization for monitoring."""
+        return {
+            "size": len(self._browsers),
+            "in_use": sum(1 for pooled in self._browsers if pooled.in_use),
+            "launching": self._launching,
+            "min_size": self.min_size,
+            "max_size": self.max_size
+        }
+
+    async def close(self):
+        """Close idle browsers now; leased ones are closed when their job returns them."""
+        async with self._condition:
+            self._closed = True
+            idle = [pooled for pooled in self._browsers if not pooled.in_use]
+            for pooled in idle:
+                self._browsers.remove(pooled)
+            self._condition.notify_all()
+        await asyncio.gather(*(self._discard(pooled) for pooled in idle))
@@ -0,0 +1,240 @@
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+from urllib.parse import urlsplit
+import aiohttp
+from storage import data_path
+
+logger = logging.getLogger(__name__)
+
+# HTTP statuses worth retrying; any other client error will not go away by itself
+RETRYABLE_STATUSES = (408, 425, 429)
+
+
+class CallbackOutbox:
+    """
+    Durable outbox of webhook callbacks.
+
+    Callbacks are written to a SQLite table (WAL mode) and delivered by a
+    background dispatcher, so the booking workers only pay for one insert.
+    All deliveries share one pooled aiohttp session; a global semaphore and
+    one semaphore per receiving host cap the concurrent requests. Failed
+    deliveries are retried with exponential backoff and jitter, and are
+    dead-lettered (kept with status "dead") after max_attempts. Due callbacks
+    are claimed with a lease, so several API processes can share the outbox.
+    """
+
+    def __init__(self, path: str, max_attempts: int = 8, base_delay: float = 2.0, max_delay: float = 600.0,
+                 concurrency: int = 32, host_concurrency: int = 4, timeout: float = 10.0,
+                 retention: float = 24 * 3600):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.concurrency = concurrency
+        self.host_concurrency = host_concurrency
+        self.timeout = timeout
+        self.retention = retention
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.executescript(
+                "CREATE TABLE IF NOT EXISTS callbacks ("
+                "id INTEGER PRIMARY KEY, url TEXT NOT NULL, payload TEXT NOT NULL, "
+                "status TEXT NOT NULL DEFAULT 'pending', attempts INTEGER NOT NULL DEFAULT 0, "
+                "next_attempt_at REAL NOT NULL, last_error TEXT, created_at REAL NOT NULL, finished_at REAL);"
+                "CREATE INDEX IF NOT EXISTS callbacks_due ON callbacks (status, next_attempt_at);"
+            )
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        self._slots = asyncio.Semaphore(concurrency)
+        self._host_slots: Dict[str, asyncio.Semaphore] = {}
+        self._deliveries: Set[asyncio.Task] = set()
+        self._in_flight: Set[int] = set()
+        self._last_purge = 0.0
+        self.enqueued = 0
+        self.delivered = 0
+        self.retried = 0
+        self.dead = 0
+        self.total_latency = 0.0
+
+    @classmethod
+    def from_env(cls) -> "CallbackOutbox":
+        """Create an outbox configured from CALLBACK_* environment variables."""
+        return cls(
+            path=os.environ.get('CALLBACK_OUTBOX_PATH') or data_path('callbacks.db'),
+            max_attempts=int(os.environ.get('CALLBACK_MAX_ATTEMPTS', '8')),
+            base_delay=float(os.environ.get('CALLBACK_BASE_DELAY', '2')),
+            max_delay=float(os.environ.get('CALLBACK_MAX_DELAY', '600')),
+            concurrency=int(os.environ.get('CALLBACK_CONCURRENCY', '32')),
+            host_concurrency=int(os.environ.get('CALLBACK_HOST_CONCURRENCY', '4')),
+            timeout=float(os.environ.get('CALLBACK_TIMEOUT', '10'))
+        )
+
+    async def start(self):
+        """Open the shared HTTP session and start delivering."""
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.host_concurrency),
+            timeout=aiohttp.ClientTimeout(total=self.timeout)
+        )
+        self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def close(self):
+        """Stop delivering; unsent callbacks stay in the outbox for the next start."""
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            await asyncio.gather(self._dispatcher, return_exceptions=True)
+            self._dispatcher = None
+        for task in list(self._deliveries):
+            task.cancel()
+        await asyncio.gather(*self._deliveries, return_exceptions=True)
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        self._connection.close()
+
+    async def enqueue(self, url: str, payload: dict):
+        """
+        Store a callback for delivery and return without waiting for it.
+
+        Args:
+            url: The URL to POST the callback to
+            payload: JSON-serializable callback body
+        """
+        body = json.dumps(payload, default=str)
+        await asyncio.to_thread(self._execute, "INSERT INTO callbacks (url, payload, next_attempt_at, created_at) "
+                                "VALUES (?, ?, ?, ?)", (url, body, time.time(), time.time()))
+        self.enqueued += 1
+        self._wakeup.set()
+
+    def _execute(self, sql: str, parameters: tuple = ()) -> List[tuple]:
+        with self._lock:
+            return self._connection.execute(sql, parameters).fetchall()
+
+    def _claim(self, limit: int) -> Tuple[List[tuple], Optional[float]]:
+        # Lease due callbacks by moving their next attempt past the request
+        # timeout, so no other process picks them up while they are in flight
+        with self._lock:
+            now = time.time()
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._connection.execute(
+                    "SELECT id, url, payload, attempts FROM callbacks WHERE status = 'pending' "
+                    "AND next_attempt_at <= ? ORDER BY next_attempt_at LIMIT ?", (now, limit)
+                ).fetchall()
+                self._connection.executemany("UPDATE callbacks SET next_attempt_at = ? WHERE id = ?",
+                                             [(now + self.timeout * 2, row[0]) for row in rows])
+                next_due = self._connection.execute(
+                    "SELECT MIN(next_attempt_at) FROM callbacks WHERE status = 'pending'"
+                ).fetchone()[0]
+                self._connection.execute("COMMIT")
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+        return rows, next_due
+
+    async def _dispatch(self):
+        while True:
+            try:
+                free = self.concurrency - len(self._deliveries)
+                rows, next_due = await asyncio.to_thread(self._claim, free) if free > 0 else ([], None)
+                for row in rows:
+                    # A lease can run out while the delivery waits for its host's slot
+                    if row[0] in self._in_flight:
+                        continue
+                    self._in_flight.add(row[0])
+                    task = asyncio.create_task(self._deliver(*row))
+                    self._deliveries.add(task)
+                    task.add_done_callback(self._deliveries.discard)
+                if time.time() - self._last_purge >= 3600:
+                    await asyncio.to_thread(self._purge)
+                    self._last_purge = time.time()
+            except Exception as e:
+                logger.error(f"Error dispatching callbacks: {str(e)}")
+                next_due = None
+            # Sleep until the next callback is due (at most a second, to notice
+            # callbacks enqueued by other processes) or a new one is enqueued
+            delay = 1.0 if next_due is None else min(max(next_due - time.time(), 0.05), 1.0)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def _host_slot(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        slot = self._host_slots.get(host)
+        if slot is None:
+            slot = self._host_slots[host] = asyncio.Semaphore(self.host_concurrency)
+        return slot
+
+    async def _deliver(self, callback_id: int, url: str, payload: str, attempts: int):
+        try:
+            await self._attempt(callback_id, url, payload, attempts + 1)
+        finally:
+            self._in_flight.discard(callback_id)
+
+    async def _attempt(self, callback_id: int, url: str, payload: str, attempts: int):
+        error, retryable = None, True
+        async with self._slots, self._host_slot(url):
+            started = time.monotonic()
+            try:
+                async with self._session.post(url, data=payload,
+                                              headers={"Content-Type": "application/json"}) as response:
+                    if response.status >= 400:
+                        error = f"HTTP {response.status}"
+                        retryable = response.status >= 500 or response.status in RETRYABLE_STATUSES
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = f"{type(e).__name__}: {str(e)}"
+            latency = time.monotonic() - started
+
+        if error is None:
+            logger.info(f"Callback to {url} succeeded after {attempts} attempt(s)")
+            self.delivered += 1
+            self.total_latency += latency
+            await asyncio.to_thread(self._execute, "UPDATE callbacks SET status = 'delivered', attempts = ?, "
+                                    "last_error = NULL, finished_at = ? WHERE id = ?",
+                                    (attempts, time.time(), callback_id))
+        elif not retryable or attempts >= self.max_attempts:
+            logger.error(f"Callback to {url} dead-lettered after {attempts} attempt(s): {error}")
+            self.dead += 1
+            await asyncio.to_thread(self._execute, "UPDATE callbacks SET status = 'dead', attempts = ?, "
+                                    "last_error = ?, finished_at = ? WHERE id = ?",
+                                    (attempts, error, time.time(), callback_id))
+        else:
+            # Exponential backoff with jitter, so receivers coming back up are not hit all at once
+            delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1)) * random.uniform(0.5, 1.0)
+            logger.warning(f"Callback to {url} failed ({error}), retrying in {delay:.1f}s")
+            self.retried += 1
+            await asyncio.to_thread(self._execute, "UPDATE callbacks SET attempts = ?, last_error = ?, "
+                                    "next_attempt_at = ? WHERE id = ?",
+                                    (attempts, error, time.time() + delay, callback_id))
+            self._wakeup.set()
+
+    def _purge(self):
+        # Delivered callbacks are only kept for a while; dead letters stay for inspection
+        self._execute("DELETE FROM callbacks WHERE status = 'delivered' AND finished_at <= ?",
+                      (time.time() - self.retention,))
+
+    def stats(self) -> dict:
+        """Return delivery counters and the outbox backlog for monitoring."""
+        counts = dict(self._execute("SELECT status, COUNT(*) FROM callbacks GROUP BY status"))
+        return {
+            "enqueued": self.enqueued,
+            "delivered": self.delivered,
+            "retried": self.retried,
+            "dead_lettered": self.dead,
+            "in_flight": len(self._deliveries),
+            "pending": counts.get("pending", 0),
+            "dead": counts.get("dead", 0),
+            "avg_latency": round(self.total_latency / self.delivered, 3) if self.delivered else 0.0
+        }
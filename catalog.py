@@ -0,0 +1,465 @@
+import os
+import re
+import json
+import math
+import time
+import sqlite3
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+from urllib.parse import urlsplit
+from pydantic import ValidationError
+from gazetteer import normalize_name
+from models import BookingResult
+from opening_hours import OpeningHours
+from storage import data_path
+
+logger = logging.getLogger(__name__)
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+# Precision of the stored geohashes (cells of about 5 x 5 metres)
+GEOHASH_PRECISION = 9
+EARTH_RADIUS_KM = 6371.0
+# Characters counted as price level markers in "$$", "€€€" and the like
+PRICE_SYMBOLS = "$€£¥"
+# Number of price level markers in r.price_range (0 if unknown), computed by
+# SQLite so that ranking needs no string handling per restaurant
+PRICE_LEVEL = ("COALESCE(length(r.price_range) - length("
+               + "replace(" * len(PRICE_SYMBOLS) + "r.price_range"
+               + "".join(f", '{symbol}', '')" for symbol in PRICE_SYMBOLS) + "), 0)")
+
+# Google Maps and the reservation providers whose pages the agent may be started on
+GOOGLE_MAPS_HOST = re.compile(r"^(www\.|maps\.)?google\.(com|[a-z]{2}|co\.[a-z]{2}|com\.[a-z]{2})$")
+RESERVATION_HOSTS = (
+    "maps.app.goo.gl", "opentable.com", "resy.com", "thefork.com", "lafourchette.com", "quandoo.com",
+    "sevenrooms.com", "exploretock.com", "resdiary.com", "formitable.com", "zenchef.com", "resengo.com",
+    "covermanager.com", "tablein.com", "bookatable.com", "dish.co", "tablecheck.com", "eatapp.co"
+)
+
+
+def geohash_encode(latitude: float, longitude: float, precision: int = GEOHASH_PRECISION) -> str:
+    """Encode coordinates as a geohash; longer hashes describe smaller cells."""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        # Bits alternate between longitude and latitude, starting with longitude
+        interval, coordinate = (lon_range, longitude) if even else (lat_range, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits, value = 0, 0
+    return "".join(chars)
+
+
+def geohash_cell_size(precision: int) -> tuple:
+    """Return the (height, width) in degrees of a geohash cell of the given precision."""
+    lon_bits = math.ceil(precision * 5 / 2)
+    lat_bits = math.floor(precision * 5 / 2)
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def geohash_cover(latitude: float, longitude: float, radius_km: float) -> Set[str]:
+    """
+    Return geohash prefixes whose cells together cover a circle.
+
+    The precision is the finest one whose cells are still larger than the
+    circle's bounding box, so the box is covered by at most four cells.
+    """
+    lat_delta = math.degrees(radius_km / EARTH_RADIUS_KM)
+    lon_delta = lat_delta / max(math.cos(math.radians(latitude)), 0.01)
+    precision = 1
+    while precision < GEOHASH_PRECISION:
+        height, width = geohash_cell_size(precision + 1)
+        if height < 2 * lat_delta or width < 2 * lon_delta:
+            break
+        precision += 1
+    return {
+        geohash_encode(max(min(lat, 90.0), -90.0), (lon + 180.0) % 360.0 - 180.0, precision)
+        for lat in (latitude - lat_delta, latitude + lat_delta)
+        for lon in (longitude - lon_delta, longitude + lon_delta)
+    }
+
+
+def time_window(time_of_day: str, minutes: int) -> str:
+    """Round an HH:MM time down to the start of its window of the given length."""
+    hours, mins = (int(part) for part in time_of_day.split(":")[:2])
+    start = (hours * 60 + mins) // minutes * minutes
+    return f"{start // 60:02d}:{start % 60:02d}"
+
+
+def is_trusted_page(url: Optional[str]) -> bool:
+    """
+    Tell whether a page URL reported by the agent may be opened by later bookings.
+
+    Page URLs are read from untrusted web pages and later bookings carry the
+    customer's contact details, so only https pages on Google Maps, on the known
+    reservation providers or on hosts listed in DEEP_LINK_EXTRA_HOSTS are accepted.
+    """
+    if not url:
+        return False
+    try:
+        parts = urlsplit(url)
+        host = (parts.hostname or "").lower()
+    except ValueError:
+        return False
+    if parts.scheme != "https" or parts.username or parts.password or parts.port not in (None, 443):
+        return False
+    if GOOGLE_MAPS_HOST.match(host):
+        # Other Google paths include open redirects such as /url?q=
+        return parts.path == "/maps" or parts.path.startswith("/maps/")
+    extra = [host.strip().lower() for host in os.environ.get('DEEP_LINK_EXTRA_HOSTS', '').split(",") if host.strip()]
+    return any(host == allowed or host.endswith("." + allowed) for allowed in (*RESERVATION_HOSTS, *extra))
+
+
+def distance_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance between two points in kilometres."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def restaurant_from_row(columns: Sequence[str], row: tuple) -> dict:
+    """Turn a row of the restaurants table into a restaurant dict, decoding its JSON and flag columns."""
+    restaurant = dict(zip(columns, row))
+    restaurant["popular_dishes"] = json.loads(restaurant["popular_dishes"]) if restaurant["popular_dishes"] else None
+    restaurant["approximate"] = bool(restaurant["approximate"])
+    return restaurant
+
+
+def restaurant_key(name: str, address: str) -> str:
+    """Deduplication key of a restaurant: its normalized name and address."""
+    return f"{normalize_name(name)}|{normalize_name(address)}"
+
+
+class RestaurantCatalog:
+    """
+    Deduplicated SQLite catalog of the restaurants found by agent runs.
+
+    Restaurants are keyed by normalized name and address, so repeated runs
+    update one row. Each row stores a geohash of its coordinates; a radius
+    search turns into a few range scans of the geohash index followed by an
+    exact distance check. When the agent did not report coordinates, the
+    centre of the search is stored instead and the row is marked approximate.
+
+    Dead ends found by the agent are remembered as well: a slot (restaurant,
+    date, time window, party size) that was fully booked is skipped for
+    slot_ttl seconds, and a restaurant that asked for prepayment is skipped
+    for prepayment_ttl seconds, whatever the slot.
+    """
+
+    def __init__(self, path: str, slot_ttl: float = 3600, prepayment_ttl: float = 30 * 24 * 3600,
+                 time_window_minutes: int = 30):
+        self.path = path
+        self.slot_ttl = slot_ttl
+        self.prepayment_ttl = prepayment_ttl
+        self.time_window_minutes = time_window_minutes
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.executescript(
+                "CREATE TABLE IF NOT EXISTS restaurants ("
+                "key TEXT PRIMARY KEY, name TEXT NOT NULL, address TEXT NOT NULL, phone_number TEXT, "
+                "rating REAL, price_range TEXT, cuisine_type TEXT, popular_dishes TEXT, opening_hours TEXT, "
+                "maps_url TEXT, latitude REAL NOT NULL, longitude REAL NOT NULL, approximate INTEGER NOT NULL, "
+                "geohash TEXT NOT NULL, times_seen INTEGER NOT NULL DEFAULT 1, last_seen REAL NOT NULL);"
+                "CREATE INDEX IF NOT EXISTS restaurants_geohash ON restaurants (geohash);"
+                "CREATE TABLE IF NOT EXISTS restaurant_purposes ("
+                "key TEXT NOT NULL, purpose TEXT NOT NULL, times_chosen INTEGER NOT NULL DEFAULT 1, "
+                "PRIMARY KEY (key, purpose));"
+                "CREATE TABLE IF NOT EXISTS unavailable_slots ("
+                "key TEXT NOT NULL, date TEXT NOT NULL, time_window TEXT NOT NULL, party_size INTEGER NOT NULL, "
+                "reason TEXT NOT NULL, expires_at REAL NOT NULL, PRIMARY KEY (key, date, time_window, party_size));"
+                # Kept apart from restaurants, as most skipped restaurants were never recorded
+                "CREATE TABLE IF NOT EXISTS prepayment_restaurants (key TEXT PRIMARY KEY, seen_at REAL NOT NULL);"
+            )
+            # Catalogs created before these columns existed lack them
+            columns = [row[1] for row in self._connection.execute("PRAGMA table_info(restaurants)")]
+            if "opening_intervals" not in columns:
+                self._connection.execute("ALTER TABLE restaurants ADD COLUMN opening_intervals TEXT")
+            if "reservation_url" not in columns:
+                self._connection.execute("ALTER TABLE restaurants ADD COLUMN reservation_url TEXT")
+            # Hours parsed before version 1 applied the hours of a single date to the whole week
+            if self._connection.execute("PRAGMA user_version").fetchone()[0] < 1:
+                self._connection.execute("UPDATE restaurants SET opening_intervals = NULL")
+                self._connection.execute("PRAGMA user_version = 1")
+
+    def record(self, result: str, latitude: float, longitude: float, purpose: Optional[str] = None,
+               date: Optional[str] = None) -> bool:
+        """
+        Add or update the restaurant of an agent result.
+
+        Args:
+            result: JSON-formatted BookingResult returned by the agent
+            latitude: Latitude of the search centre, used if the result has no coordinates
+            longitude: Longitude of the search centre
+            purpose: Purpose the restaurant was chosen for
+            date: Requested date (YYYY-MM-DD), which hours naming no day were shown for
+
+        Returns:
+            bool: True if the result held a restaurant and was recorded
+        """
+        try:
+            restaurant = BookingResult.model_validate_json(result).restaurant
+        except (ValidationError, ValueError, TypeError):
+            return False
+
+        approximate = restaurant.latitude is None or restaurant.longitude is None
+        if not approximate:
+            latitude, longitude = restaurant.latitude, restaurant.longitude
+        key = restaurant_key(restaurant.name, restaurant.address)
+        # Drop page URLs that later bookings must not be sent to
+        maps_url = restaurant.maps_url if is_trusted_page(restaurant.maps_url) else None
+        reservation_url = restaurant.reservation_url if is_trusted_page(restaurant.reservation_url) else None
+        values = (key, restaurant.name, restaurant.address, restaurant.phone_number, restaurant.rating,
+                  restaurant.price_range, restaurant.cuisine_type,
+                  json.dumps(restaurant.popular_dishes) if restaurant.popular_dishes else None,
+                  restaurant.opening_hours, maps_url, latitude, longitude, int(approximate),
+                  geohash_encode(latitude, longitude), time.time())
+        # Free-text hours are parsed once here, so searches only compare intervals
+        opening_hours = OpeningHours.parse(restaurant.opening_hours, date)
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                # Hours are often seen one day at a time; keep the days this run did not see
+                if opening_hours is not None:
+                    row = self._connection.execute(
+                        "SELECT opening_intervals FROM restaurants WHERE key = ?", (key,)
+                    ).fetchone()
+                    opening_hours = opening_hours.merged_with(OpeningHours.from_json(row[0] if row else None))
+                values += (opening_hours.to_json() if opening_hours else None, reservation_url)
+                # Keep earlier values of fields this run did not report, and never
+                # replace exact coordinates with an approximate search centre
+                self._connection.execute(
+                    "INSERT INTO restaurants (key, name, address, phone_number, rating, price_range, "
+                    "cuisine_type, popular_dishes, opening_hours, maps_url, latitude, longitude, approximate, "
+                    "geohash, last_seen, opening_intervals, reservation_url) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (key) DO UPDATE SET "
+                    "phone_number = COALESCE(excluded.phone_number, phone_number), "
+                    "rating = COALESCE(excluded.rating, rating), "
+                    "price_range = COALESCE(excluded.price_range, price_range), "
+                    "cuisine_type = COALESCE(excluded.cuisine_type, cuisine_type), "
+                    "popular_dishes = COALESCE(excluded.popular_dishes, popular_dishes), "
+                    "opening_hours = COALESCE(excluded.opening_hours, opening_hours), "
+                    "opening_intervals = COALESCE(excluded.opening_intervals, opening_intervals), "
+                    "maps_url = COALESCE(excluded.maps_url, maps_url), "
+                    "reservation_url = COALESCE(excluded.reservation_url, reservation_url), "
+                    "latitude = CASE WHEN excluded.approximate <= approximate THEN excluded.latitude ELSE latitude END, "
+                    "longitude = CASE WHEN excluded.approximate <= approximate THEN excluded.longitude ELSE longitude END, "
+                    "geohash = CASE WHEN excluded.approximate <= approximate THEN excluded.geohash ELSE geohash END, "
+                    "approximate = MIN(approximate, excluded.approximate), "
+                    "times_seen = times_seen + 1, last_seen = excluded.last_seen",
+                    values
+                )
+                if purpose:
+                    self._connection.execute(
+                        "INSERT INTO restaurant_purposes (key, purpose) VALUES (?, ?) "
+                        "ON CONFLICT (key, purpose) DO UPDATE SET times_chosen = times_chosen + 1",
+                        (key, normalize_name(purpose))
+                    )
+                self._connection.execute("COMMIT")
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+        return True
+
+    def mark_unavailable(self, name: str, address: str, date: str, time_of_day: str, party_size: int,
+                         reason: str, requires_prepayment: bool = False):
+        """
+        Remember that a restaurant could not be booked for a slot.
+
+        Args:
+            name: Name of the restaurant
+            address: Address of the restaurant
+            date: Requested date (YYYY-MM-DD)
+            time_of_day: Requested time (HH:MM)
+            party_size: Requested number of people
+            reason: Why the slot could not be booked, e.g. fully_booked
+            requires_prepayment: Whether the restaurant asked for prepayment or a credit card
+        """
+        key = restaurant_key(name, address)
+        now = time.time()
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._connection.execute(
+                    "INSERT INTO unavailable_slots (key, date, time_window, party_size, reason, expires_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (key, date, time_window, party_size) DO UPDATE SET "
+                    "reason = excluded.reason, expires_at = excluded.expires_at",
+                    (key, date, time_window(time_of_day, self.time_window_minutes), party_size, reason,
+                     now + self.slot_ttl)
+                )
+                if requires_prepayment:
+                    self._connection.execute(
+                        "INSERT OR REPLACE INTO prepayment_restaurants (key, seen_at) VALUES (?, ?)", (key, now)
+                    )
+                    self._connection.execute("DELETE FROM prepayment_restaurants WHERE seen_at <= ?",
+                                             (now - self.prepayment_ttl,))
+                # Expired slots are never read again
+                self._connection.execute("DELETE FROM unavailable_slots WHERE expires_at <= ?", (now,))
+                self._connection.execute("COMMIT")
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+
+    def unavailable(self, keys: Iterable[str], date: str, time_of_day: str, party_size: int) -> Dict[str, str]:
+        """
+        Find the known dead ends among some restaurants for a slot.
+
+        Returns:
+            dict: Reason why each restaurant cannot be booked (prepayment or the
+                remembered slot reason), by key; bookable restaurants are left out
+        """
+        keys = list(keys)
+        if not keys:
+            return {}
+        now = time.time()
+        placeholders = ", ".join("?" for _ in keys)
+        with self._lock:
+            prepayment = self._connection.execute(
+                f"SELECT key FROM prepayment_restaurants WHERE key IN ({placeholders}) AND seen_at > ?",
+                keys + [now - self.prepayment_ttl]
+            ).fetchall()
+            slots = self._connection.execute(
+                f"SELECT key, reason FROM unavailable_slots WHERE key IN ({placeholders}) "
+                "AND date = ? AND time_window = ? AND party_size = ? AND expires_at > ?",
+                keys + [date, time_window(time_of_day, self.time_window_minutes), party_size, now]
+            ).fetchall()
+        reasons = dict(slots)
+        reasons.update((key, "requires_prepayment") for (key,) in prepayment)
+        return reasons
+
+    def named(self, name: str) -> List[dict]:
+        """
+        Find the known restaurants with a name, wherever they are.
+
+        Keys start with the normalized name, so this is a range scan of the
+        primary key.
+        """
+        name = normalize_name(name)
+        with self._lock:
+            # Every key starting with "name|" sorts below "name}", whatever its address
+            cursor = self._connection.execute(
+                "SELECT * FROM restaurants WHERE key >= ? AND key < ?", (name + "|", name + "}")
+            )
+            columns = [description[0] for description in cursor.description]
+            rows = cursor.fetchall()
+        return [restaurant_from_row(columns, row) for row in rows]
+
+    def nearby(self, latitude: float, longitude: float, radius_km: float = 2.0, purpose: Optional[str] = None,
+               min_rating: Optional[float] = None, limit: int = 5) -> List[dict]:
+        """
+        Find the top-rated known restaurants within a radius.
+
+        Args:
+            latitude: Latitude of the centre
+            longitude: Longitude of the centre
+            radius_km: Search radius in kilometres
+            purpose: Only return restaurants that were chosen for this purpose before
+            min_rating: Only return restaurants rated at least this high
+            limit: Maximum number of restaurants to return
+
+        Returns:
+            list: Restaurant dicts with distance_km and times_chosen (for the purpose) fields,
+                best rated (then closest) first
+        """
+        columns, rows = self._candidates(geohash_cover(latitude, longitude, radius_km), purpose, min_rating)
+        restaurants = []
+        for row in rows:
+            restaurant = restaurant_from_row(columns, row)
+            distance = distance_km(latitude, longitude, restaurant["latitude"], restaurant["longitude"])
+            if distance <= radius_km:
+                restaurants.append({**restaurant, "distance_km": round(distance, 3)})
+        restaurants.sort(key=lambda restaurant: (-(restaurant["rating"] or 0), restaurant["distance_km"]))
+        return restaurants[:limit]
+
+    def nearby_rows(self, latitude: float, longitude: float, radius_km: float = 2.0, purpose: Optional[str] = None,
+                    limit: Optional[int] = None) -> Tuple[List[str], List[tuple]]:
+        """
+        Fetch the known restaurants around a point as raw rows, for columnar ranking.
+
+        Unlike nearby, nothing is decoded per row. The rows come from the
+        geohash cells covering the radius, so a few lie just outside it;
+        CandidateSet.within drops those with one array operation.
+
+        Args:
+            latitude: Latitude of the centre
+            longitude: Longitude of the centre
+            radius_km: Search radius in kilometres
+            purpose: Only return restaurants that were chosen for this purpose before
+            limit: Maximum number of restaurants to return, best rated first
+
+        Returns:
+            tuple: (column names, rows) with the restaurant columns, times_chosen and price_level
+        """
+        return self._candidates(geohash_cover(latitude, longitude, radius_km), purpose, None, limit)
+
+    def _candidates(self, cells: Iterable[str], purpose: Optional[str], min_rating: Optional[float],
+                    limit: Optional[int] = None) -> Tuple[List[str], List[tuple]]:
+        conditions, parameters = [], []
+        cells = sorted(cells)
+        # Every cell is a prefix, i.e. a range of the geohash index
+        conditions.append("(" + " OR ".join("(r.geohash >= ? AND r.geohash < ?)" for _ in cells) + ")")
+        for cell in cells:
+            parameters.extend([cell, cell + "~"])
+        join, times_chosen = "", "0"
+        if purpose:
+            times_chosen = "p.times_chosen"
+            join = "JOIN restaurant_purposes p ON p.key = r.key AND p.purpose = ?"
+            parameters.insert(0, normalize_name(purpose))
+        if min_rating is not None:
+            conditions.append("r.rating >= ?")
+            parameters.append(min_rating)
+        order = ""
+        if limit is not None:
+            order = "ORDER BY r.rating DESC LIMIT ?"
+            parameters.append(limit)
+        with self._lock:
+            cursor = self._connection.execute(
+                f"SELECT r.*, {times_chosen} AS times_chosen, {PRICE_LEVEL} AS price_level "
+                f"FROM restaurants r {join} WHERE {' AND '.join(conditions)} {order}", parameters
+            )
+            columns = [description[0] for description in cursor.description]
+            rows = cursor.fetchall()
+        return columns, rows
+
+    def stats(self) -> dict:
+        """Return the number of known restaurants for monitoring."""
+        with self._lock:
+            total, approximate = self._connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(approximate), 0) FROM restaurants"
+            ).fetchone()
+            prepayment, = self._connection.execute(
+                "SELECT COUNT(*) FROM prepayment_restaurants WHERE seen_at > ?", (time.time() - self.prepayment_ttl,)
+            ).fetchone()
+            unavailable_slots, = self._connection.execute(
+                "SELECT COUNT(*) FROM unavailable_slots WHERE expires_at > ?", (time.time(),)
+            ).fetchone()
+        return {"restaurants": total, "approximate_locations": approximate,
+                "requiring_prepayment": prepayment, "unavailable_slots": unavailable_slots}
+
+
+_catalog: Optional[RestaurantCatalog] = None
+
+
+def get_catalog() -> RestaurantCatalog:
+    """Return the process-wide restaurant catalog, opening it on first use."""
+    global _catalog
+    if _catalog is None:
+        _catalog = RestaurantCatalog(
+            os.environ.get('RESTAURANT_CATALOG_PATH') or data_path('catalog.db'),
+            slot_ttl=float(os.environ.get('UNAVAILABLE_SLOT_TTL', '3600')),
+            prepayment_ttl=float(os.environ.get('PREPAYMENT_FLAG_TTL', str(30 * 24 * 3600))),
+            time_window_minutes=int(os.environ.get('AVAILABILITY_TIME_WINDOW_MINUTES', '30'))
+        )
+    return _catalog
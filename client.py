@@ -39,6 +39,12 @@ def start_booking(api_url, params):
     """Start a new booking using the API."""
     try:
         response = requests.post(f"{api_url}/book", json=params)
+        # The server is at capacity: wait as instructed and try again
+        while response.status_code == 429:
+            retry_after = int(response.headers.get("Retry-After", "10"))
+            print(f"Server busy, retrying in {retry_after} seconds...")
+            time.sleep(retry_after)
+            response = requests.post(f"{api_url}/book", json=params)
         response.raise_for_status()
         return response.json()
     except requests.exceptions.RequestException as e:
@@ -55,6 +61,49 @@ def check_status(api_url, booking_id):
         print(f"Error checking status: {e}")
         return None
 
+def wait_for_change(api_url, booking_id, since, wait=30):
+    """
+    Long-poll the status of a booking until its version is newer than since.
+    
+    Returns:
+        tuple: (status, version) where version is None after an error or if the server does not report one
+    """
+    try:
+        response = requests.get(f"{api_url}/status/{booking_id}", params={"wait": wait, "since": since},
+                                timeout=wait + 30)
+        response.raise_for_status()
+        version = response.headers.get("X-Booking-Version")
+        return response.json(), int(version) if version else None
+    except requests.exceptions.RequestException as e:
+        print(f"Error checking status: {e}")
+        return None, None
+
+def follow_events(api_url, booking_id):
+    """
+    Print the status changes and agent steps of a booking as the server pushes them.
+    
+    Returns:
+        bool: True once the booking has completed or failed, False if the event
+            stream was unavailable or interrupted
+    """
+    try:
+        with requests.get(f"{api_url}/status/{booking_id}/events", stream=True, timeout=(10, 60)) as response:
+            response.raise_for_status()
+            for line in response.iter_lines(decode_unicode=True):
+                # Skip event names, blank separators and keep-alive comments
+                if not line or not line.startswith("data:"):
+                    continue
+                event = json.loads(line[len("data:"):])
+                if event["type"] == "step":
+                    print(f"Step {event['step']}: {event.get('next_goal') or event.get('url')}")
+                else:
+                    print(f"Status: {event['status']} - {event['message']}")
+                    if event["status"] in ["completed", "failed"]:
+                        return True
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f"Event stream unavailable ({e}), falling back to polling")
+    return False
+
 def main():
     args = parse_args()
     
@@ -105,13 +154,21 @@ def main():
     booking_response = start_booking(args.api_url, booking_request)
     booking_id = booking_response["booking_id"]
     print(f"Booking started with ID: {booking_id}")
+    if booking_response.get("queue_position"):
+        print(f"Queue position: {booking_response['queue_position']}, "
+              f"estimated start: {booking_response['estimated_start_time']}")
     
-    # Poll for status updates
-    print("Polling for status updates (press Ctrl+C to stop)...")
+    # Follow the live event stream, and poll for status updates if it is unavailable
+    print("Following status updates (press Ctrl+C to stop)...")
     print("Note: If you provided a callback URL, results will also be sent there when ready")
     try:
+        if follow_events(args.api_url, booking_id):
+            print("\nFinal result:")
+            print(json.dumps(check_status(args.api_url, booking_id), indent=2))
+            return
+        version = 0
         while True:
-            status = check_status(args.api_url, booking_id)
+            status, version = wait_for_change(args.api_url, booking_id, version)
             if status:
                 current_status = status["status"]
                 message = status["message"]
@@ -123,8 +180,10 @@ def main():
                     print(json.dumps(status, indent=2))
                     break
             
-            # Wait before polling again
-            time.sleep(5)
+            # After an error, or on servers without long-polling, wait before polling again
+            if version is None:
+                version = 0
+                time.sleep(5)
     except KeyboardInterrupt:
         print("\nStopped polling. You can check the status later with:")
         print(f"  {sys.argv[0]} --api-url {args.api_url} --check-only {booking_id}")
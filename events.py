@@ -0,0 +1,91 @@
+import asyncio
+import json
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Iterator, Set
+
+
+class EventBus:
+    """
+    In-process publish/subscribe of booking events.
+
+    Every subscriber of a booking gets its own bounded queue. Publishing never
+    blocks: when a slow subscriber's queue is full, its oldest event is
+    dropped to make room, since later status events supersede earlier ones.
+    """
+
+    def __init__(self, max_queued: int = 100):
+        self.max_queued = max_queued
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = defaultdict(set)
+        # One event per booking with parked long-poll requests, replaced after every status change
+        self._changes: Dict[str, asyncio.Event] = {}
+        self._waiting: Dict[str, int] = defaultdict(int)
+        self.published = 0
+        self.dropped = 0
+
+    def publish(self, booking_id: str, event: dict):
+        """Deliver an event to every current subscriber of a booking."""
+        self.published += 1
+        if event["type"] == "status" and booking_id in self._changes:
+            self._changes.pop(booking_id).set()
+        for queue in self._subscribers.get(booking_id, ()):
+            if queue.full():
+                queue.get_nowait()
+                self.dropped += 1
+            queue.put_nowait(event)
+
+    @contextmanager
+    def subscribe(self, booking_id: str) -> Iterator[asyncio.Queue]:
+        """Receive the events of a booking on a queue for the duration of the block."""
+        queue = asyncio.Queue(maxsize=self.max_queued)
+        self._subscribers[booking_id].add(queue)
+        try:
+            yield queue
+        finally:
+            subscribers = self._subscribers.get(booking_id)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    del self._subscribers[booking_id]
+
+    async def wait_for_status(self, booking_id: str, timeout: float) -> bool:
+        """
+        Wait until the next status event of a booking is published.
+
+        Args:
+            booking_id: The booking to wait for
+            timeout: Maximum number of seconds to wait
+
+        Returns:
+            bool: True if the status changed, False if the timeout expired first
+        """
+        change = self._changes.get(booking_id)
+        if change is None:
+            change = self._changes[booking_id] = asyncio.Event()
+        self._waiting[booking_id] += 1
+        try:
+            await asyncio.wait_for(change.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self._waiting[booking_id] -= 1
+            if not self._waiting[booking_id]:
+                del self._waiting[booking_id]
+                if self._changes.get(booking_id) is change:
+                    del self._changes[booking_id]
+
+    def stats(self) -> dict:
+        """Return subscriber and delivery counters for monitoring."""
+        return {
+            "subscribed_bookings": len(self._subscribers),
+            "subscribers": sum(len(queues) for queues in self._subscribers.values()),
+            "long_polls": sum(self._waiting.values()),
+            "published": self.published,
+            "dropped": self.dropped
+        }
+
+
+def format_sse(event: dict) -> str:
+    """Encode an event as a Server-Sent Events message named after its type."""
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
@@ -0,0 +1,166 @@
+import os
+import re
+import csv
+import unicodedata
+from typing import Iterable, Optional, Tuple
+import numpy as np
+
+# Bundled table of frequently booked cities with their aliases
+CITIES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "cities.csv")
+
+_NON_WORD = re.compile(r"[^\w]+")
+
+# Names a qualifier may use for the countries of the city table, besides their ISO code
+COUNTRY_NAMES = {
+    "AE": ("United Arab Emirates", "UAE"), "AR": ("Argentina",), "AT": ("Austria", "Österreich"),
+    "AU": ("Australia",), "BA": ("Bosnia and Herzegovina", "Bosnia"), "BE": ("Belgium", "België", "Belgique"),
+    "BG": ("Bulgaria",), "BH": ("Bahrain",), "BR": ("Brazil", "Brasil"), "CA": ("Canada",),
+    "CH": ("Switzerland", "Schweiz", "Suisse"), "CL": ("Chile",), "CN": ("China",), "CO": ("Colombia",),
+    "CU": ("Cuba",), "CY": ("Cyprus",), "CZ": ("Czech Republic", "Czechia"), "DE": ("Germany", "Deutschland"),
+    "DK": ("Denmark", "Danmark"), "EC": ("Ecuador",), "EE": ("Estonia",), "EG": ("Egypt",), "ES": ("Spain", "España"),
+    "ET": ("Ethiopia",), "FI": ("Finland", "Suomi"), "FR": ("France",),
+    "GB": ("United Kingdom", "UK", "Great Britain", "Britain", "England", "Scotland", "Wales", "Northern Ireland"),
+    "GH": ("Ghana",), "GR": ("Greece",), "HK": ("Hong Kong",), "HR": ("Croatia", "Hrvatska"), "HU": ("Hungary",),
+    "ID": ("Indonesia",), "IE": ("Ireland",), "IL": ("Israel",), "IN": ("India",), "IS": ("Iceland",),
+    "IT": ("Italy", "Italia"), "JO": ("Jordan",), "JP": ("Japan",), "KE": ("Kenya",),
+    "KR": ("South Korea", "Korea"), "KW": ("Kuwait",), "LB": ("Lebanon",), "LK": ("Sri Lanka",),
+    "LT": ("Lithuania",), "LU": ("Luxembourg",), "LV": ("Latvia",), "MA": ("Morocco",), "MC": ("Monaco",),
+    "MT": ("Malta",), "MX": ("Mexico", "México"), "MY": ("Malaysia",), "NG": ("Nigeria",),
+    "NL": ("Netherlands", "The Netherlands", "Nederland", "Holland"), "NO": ("Norway", "Norge"), "NP": ("Nepal",),
+    "NZ": ("New Zealand",), "OM": ("Oman",), "PE": ("Peru",), "PH": ("Philippines",), "PL": ("Poland", "Polska"),
+    "PT": ("Portugal",), "QA": ("Qatar",), "RO": ("Romania",), "RS": ("Serbia",), "RU": ("Russia",),
+    "SA": ("Saudi Arabia",), "SE": ("Sweden", "Sverige"), "SG": ("Singapore",), "SI": ("Slovenia",),
+    "SK": ("Slovakia",), "TH": ("Thailand",), "TN": ("Tunisia",), "TR": ("Turkey", "Türkiye"), "TW": ("Taiwan",),
+    "UA": ("Ukraine",), "US": ("United States", "United States of America", "USA", "America"),
+    "UY": ("Uruguay",), "VN": ("Vietnam", "Viet Nam"), "ZA": ("South Africa",)
+}
+
+
+def normalize_name(name: str) -> str:
+    """
+    Normalize a place name for lookups.
+
+    Accents are stripped, case is folded and punctuation is collapsed to single
+    spaces, so "Den Haag", "den-haag" and "DEN HAAG" all map to "den haag".
+    """
+    text = unicodedata.normalize("NFKD", name)
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = _NON_WORD.sub(" ", text.casefold())
+    return " ".join(text.split())
+
+_COUNTRY_KEYS = {code: {normalize_name(name) for name in names} for code, names in COUNTRY_NAMES.items()}
+
+
+class Gazetteer:
+    """
+    Compact, array-backed city table used to resolve coordinates offline.
+
+    Coordinates live in two float arrays and every normalized name or alias is
+    stored once in a sorted key array that points at its row, so both single and
+    batch lookups are a binary search. The table is loaded on first use.
+
+    A name qualified after a comma ("Paris, France") only resolves through its
+    first part when every qualifier names the country of the row, so "Paris,
+    Texas" is left to the remote geocoder instead of resolving to France.
+    """
+
+    def __init__(self, path: str = CITIES_PATH):
+        self.path = path
+        self._keys: Optional[np.ndarray] = None
+        self._rows: Optional[np.ndarray] = None
+        self._latitudes: Optional[np.ndarray] = None
+        self._longitudes: Optional[np.ndarray] = None
+        self._countries: Optional[np.ndarray] = None
+
+    def _load(self):
+        latitudes, longitudes, countries, entries = [], [], [], {}
+        with open(self.path, newline="", encoding="utf-8") as f:
+            for row, record in enumerate(csv.DictReader(f)):
+                latitudes.append(float(record["latitude"]))
+                longitudes.append(float(record["longitude"]))
+                countries.append(record["country"])
+                names = [record["name"]] + [alias for alias in record["aliases"].split("|") if alias]
+                for name in names:
+                    # The first (most prominent) city wins when two share a name
+                    entries.setdefault(normalize_name(name), row)
+
+        keys = sorted(entries)
+        self._keys = np.array(keys)
+        self._rows = np.array([entries[key] for key in keys], dtype=np.int32)
+        self._latitudes = np.array(latitudes, dtype=np.float64)
+        self._longitudes = np.array(longitudes, dtype=np.float64)
+        self._countries = np.array(countries)
+
+    def _find(self, keys: np.ndarray) -> np.ndarray:
+        """Return the row of each normalized key, or -1 where it is unknown."""
+        if self._keys is None:
+            self._load()
+        positions = np.searchsorted(self._keys, keys)
+        positions = np.minimum(positions, len(self._keys) - 1)
+        found = self._keys[positions] == keys
+        return np.where(found, self._rows[positions], -1)
+
+    @staticmethod
+    def _candidate_keys(name: str) -> Tuple[str, str, Tuple[str, ...]]:
+        """Return the full key, the key of the part before the first comma and the qualifier keys after it."""
+        head, *qualifiers = name.split(",")
+        return (normalize_name(name), normalize_name(head),
+                tuple(key for key in map(normalize_name, qualifiers) if key))
+
+    def _qualifies(self, row: int, qualifiers: Tuple[str, ...]) -> bool:
+        """Tell whether every qualifier names the country of a row."""
+        country = str(self._countries[row])
+        names = _COUNTRY_KEYS.get(country, set()) | {normalize_name(country)}
+        return all(qualifier in names for qualifier in qualifiers)
+
+    def lookup(self, name: str) -> Optional[Tuple[float, float]]:
+        """
+        Resolve a city name to coordinates.
+
+        Args:
+            name (str): City name, optionally followed by a region or country after a comma
+
+        Returns:
+            tuple: (latitude, longitude) or None if the city is not in the table
+        """
+        full_key, head_key, qualifiers = self._candidate_keys(name)
+        rows = self._find(np.array([full_key, head_key]))
+        if rows[0] >= 0:
+            row = rows[0]
+        elif rows[1] >= 0 and self._qualifies(rows[1], qualifiers):
+            row = rows[1]
+        else:
+            return None
+        return (float(self._latitudes[row]), float(self._longitudes[row]))
+
+    def lookup_many(self, names: Iterable[str]) -> np.ndarray:
+        """
+        Resolve many city names at once.
+
+        Returns:
+            np.ndarray: (n, 2) array of latitude/longitude pairs, NaN for unknown cities
+        """
+        candidates = [self._candidate_keys(name) for name in names]
+        if not candidates:
+            return np.empty((0, 2))
+        full_keys, head_keys, qualifiers = zip(*candidates)
+        rows = self._find(np.array(full_keys))
+        head_rows = self._find(np.array(head_keys))
+        # Fall back to the first part of a name only where the qualifiers match its country
+        head_rows = np.array([row if row >= 0 and self._qualifies(row, keys) else -1
+                              for row, keys in zip(head_rows, qualifiers)], dtype=np.int32)
+        rows = np.where(rows >= 0, rows, head_rows)
+
+        coordinates = np.full((len(rows), 2), np.nan)
+        known = rows >= 0
+        coordinates[known, 0] = self._latitudes[rows[known]]
+        coordinates[known, 1] = self._longitudes[rows[known]]
+        return coordinates
+
+
+_gazetteer = Gazetteer()
+
+
+def lookup_city(name: str) -> Optional[Tuple[float, float]]:
+    """Resolve a city name using the bundled city table."""
+    return _gazetteer.lookup(name)
@@ -0,0 +1,181 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+from geopy.geocoders import Nominatim
+from geopy.exc import GeocoderTimedOut, GeocoderUnavailable
+from storage import data_path
+
+logger = logging.getLogger(__name__)
+
+Coordinates = Tuple[Optional[float], Optional[float]]
+
+
+class RateLimiter:
+    """Async limiter that spaces calls at least min_interval seconds apart."""
+
+    def __init__(self, min_interval: float):
+        self.min_interval = min_interval
+        self._lock = asyncio.Lock()
+        self._last_call = 0.0
+
+    async def wait(self):
+        """Block until the next call is allowed."""
+        async with self._lock:
+            delay = self._last_call + self.min_interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._last_call = time.monotonic()
+
+
+class GeocodeCache:
+    """
+    Persistent JSON cache of geocoding results with a TTL.
+
+    Misses (unknown places) are cached too, but for a shorter time so that a
+    temporary Nominatim problem does not stick for the whole TTL.
+    """
+
+    def __init__(self, path: str, ttl: float, miss_ttl: float):
+        self.path = path
+        self.ttl = ttl
+        self.miss_ttl = miss_ttl
+        self._entries: Dict[str, dict] = {}
+        self._save_lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self._entries = json.load(f)
+        except FileNotFoundError:
+            self._entries = {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable geocode cache {self.path}: {e}")
+            self._entries = {}
+
+    def get(self, key: str) -> Optional[Coordinates]:
+        """Return cached coordinates, or None when the key is missing or expired."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        ttl = self.ttl if entry["lat"] is not None else self.miss_ttl
+        if time.time() - entry["ts"] > ttl:
+            return None
+        return (entry["lat"], entry["lon"])
+
+    def set(self, key: str, coordinates: Coordinates):
+        latitude, longitude = coordinates
+        self._entries[key] = {"lat": latitude, "lon": longitude, "ts": time.time()}
+
+    def save(self):
+        """Write the cache to disk atomically."""
+        with self._save_lock:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(dict(self._entries), f)
+            os.replace(tmp_path, self.path)
+
+
+class Geocoder:
+    """
+    Non-blocking, cached wrapper around Nominatim.
+
+    Lookups run in a worker thread so they never block the event loop,
+    concurrent lookups of the same place share one request, and all requests
+    go through a shared limiter that honours Nominatim's 1 request/second policy.
+    """
+
+    def __init__(self, cache: GeocodeCache, min_interval: float = 1.0, timeout: float = 10.0):
+        self.cache = cache
+        self.limiter = RateLimiter(min_interval)
+        self.geolocator = Nominatim(user_agent="restaurant-booking-app", timeout=timeout)
+        self._in_flight: Dict[str, asyncio.Future] = {}
+
+    @staticmethod
+    def normalize(city_name: str) -> str:
+        """Normalize a place name into a cache key."""
+        return " ".join(city_name.casefold().split())
+
+    async def get_coordinates(self, city_name: str) -> Coordinates:
+        """
+        Get latitude and longitude coordinates for a given city name.
+
+        Args:
+            city_name (str): Name of the city
+
+        Returns:
+            tuple: (latitude, longitude) or (None, None) if not found
+        """
+        key = self.normalize(city_name)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        # Coalesce concurrent lookups for the same place into a single request;
+        # a None result means the leading lookup was cancelled, so try again
+        future = self._in_flight.get(key)
+        while future is not None:
+            coordinates = await asyncio.shield(future)
+            if coordinates is not None:
+                return coordinates
+            future = self._in_flight.get(key)
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            coordinates, cacheable = await self._geocode(city_name)
+        except asyncio.CancelledError:
+            future.set_result(None)
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved in case nobody else was waiting
+            future.exception()
+            raise
+        finally:
+            del self._in_flight[key]
+        future.set_result(coordinates)
+
+        if cacheable:
+            self.cache.set(key, coordinates)
+            await asyncio.to_thread(self.cache.save)
+        return coordinates
+
+    async def _geocode(self, city_name: str) -> Tuple[Coordinates, bool]:
+        """Query Nominatim; the flag tells whether the answer is definitive enough to cache."""
+        await self.limiter.wait()
+        try:
+            location = await asyncio.to_thread(self.geolocator.geocode, city_name)
+        except (GeocoderTimedOut, GeocoderUnavailable) as e:
+            logger.warning(f"Geocoding error: {e}")
+            return (None, None), False
+
+        if location:
+            return (location.latitude, location.longitude), True
+        logger.info(f"Could not find coordinates for {city_name}")
+        return (None, None), True
+
+
+_geocoder: Optional[Geocoder] = None
+
+
+def get_geocoder() -> Geocoder:
+    """Return the process-wide Geocoder, creating it on first use."""
+    global _geocoder
+    if _geocoder is None:
+        cache = GeocodeCache(
+            data_path('geocode_cache.json'),
+            ttl=float(os.environ.get('GEOCODE_CACHE_TTL', str(30 * 24 * 3600))),
+            miss_ttl=float(os.environ.get('GEOCODE_MISS_TTL', str(24 * 3600)))
+        )
+        _geocoder = Geocoder(cache)
+    return _geocoder
+
+
+async def get_coordinates(city_name: str) -> Coordinates:
+    """Geocode a city name using the process-wide Geocoder."""
+    return await get_geocoder().get_coordinates(city_name)
@@ -0,0 +1,227 @@
+import os
+import time
+import json
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from storage import data_path
+
+# Fields compared without regard to case and surrounding whitespace
+CASE_INSENSITIVE_FIELDS = ("city", "purpose", "restaurant_name", "email", "cuisine")
+
+# Fields that do not change what the agent does
+IGNORED_FIELDS = ("callback_url",)
+
+
+def request_hash(fields: dict) -> str:
+    """
+    Return a canonical hash of a booking request.
+
+    Requests that only differ in field order, in the case of free-text fields
+    or in where their results are delivered hash to the same value.
+    """
+    canonical = {}
+    for name, value in fields.items():
+        if name in IGNORED_FIELDS:
+            continue
+        if isinstance(value, str):
+            value = value.strip()
+            if name in CASE_INSENSITIVE_FIELDS:
+                value = value.casefold()
+        canonical[name] = value
+    encoded = json.dumps(canonical, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class IdempotencyKeys:
+    """
+    Maps client-supplied Idempotency-Key headers to the booking they created.
+
+    Keys are remembered for ttl seconds and at most max_size keys are kept,
+    oldest first out. Together with the request hash, this tells a retry of
+    the same request apart from a key reused for a different request. Keys
+    live in process memory, like the jobs of the memory job store.
+    """
+
+    def __init__(self, max_size: int = 100000, ttl: float = 24 * 3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._keys: "OrderedDict[str, Tuple[str, str, float]]" = OrderedDict()
+        self.replayed = 0
+
+    async def get(self, key: str) -> Optional[Tuple[str, str]]:
+        """Return (booking_id, request hash) stored for a key, or None."""
+        self._evict()
+        entry = self._keys.get(key)
+        return entry[:2] if entry else None
+
+    async def claim(self, key: str, booking_id: str, request_hash: str) -> Optional[Tuple[str, str]]:
+        """
+        Remember the booking created for a key, unless the key is already taken.
+
+        Returns:
+            tuple: (booking_id, request hash) of the booking that holds the key, or None if it was claimed
+        """
+        self._evict()
+        entry = self._keys.get(key)
+        if entry is not None:
+            return entry[:2]
+        self._keys[key] = (booking_id, request_hash, time.time())
+        self._evict()
+        return None
+
+    async def discard(self, key: str):
+        """Forget a key, e.g. because its request was rejected."""
+        self._keys.pop(key, None)
+
+    def _evict(self):
+        cutoff = time.time() - self.ttl
+        while self._keys:
+            _, (_, _, created_at) = next(iter(self._keys.items()))
+            if len(self._keys) <= self.max_size and created_at > cutoff:
+                break
+            self._keys.popitem(last=False)
+
+    def stats(self) -> dict:
+        """Return the number of stored keys and replayed requests for monitoring."""
+        return {"backend": "memory", "keys": len(self._keys), "replayed": self.replayed}
+
+
+class SQLiteIdempotencyKeys:
+    """
+    Idempotency keys kept in the database of the SQLite job store.
+
+    Every API process sharing the database, and every process after a
+    restart, sees the same keys. A key is claimed with one insert into a
+    table keyed by it, so of two processes receiving the same key at once
+    only one creates a booking. Keys expire after ttl seconds.
+    """
+
+    def __init__(self, path: str, ttl: float = 24 * 3600):
+        self.path = path
+        self.ttl = ttl
+        self.replayed = 0
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.executescript(
+                "CREATE TABLE IF NOT EXISTS idempotency_keys ("
+                "key TEXT PRIMARY KEY, booking_id TEXT NOT NULL, request_hash TEXT NOT NULL, "
+                "created_at REAL NOT NULL);"
+                "CREATE INDEX IF NOT EXISTS idempotency_keys_created_at ON idempotency_keys (created_at);"
+            )
+
+    @classmethod
+    def from_env(cls) -> "SQLiteIdempotencyKeys":
+        """Create keys stored next to the jobs of the SQLite job store."""
+        return cls(os.environ.get('JOB_STORE_PATH') or data_path('jobs.db'))
+
+    async def get(self, key: str) -> Optional[Tuple[str, str]]:
+        """Return (booking_id, request hash) stored for a key, or None."""
+        return await asyncio.to_thread(self._get, key)
+
+    def _get(self, key: str) -> Optional[Tuple[str, str]]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT booking_id, request_hash FROM idempotency_keys WHERE key = ? AND created_at > ?",
+                (key, time.time() - self.ttl)
+            ).fetchone()
+        return tuple(row) if row else None
+
+    async def claim(self, key: str, booking_id: str, request_hash: str) -> Optional[Tuple[str, str]]:
+        """
+        Remember the booking created for a key, unless the key is already taken.
+
+        Returns:
+            tuple: (booking_id, request hash) of the booking that holds the key, or None if it was claimed
+        """
+        return await asyncio.to_thread(self._claim, key, booking_id, request_hash)
+
+    def _claim(self, key: str, booking_id: str, request_hash: str) -> Optional[Tuple[str, str]]:
+        now = time.time()
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._connection.execute("DELETE FROM idempotency_keys WHERE created_at <= ?", (now - self.ttl,))
+                claimed = self._connection.execute(
+                    "INSERT OR IGNORE INTO idempotency_keys (key, booking_id, request_hash, created_at) "
+                    "VALUES (?, ?, ?, ?)", (key, booking_id, request_hash, now)
+                ).rowcount
+                row = None if claimed else self._connection.execute(
+                    "SELECT booking_id, request_hash FROM idempotency_keys WHERE key = ?", (key,)
+                ).fetchone()
+                self._connection.execute("COMMIT")
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+        return tuple(row) if row else None
+
+    async def discard(self, key: str):
+        """Forget a key, e.g. because its request was rejected."""
+        await asyncio.to_thread(self._discard, key)
+
+    def _discard(self, key: str):
+        with self._lock:
+            self._connection.execute("DELETE FROM idempotency_keys WHERE key = ?", (key,))
+
+    def stats(self) -> dict:
+        """Return the number of stored keys and replayed requests for monitoring."""
+        with self._lock:
+            keys = self._connection.execute("SELECT COUNT(*) FROM idempotency_keys").fetchone()[0]
+        return {"backend": "sqlite", "keys": keys, "replayed": self.replayed}
+
+
+def create_idempotency_keys():
+    """Keep idempotency keys where the jobs are: in the SQLite job store database if JOB_STORE is sqlite."""
+    if os.environ.get('JOB_STORE', 'memory').lower() == 'sqlite':
+        return SQLiteIdempotencyKeys.from_env()
+    return IdempotencyKeys()
+
+
+class InFlightRequests:
+    """
+    Coalesces identical requests while the first of them is running.
+
+    The first booking for a request hash becomes the leader and is processed;
+    identical bookings submitted before it finishes join it as followers and
+    receive its result instead of starting their own agent run.
+    """
+
+    def __init__(self):
+        self._leaders: Dict[str, str] = {}
+        self._followers: Dict[str, List[str]] = {}
+        self.coalesced = 0
+
+    def join(self, request_hash: str, booking_id: str) -> Optional[str]:
+        """
+        Register a booking for a request hash.
+
+        Returns:
+            str: The booking ID of the leader the booking joined, or None if the
+                booking became the leader and must be processed
+        """
+        leader = self._leaders.get(request_hash)
+        if leader is None:
+            self._leaders[request_hash] = booking_id
+            self._followers[request_hash] = []
+            return None
+        self._followers[request_hash].append(booking_id)
+        self.coalesced += 1
+        return leader
+
+    def finish(self, request_hash: str) -> List[str]:
+        """Close a request hash when its leader is done and return the followers to notify."""
+        self._leaders.pop(request_hash, None)
+        return self._followers.pop(request_hash, [])
+
+    def stats(self) -> dict:
+        """Return the number of running leaders and coalesced bookings for monitoring."""
+        return {
+            "in_flight": len(self._leaders),
+            "waiting_followers": sum(len(followers) for followers in self._followers.values()),
+            "coalesced": self.coalesced
+        }
@@ -0,0 +1,101 @@
+import os
+import time
+import threading
+from typing import Optional
+
+# Crockford's base32 alphabet; it sorts in the same order as the values it encodes
+ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+PREFIX = "booking_"
+BATCH_PREFIX = "batch_"
+
+_RANDOM_BITS = 80
+_RANDOM_MAX = (1 << _RANDOM_BITS) - 1
+_ULID_LENGTH = 26
+
+
+def _encode(value: int) -> str:
+    chars = []
+    for _ in range(_ULID_LENGTH):
+        value, index = divmod(value, 32)
+        chars.append(ALPHABET[index])
+    return "".join(reversed(chars))
+
+
+def _decode(text: str) -> int:
+    value = 0
+    for char in text.upper():
+        value = value * 32 + ALPHABET.index(char)
+    return value
+
+
+class MonotonicULID:
+    """
+    Generator of ULIDs: a 48-bit millisecond timestamp followed by 80 random bits.
+
+    IDs created within the same millisecond reuse the timestamp and increment
+    the random part, so IDs from one process are strictly increasing even when
+    many are created at once, and sort by creation time as plain strings.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last_ms = 0
+        self._last_random = 0
+
+    def new(self) -> str:
+        with self._lock:
+            now_ms = time.time_ns() // 1_000_000
+            if now_ms > self._last_ms:
+                self._last_ms = now_ms
+                self._last_random = int.from_bytes(os.urandom(10), "big")
+            elif self._last_random < _RANDOM_MAX:
+                # Same millisecond (or the clock went back): keep the order by incrementing
+                self._last_random += 1
+            else:
+                self._last_ms += 1
+                self._last_random = int.from_bytes(os.urandom(10), "big")
+            return _encode((self._last_ms << _RANDOM_BITS) | self._last_random)
+
+
+_generator = MonotonicULID()
+
+
+def new_booking_id() -> str:
+    """Return a new unique booking ID that sorts after every ID created before it."""
+    return PREFIX + _generator.new()
+
+
+def new_batch_id() -> str:
+    """Return a new unique, time-sortable ID for a batch of bookings."""
+    return BATCH_PREFIX + _generator.new()
+
+
+def booking_id_time(booking_id: str) -> Optional[float]:
+    """
+    Return the creation time of a booking ID as a Unix timestamp.
+
+    Returns:
+        float: Seconds since the epoch, or None if the ID is not a ULID booking ID
+    """
+    ulid = booking_id[len(PREFIX):] if booking_id.startswith(PREFIX) else ""
+    if len(ulid) != _ULID_LENGTH or any(char not in ALPHABET for char in ulid.upper()):
+        return None
+    return (_decode(ulid) >> _RANDOM_BITS) / 1000.0
+
+
+def booking_id_bound(timestamp: float, upper: bool = False) -> str:
+    """
+    Return the lowest (or highest) booking ID that can be created at a given time.
+
+    All IDs created at or after timestamp compare greater than or equal to the
+    lower bound, so time ranges can be scanned as ID ranges on an ordered index.
+
+    Args:
+        timestamp: Unix timestamp in seconds
+        upper: Return the highest ID of that millisecond instead of the lowest
+
+    Returns:
+        str: The bounding booking ID
+    """
+    ms = max(int(timestamp * 1000), 0)
+    return PREFIX + _encode((ms << _RANDOM_BITS) | (_RANDOM_MAX if upper else 0))
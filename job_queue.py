@@ -0,0 +1,207 @@
+import os
+import math
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at its maximum depth."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Booking queue is full")
+        self.retry_after = retry_after
+
+
+class QueuedJob:
+    """A job waiting in the BookingQueue."""
+
+    __slots__ = ("job_id", "kwargs", "group", "enqueued_at")
+
+    def __init__(self, job_id: str, kwargs: Dict[str, Any], group: Optional[str] = None):
+        self.job_id = job_id
+        self.kwargs = kwargs
+        self.group = group
+        self.enqueued_at = time.monotonic()
+
+
+class BookingQueue:
+    """
+    Bounded FIFO job queue drained by a fixed number of asyncio workers.
+
+    Submissions beyond max_depth are rejected with QueueFullError instead of
+    starting more browsers and agents than the host can handle. The queue keeps
+    a moving average of job durations to estimate when a waiting job will start.
+    Jobs can be submitted as a group with a concurrency limit; workers skip
+    queued jobs of a group that already runs its maximum number of jobs.
+    """
+
+    def __init__(self, handler: Callable[..., Awaitable[Any]], workers: int = 2, max_depth: int = 100,
+                 expected_duration: float = 60.0):
+        if workers < 1 or max_depth < 1:
+            raise ValueError("Booking queue requires at least one worker and a positive max_depth")
+        self.handler = handler
+        self.workers = workers
+        self.max_depth = max_depth
+        self.avg_duration = expected_duration
+        self._jobs: deque = deque()
+        self._running = 0
+        self._group_limits: Dict[str, int] = {}
+        self._group_running: Dict[str, int] = {}
+        self._condition = asyncio.Condition()
+        self._worker_tasks: List[asyncio.Task] = []
+
+    @classmethod
+    def from_env(cls, handler: Callable[..., Awaitable[Any]]) -> "BookingQueue":
+        """Create a queue configured from BOOKING_* environment variables."""
+        return cls(
+            handler,
+            workers=int(os.environ.get('BOOKING_WORKERS', '2')),
+            max_depth=int(os.environ.get('BOOKING_QUEUE_MAX_DEPTH', '100')),
+            expected_duration=float(os.environ.get('BOOKING_EXPECTED_DURATION', '60'))
+        )
+
+    async def start(self):
+        """Start the worker tasks."""
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def close(self):
+        """Stop the workers; jobs still waiting in the queue are dropped."""
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+
+    async def submit(self, job_id: str, **kwargs) -> int:
+        """
+        Add a job to the end of the queue.
+
+        Args:
+            job_id: Identifier used to look up the job's queue position
+            **kwargs: Keyword arguments passed to the handler
+
+        Returns:
+            int: 1-based position of the job in the queue
+
+        Raises:
+            QueueFullError: If the queue is at its maximum depth
+        """
+        async with self._condition:
+            if len(self._jobs) >= self.max_depth:
+                raise QueueFullError(self.retry_after())
+            self._jobs.append(QueuedJob(job_id, kwargs))
+            self._condition.notify()
+            return len(self._jobs)
+
+    async def submit_many(self, jobs: List[Tuple[str, Dict[str, Any]]], group: Optional[str] = None,
+                          group_limit: Optional[int] = None, allow_partial: bool = False) -> List[int]:
+        """
+        Add several jobs to the end of the queue in one step.
+
+        Admission is atomic: either every job is queued, or (with allow_partial)
+        as many as fit are queued in order and the rest are left to the caller.
+
+        Args:
+            jobs: (job_id, handler keyword arguments) pairs
+            group: Name of the group the jobs belong to
+            group_limit: Maximum number of jobs of the group running at the same time
+            allow_partial: Queue the jobs that fit instead of rejecting all of them
+
+        Returns:
+            list: 1-based queue positions of the queued jobs, in submission order;
+                jobs beyond its length were not queued
+
+        Raises:
+            QueueFullError: If not all jobs fit and allow_partial is False, or none fit
+        """
+        async with self._condition:
+            free = self.max_depth - len(self._jobs)
+            if free <= 0 or (free < len(jobs) and not allow_partial):
+                raise QueueFullError(self.retry_after())
+            if group is not None and group_limit is not None:
+                self._group_limits[group] = group_limit
+            positions = []
+            for job_id, kwargs in jobs[:free]:
+                self._jobs.append(QueuedJob(job_id, kwargs, group))
+                positions.append(len(self._jobs))
+            self._condition.notify(len(positions))
+            return positions
+
+    def position(self, job_id: str) -> Optional[int]:
+        """Return the 1-based queue position of a job, or None if it is not waiting."""
+        for index, job in enumerate(self._jobs):
+            if job.job_id == job_id:
+                return index + 1
+        return None
+
+    def estimated_wait(self, position: int) -> float:
+        """Estimate the seconds until the job at the given position starts."""
+        free_workers = self.workers - self._running
+        if position <= free_workers:
+            return 0.0
+        rounds = math.ceil((position - max(free_workers, 0)) / self.workers)
+        return rounds * self.avg_duration
+
+    def retry_after(self) -> int:
+        """Suggest how many seconds a rejected client should wait before retrying."""
+        return max(1, math.ceil(self.avg_duration / self.workers))
+
+    def stats(self) -> dict:
+        """Return the current queue utilization for monitoring."""
+        return {
+            "queued": len(self._jobs),
+            "running": self._running,
+            "workers": self.workers,
+            "max_depth": self.max_depth,
+            "limited_groups": len(self._group_limits),
+            "avg_duration": round(self.avg_duration, 2)
+        }
+
+    def _take_job(self) -> Optional[QueuedJob]:
+        # The oldest job whose group is below its concurrency limit
+        for index, job in enumerate(self._jobs):
+            limit = self._group_limits.get(job.group)
+            if limit is None or self._group_running.get(job.group, 0) < limit:
+                del self._jobs[index]
+                return job
+        return None
+
+    async def _release(self, job: QueuedJob):
+        async with self._condition:
+            self._running -= 1
+            if job.group is None:
+                return
+            self._group_running[job.group] -= 1
+            if not self._group_running[job.group]:
+                del self._group_running[job.group]
+                if not any(queued.group == job.group for queued in self._jobs):
+                    self._group_limits.pop(job.group, None)
+            # A job of the group may have been skipped while it was saturated
+            self._condition.notify_all()
+
+    async def _worker(self):
+        while True:
+            async with self._condition:
+                job = self._take_job()
+                while job is None:
+                    await self._condition.wait()
+                    job = self._take_job()
+                self._running += 1
+                if job.group is not None:
+                    self._group_running[job.group] = self._group_running.get(job.group, 0) + 1
+
+            started = time.monotonic()
+            try:
+                await self.handler(job.job_id, **job.kwargs)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Job {job.job_id} failed in worker: {e}")
+            finally:
+                # Exponential moving average keeps the estimate responsive to load changes
+                self.avg_duration = 0.8 * self.avg_duration + 0.2 * (time.monotonic() - started)
+                await self._release(job)
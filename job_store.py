@@ -0,0 +1,606 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import sqlite3
+import threading
+import uuid
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set
+from ids import booking_id_bound
+from storage import data_path
+
+logger = logging.getLogger(__name__)
+
+# Jobs in these states are finished and may be evicted
+TERMINAL_STATUSES = ("completed", "failed")
+# Message of the jobs that were still running when their process stopped
+INTERRUPTED_MESSAGE = "Operation failed: interrupted as the server process stopped"
+
+# Called with the jobs found interrupted, so their callbacks can be sent
+InterruptedHandler = Callable[[List["JobRecord"]], Awaitable[None]]
+
+
+@dataclass(slots=True)
+class JobRecord:
+    """State of one booking job."""
+
+    booking_id: str
+    status: str
+    message: str
+    request: dict
+    result: Optional[str] = None
+    usage: Optional[dict] = None
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+    # Incremented on every update, so clients can wait for the next change
+    version: int = 1
+
+    def details(self) -> dict:
+        """Return the request parameters together with the result, as reported by the API."""
+        details = dict(self.request)
+        if self.result is not None:
+            details["result"] = self.result
+        if self.usage is not None:
+            details["usage"] = self.usage
+        return details
+
+
+class MemoryJobStore:
+    """
+    In-memory job store with size- and age-based eviction.
+
+    Records are kept in creation order, so the oldest finished jobs are evicted
+    first once the store holds max_size jobs or a job is older than ttl seconds.
+    Jobs that are still pending or processing are never evicted. The IDs of
+    evicted jobs are remembered (up to a bound) so lookups can tell "expired"
+    apart from "never existed". Sorted lists of the booking IDs, overall and
+    per status, serve listings with binary searches instead of scans.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 24 * 3600, max_tombstones: int = 100000):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_tombstones = max_tombstones
+        self._records: "OrderedDict[str, JobRecord]" = OrderedDict()
+        self._tombstones: "OrderedDict[str, None]" = OrderedDict()
+        # Sorted booking IDs of all jobs (key None) and of the jobs in each status
+        self._index: Dict[Optional[str], List[str]] = {None: []}
+        self.evicted_by_size = 0
+        self.evicted_by_age = 0
+
+    @classmethod
+    def from_env(cls) -> "MemoryJobStore":
+        """Create a store configured from JOB_STORE_* environment variables."""
+        return cls(
+            max_size=int(os.environ.get('JOB_STORE_MAX_SIZE', '10000')),
+            ttl=float(os.environ.get('JOB_STORE_TTL', str(24 * 3600)))
+        )
+
+    async def start(self, on_interrupted: Optional[InterruptedHandler] = None):
+        """Nothing to start, as in-memory jobs do not survive a restart; present for interface parity."""
+
+    async def close(self):
+        """Nothing to close; present for interface parity with SQLiteJobStore."""
+
+    def create(self, record: JobRecord):
+        """Add a new job, evicting old finished jobs if the store is full."""
+        self._records[record.booking_id] = record
+        self._index_add(None, record.booking_id)
+        self._index_add(record.status, record.booking_id)
+        self._evict()
+
+    def get(self, booking_id: str) -> Optional[JobRecord]:
+        """Return a job, or None if it is unknown or has been evicted."""
+        self._evict_expired()
+        return self._records.get(booking_id)
+
+    def update(self, booking_id: str, **fields):
+        """Update fields of a job; updates of evicted jobs are ignored."""
+        record = self._records.get(booking_id)
+        if record is None:
+            return
+        if "status" in fields and fields["status"] != record.status:
+            self._index_remove(record.status, booking_id)
+            self._index_add(fields["status"], booking_id)
+        for name, value in fields.items():
+            setattr(record, name, value)
+        record.updated_at = time.time()
+        record.version += 1
+
+    def delete(self, booking_id: str):
+        """Remove a job without remembering it as expired."""
+        record = self._records.pop(booking_id, None)
+        if record is not None:
+            self._unindex(record)
+
+    def get_many(self, booking_ids: Iterable[str]) -> Dict[str, JobRecord]:
+        """Return the known jobs among the given IDs, keyed by booking ID."""
+        self._evict_expired()
+        return {booking_id: self._records[booking_id] for booking_id in booking_ids if booking_id in self._records}
+
+    def is_expired(self, booking_id: str) -> bool:
+        """Tell whether a job existed but has been evicted."""
+        return booking_id in self._tombstones
+
+    def list_recent(self, limit: int = 100, since: Optional[float] = None, status: Optional[str] = None,
+                    before: Optional[str] = None) -> List[JobRecord]:
+        """
+        Return the most recently created jobs, newest first.
+
+        Booking IDs sort by creation time, so the range is found with binary
+        searches in the sorted ID list of the requested status.
+
+        Args:
+            limit: Maximum number of jobs to return
+            since: Only return jobs created at or after this Unix timestamp
+            status: Only return jobs in this status
+            before: Only return jobs whose booking ID sorts before this one (a pagination cursor)
+
+        Returns:
+            list: The matching JobRecords
+        """
+        self._evict_expired()
+        booking_ids = self._index.get(status, [])
+        low = bisect_left(booking_ids, booking_id_bound(since)) if since is not None else 0
+        high = bisect_left(booking_ids, before) if before is not None else len(booking_ids)
+        return [self._records[booking_id] for booking_id in reversed(booking_ids[max(low, high - limit):high])]
+
+    def _index_add(self, key: Optional[str], booking_id: str):
+        booking_ids = self._index.setdefault(key, [])
+        # New IDs are the largest so far, so this is usually an append
+        if not booking_ids or booking_ids[-1] < booking_id:
+            booking_ids.append(booking_id)
+        else:
+            insort(booking_ids, booking_id)
+
+    def _index_remove(self, key: Optional[str], booking_id: str):
+        booking_ids = self._index.get(key, [])
+        position = bisect_left(booking_ids, booking_id)
+        if position < len(booking_ids) and booking_ids[position] == booking_id:
+            del booking_ids[position]
+
+    def _unindex(self, record: JobRecord):
+        self._index_remove(None, record.booking_id)
+        self._index_remove(record.status, record.booking_id)
+
+    def _remove(self, booking_id: str):
+        self._unindex(self._records.pop(booking_id))
+        self._tombstones[booking_id] = None
+        if len(self._tombstones) > self.max_tombstones:
+            self._tombstones.popitem(last=False)
+
+    def _evict_expired(self):
+        cutoff = time.time() - self.ttl
+        # The oldest jobs are at the front; stop at the first one that is young
+        # enough, skipping the ones still running (they are evicted once finished)
+        expired = []
+        for booking_id, record in self._records.items():
+            if record.created_at > cutoff:
+                break
+            if record.status in TERMINAL_STATUSES:
+                expired.append(booking_id)
+        for booking_id in expired:
+            self._remove(booking_id)
+        self.evicted_by_age += len(expired)
+
+    def _evict(self):
+        self._evict_expired()
+        excess = len(self._records) - self.max_size
+        if excess <= 0:
+            return
+        victims = []
+        for booking_id, record in self._records.items():
+            if record.status in TERMINAL_STATUSES:
+                victims.append(booking_id)
+                if len(victims) == excess:
+                    break
+        for booking_id in victims:
+            self._remove(booking_id)
+        self.evicted_by_size += len(victims)
+
+    def stats(self) -> dict:
+        """Return the store size and eviction counters for monitoring."""
+        return {
+            "backend": "memory",
+            "size": len(self._records),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "evicted_by_size": self.evicted_by_size,
+            "evicted_by_age": self.evicted_by_age
+        }
+
+
+# Columns of the jobs table, in the order of the JobRecord fields
+COLUMNS = "booking_id, status, message, request, result, usage, created_at, updated_at, version"
+# Writes a job together with its owner; a row another process failed as
+# interrupted (owner cleared) is not overwritten by its former owner
+UPSERT = (
+    f"INSERT INTO jobs ({COLUMNS}, owner) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT (booking_id) DO UPDATE SET "
+    + ", ".join(f"{column} = excluded.{column}" for column in COLUMNS.split(", ")[1:])
+    + " WHERE jobs.owner IS excluded.owner"
+)
+
+
+class SQLiteJobStore:
+    """
+    Persistent job store in a SQLite database in WAL mode.
+
+    Jobs survive restarts and are visible to every uvicorn worker on the host.
+    Writes are buffered in memory and flushed in a single transaction every
+    flush_interval seconds from a worker thread, so status transitions never
+    block the event loop on disk I/O. Point reads look at the write buffer
+    first and otherwise hit the primary key index; WAL lets them run
+    concurrently with a flush. Listings are range scans of the primary key, or
+    of the (status, booking_id) index when filtered by status. Finished jobs
+    are evicted by size and age as in MemoryJobStore, and their IDs are kept
+    in a table of expired jobs.
+
+    Each store owns the jobs it writes and renews a lease on them with a
+    heartbeat every lease / 3 seconds. Unfinished jobs whose owner stopped
+    renewing its lease, because its process exited or crashed, are failed
+    by whichever process notices first.
+    """
+
+    def __init__(self, path: str, max_size: int = 10000, ttl: float = 24 * 3600,
+                 flush_interval: float = 0.05, purge_interval: float = 60.0, lease: float = 30.0):
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.purge_interval = purge_interval
+        self.lease = lease
+        self.owner = uuid.uuid4().hex
+        self._on_interrupted: Optional[InterruptedHandler] = None
+        self._last_heartbeat = 0.0
+        self.interrupted = 0
+        self._pending: Dict[str, JobRecord] = {}
+        self._flushing: Dict[str, JobRecord] = {}
+        self._deleted: Set[str] = set()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._last_purge = 0.0
+        self.flushes = 0
+        self.rows_written = 0
+        self.evicted_by_size = 0
+        self.evicted_by_age = 0
+        # Reads run on the event loop thread, writes on a worker thread; WAL
+        # lets each use its own connection without blocking the other
+        self._reader = self._connect()
+        self._writer = self._connect(check_same_thread=False)
+        self._write_lock = threading.Lock()
+        with self._write_lock:
+            self._writer.executescript(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "booking_id TEXT PRIMARY KEY, status TEXT NOT NULL, message TEXT, request TEXT, "
+                "result TEXT, usage TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL, "
+                "version INTEGER NOT NULL DEFAULT 1);"
+                "DROP INDEX IF EXISTS jobs_status;"
+                "CREATE INDEX IF NOT EXISTS jobs_status_booking_id ON jobs (status, booking_id);"
+                "CREATE INDEX IF NOT EXISTS jobs_created_at ON jobs (created_at);"
+                "CREATE TABLE IF NOT EXISTS expired_jobs (booking_id TEXT PRIMARY KEY, expired_at REAL NOT NULL);"
+                "CREATE TABLE IF NOT EXISTS job_owners (owner TEXT PRIMARY KEY, heartbeat_at REAL NOT NULL);"
+            )
+            # Databases created before jobs were versioned or owned lack the columns
+            columns = [row[1] for row in self._writer.execute("PRAGMA table_info(jobs)")]
+            if "version" not in columns:
+                self._writer.execute("ALTER TABLE jobs ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+            if "owner" not in columns:
+                self._writer.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+
+    @classmethod
+    def from_env(cls) -> "SQLiteJobStore":
+        """Create a store configured from JOB_STORE_* environment variables."""
+        return cls(
+            path=os.environ.get('JOB_STORE_PATH') or data_path('jobs.db'),
+            max_size=int(os.environ.get('JOB_STORE_MAX_SIZE', '10000')),
+            ttl=float(os.environ.get('JOB_STORE_TTL', str(24 * 3600))),
+            flush_interval=float(os.environ.get('JOB_STORE_FLUSH_INTERVAL', '0.05')),
+            lease=float(os.environ.get('JOB_STORE_LEASE', '30'))
+        )
+
+    def _connect(self, check_same_thread: bool = True) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=30, check_same_thread=check_same_thread,
+                                     isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        # With WAL, NORMAL only risks the last transactions on power loss, not corruption
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    async def start(self, on_interrupted: Optional[InterruptedHandler] = None):
+        """
+        Take a lease as a job owner, then start flushing buffered writes and renewing the lease.
+
+        Jobs still pending or processing whose owner's lease has run out lost
+        their worker; they would otherwise report their status forever and
+        never be evicted. They are failed now and whenever a heartbeat finds
+        more of them.
+
+        Args:
+            on_interrupted: Called with the jobs failed as interrupted
+        """
+        self._on_interrupted = on_interrupted
+        await self._heartbeat()
+        self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def _heartbeat(self):
+        self._last_heartbeat = time.time()
+        interrupted = await asyncio.to_thread(self._renew_lease)
+        if interrupted:
+            logger.warning(f"Marked {len(interrupted)} jobs of stopped processes as failed")
+            self.interrupted += len(interrupted)
+            if self._on_interrupted is not None:
+                await self._on_interrupted(interrupted)
+
+    def _renew_lease(self) -> List[JobRecord]:
+        terminal = ",".join("?" * len(TERMINAL_STATUSES))
+        now = time.time()
+        with self._write_lock:
+            self._writer.execute("BEGIN IMMEDIATE")
+            try:
+                self._writer.execute("INSERT OR REPLACE INTO job_owners (owner, heartbeat_at) VALUES (?, ?)",
+                                     (self.owner, now))
+                self._writer.execute("DELETE FROM job_owners WHERE heartbeat_at <= ?", (now - self.lease,))
+                rows = self._writer.execute(
+                    f"SELECT {COLUMNS} FROM jobs WHERE status NOT IN ({terminal}) "
+                    "AND (owner IS NULL OR owner NOT IN (SELECT owner FROM job_owners))", TERMINAL_STATUSES
+                ).fetchall()
+                records = [self._from_row(row) for row in rows]
+                for record in records:
+                    record.status = "failed"
+                    record.message = INTERRUPTED_MESSAGE
+                    record.updated_at = now
+                    record.version += 1
+                # Clearing the owner keeps a stalled owner from overwriting the failure
+                self._writer.executemany(
+                    f"INSERT OR REPLACE INTO jobs ({COLUMNS}, owner) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(*self._to_row(record), None) for record in records]
+                )
+                self._writer.execute("COMMIT")
+            except Exception:
+                self._writer.execute("ROLLBACK")
+                raise
+        return records
+
+    def _release_lease(self):
+        with self._write_lock:
+            self._writer.execute("DELETE FROM job_owners WHERE owner = ?", (self.owner,))
+
+    async def close(self):
+        """Flush the remaining writes and close the database."""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+        # Jobs left unfinished are failed by the next process that renews its lease
+        await asyncio.to_thread(self._release_lease)
+        self._reader.close()
+        self._writer.close()
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing job store: {str(e)}")
+            if time.time() - self._last_heartbeat >= self.lease / 3:
+                try:
+                    await self._heartbeat()
+                except Exception as e:
+                    logger.error(f"Error renewing job store lease: {str(e)}")
+
+    async def flush(self):
+        """Write all buffered changes to the database in one transaction."""
+        # The buffers are swapped on the event loop thread; the batch stays
+        # readable through _flushing until it is committed
+        self._flushing, self._pending = self._pending, {}
+        deleted, self._deleted = self._deleted, set()
+        try:
+            await asyncio.to_thread(self._flush, self._flushing, deleted)
+        except Exception:
+            # Put the batch back so it is retried on the next flush
+            self._pending = {**self._flushing, **self._pending}
+            self._deleted |= deleted - self._pending.keys()
+            raise
+        finally:
+            self._flushing = {}
+
+    def _flush(self, records: Dict[str, JobRecord], deleted: Set[str]):
+        with self._write_lock:
+            if records or deleted:
+                self._write(records, deleted)
+                self.flushes += 1
+                self.rows_written += len(records)
+            if time.time() - self._last_purge >= self.purge_interval:
+                self._purge()
+                self._last_purge = time.time()
+
+    def _write(self, records: Dict[str, JobRecord], deleted: Set[str]):
+        self._writer.execute("BEGIN IMMEDIATE")
+        try:
+            self._writer.executemany(UPSERT, [(*self._to_row(record), self.owner) for record in records.values()])
+            self._writer.executemany("DELETE FROM jobs WHERE booking_id = ?",
+                                     [(booking_id,) for booking_id in deleted])
+            self._writer.execute("COMMIT")
+        except Exception:
+            self._writer.execute("ROLLBACK")
+            raise
+
+    def _purge(self):
+        now = time.time()
+        terminal = ",".join("?" * len(TERMINAL_STATUSES))
+        self._writer.execute("BEGIN IMMEDIATE")
+        try:
+            by_age = self._expire(
+                f"SELECT booking_id FROM jobs WHERE status IN ({terminal}) AND created_at <= ?",
+                (*TERMINAL_STATUSES, now - self.ttl), now
+            )
+            excess = self._writer.execute("SELECT COUNT(*) FROM jobs").fetchone()[0] - self.max_size
+            by_size = 0
+            if excess > 0:
+                by_size = self._expire(
+                    f"SELECT booking_id FROM jobs WHERE status IN ({terminal}) ORDER BY created_at LIMIT ?",
+                    (*TERMINAL_STATUSES, excess), now
+                )
+            # Expired IDs only need to be remembered for as long as clients may still poll them
+            self._writer.execute("DELETE FROM expired_jobs WHERE expired_at <= ?", (now - self.ttl,))
+            self._writer.execute("COMMIT")
+        except Exception:
+            self._writer.execute("ROLLBACK")
+            raise
+        self.evicted_by_age += by_age
+        self.evicted_by_size += by_size
+
+    def _expire(self, select: str, parameters: tuple, now: float) -> int:
+        booking_ids = [row[0] for row in self._writer.execute(select, parameters).fetchall()]
+        self._writer.executemany("INSERT OR REPLACE INTO expired_jobs (booking_id, expired_at) VALUES (?, ?)",
+                                 [(booking_id, now) for booking_id in booking_ids])
+        self._writer.executemany("DELETE FROM jobs WHERE booking_id = ?",
+                                 [(booking_id,) for booking_id in booking_ids])
+        return len(booking_ids)
+
+    @staticmethod
+    def _to_row(record: JobRecord) -> tuple:
+        return (record.booking_id, record.status, record.message, json.dumps(record.request),
+                record.result, json.dumps(record.usage) if record.usage is not None else None,
+                record.created_at, record.updated_at, record.version)
+
+    @staticmethod
+    def _from_row(row: tuple) -> JobRecord:
+        booking_id, status, message, request, result, usage, created_at, updated_at, version = row
+        return JobRecord(booking_id=booking_id, status=status, message=message,
+                         request=json.loads(request) if request else {}, result=result,
+                         usage=json.loads(usage) if usage else None,
+                         created_at=created_at, updated_at=updated_at, version=version)
+
+    def create(self, record: JobRecord):
+        """Add a new job; it is written to disk with the next flush."""
+        self._deleted.discard(record.booking_id)
+        self._pending[record.booking_id] = record
+
+    def get(self, booking_id: str) -> Optional[JobRecord]:
+        """Return a job, or None if it is unknown or has been evicted."""
+        record = self._pending.get(booking_id) or self._flushing.get(booking_id)
+        if record is not None:
+            return record
+        if booking_id in self._deleted:
+            return None
+        row = self._reader.execute(
+            f"SELECT {COLUMNS} FROM jobs WHERE booking_id = ?", (booking_id,)
+        ).fetchone()
+        return self._from_row(row) if row else None
+
+    def update(self, booking_id: str, **fields):
+        """Update fields of a job; updates of evicted jobs are ignored."""
+        record = self.get(booking_id)
+        if record is None:
+            return
+        for name, value in fields.items():
+            setattr(record, name, value)
+        record.updated_at = time.time()
+        record.version += 1
+        self._pending[booking_id] = record
+
+    def delete(self, booking_id: str):
+        """Remove a job without remembering it as expired."""
+        self._pending.pop(booking_id, None)
+        self._deleted.add(booking_id)
+
+    def is_expired(self, booking_id: str) -> bool:
+        """Tell whether a job existed but has been evicted."""
+        return self._reader.execute(
+            "SELECT 1 FROM expired_jobs WHERE booking_id = ?", (booking_id,)
+        ).fetchone() is not None
+
+    def get_many(self, booking_ids: Iterable[str]) -> Dict[str, JobRecord]:
+        """Return the known jobs among the given IDs, keyed by booking ID."""
+        records = {}
+        missing = []
+        for booking_id in booking_ids:
+            record = self._pending.get(booking_id) or self._flushing.get(booking_id)
+            if record is not None:
+                records[booking_id] = record
+            elif booking_id not in self._deleted:
+                missing.append(booking_id)
+        # Stay well below SQLite's limit on the number of query parameters
+        for start in range(0, len(missing), 500):
+            chunk = missing[start:start + 500]
+            rows = self._reader.execute(
+                f"SELECT {COLUMNS} FROM jobs WHERE booking_id IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            records.update((row[0], self._from_row(row)) for row in rows)
+        return records
+
+    def list_recent(self, limit: int = 100, since: Optional[float] = None, status: Optional[str] = None,
+                    before: Optional[str] = None) -> List[JobRecord]:
+        """
+        Return the most recently created jobs, newest first.
+
+        Booking IDs sort by creation time, so this is a backwards range scan of
+        the primary key, or of the (status, booking_id) index when a status is
+        given. Buffered writes that have not been flushed yet are merged in.
+
+        Args:
+            limit: Maximum number of jobs to return
+            since: Only return jobs created at or after this Unix timestamp
+            status: Only return jobs in this status
+            before: Only return jobs whose booking ID sorts before this one (a pagination cursor)
+
+        Returns:
+            list: The matching JobRecords
+        """
+        lower = booking_id_bound(since) if since is not None else ""
+        conditions, parameters = ["booking_id >= ?"], [lower]
+        if status is not None:
+            conditions.append("status = ?")
+            parameters.append(status)
+        if before is not None:
+            conditions.append("booking_id < ?")
+            parameters.append(before)
+        # Buffered records may replace rows with ones in another status, so read enough extra rows
+        buffered = {**self._flushing, **self._pending}
+        rows = self._reader.execute(
+            f"SELECT {COLUMNS} FROM jobs WHERE {' AND '.join(conditions)} ORDER BY booking_id DESC LIMIT ?",
+            (*parameters, limit + len(buffered) + len(self._deleted))
+        ).fetchall()
+        records = {row[0]: self._from_row(row) for row in rows
+                   if row[0] not in self._deleted and row[0] not in buffered}
+        records.update(
+            (booking_id, record) for booking_id, record in buffered.items()
+            if booking_id >= lower and (before is None or booking_id < before)
+            and (status is None or record.status == status)
+        )
+        return [records[booking_id] for booking_id in sorted(records, reverse=True)[:limit]]
+
+    def stats(self) -> dict:
+        """Return the store size, write batching and eviction counters for monitoring."""
+        return {
+            "backend": "sqlite",
+            "size": self._reader.execute("SELECT COUNT(*) FROM jobs").fetchone()[0],
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "pending_writes": len(self._pending) + len(self._deleted),
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+            "evicted_by_size": self.evicted_by_size,
+            "evicted_by_age": self.evicted_by_age,
+            "interrupted": self.interrupted
+        }
+
+
+def create_job_store():
+    """Create the job store selected by JOB_STORE (memory or sqlite)."""
+    backend = os.environ.get('JOB_STORE', 'memory').lower()
+    if backend == 'sqlite':
+        return SQLiteJobStore.from_env()
+    if backend != 'memory':
+        raise ValueError(f"Unknown JOB_STORE backend: {backend}")
+    return MemoryJobStore.from_env()
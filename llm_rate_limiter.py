@@ -0,0 +1,273 @@
+import os
+import time
+import asyncio
+import logging
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+from langchain_core.callbacks import AsyncCallbackHandler
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import LLMResult
+from storage import data_path
+
+logger = logging.getLogger(__name__)
+
+# Default per-model budgets (requests/minute, tokens/minute) when not configured
+DEFAULT_LIMITS = {
+    "openai": (500, 30000),
+    "anthropic": (50, 40000)
+}
+
+# Rough token cost of one screenshot sent to the model
+IMAGE_TOKENS = 1000
+
+
+class LocalBuckets:
+    """In-process storage for token bucket levels."""
+
+    blocking = False
+
+    def __init__(self):
+        self._levels: Dict[str, Tuple[float, float, float]] = {}
+
+    def try_consume(self, key: str, rpm: int, tpm: int, tokens: int) -> float:
+        """
+        Take one request and the given tokens from the buckets of a key.
+
+        Returns:
+            float: 0 if the budget was consumed, otherwise the seconds to wait before retrying
+        """
+        now = time.monotonic()
+        requests_left, tokens_left, updated = self._levels.get(key, (rpm, tpm, now))
+        requests_left, tokens_left = _refill(requests_left, tokens_left, rpm, tpm, now - updated)
+        wait = _wait_time(requests_left, tokens_left, rpm, tpm, tokens)
+        if wait == 0:
+            requests_left -= 1
+            tokens_left -= tokens
+        self._levels[key] = (requests_left, tokens_left, now)
+        return wait
+
+    def adjust(self, key: str, tokens: int):
+        """Return (positive) or charge (negative) tokens after the real usage is known."""
+        if key in self._levels:
+            requests_left, tokens_left, updated = self._levels[key]
+            self._levels[key] = (requests_left, tokens_left + tokens, updated)
+
+    def levels(self, key: str, rpm: int, tpm: int) -> Tuple[float, float]:
+        requests_left, tokens_left, updated = self._levels.get(key, (rpm, tpm, time.monotonic()))
+        return _refill(requests_left, tokens_left, rpm, tpm, time.monotonic() - updated)
+
+
+class SQLiteBuckets:
+    """
+    Token bucket levels shared between processes through a SQLite file.
+
+    Every update runs in an immediate transaction, so uvicorn workers on the
+    same host draw from one budget per model.
+    """
+
+    blocking = True
+
+    def __init__(self, path: str):
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False,
+                                           isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS llm_buckets ("
+                "key TEXT PRIMARY KEY, requests REAL, tokens REAL, updated REAL)"
+            )
+
+    def _read(self, key: str, rpm: int, tpm: int, now: float) -> Tuple[float, float, float]:
+        row = self._connection.execute(
+            "SELECT requests, tokens, updated FROM llm_buckets WHERE key = ?", (key,)
+        ).fetchone()
+        return row if row else (rpm, tpm, now)
+
+    def try_consume(self, key: str, rpm: int, tpm: int, tokens: int) -> float:
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                # Wall-clock time, since the monotonic clock is not shared between processes
+                now = time.time()
+                requests_left, tokens_left, updated = self._read(key, rpm, tpm, now)
+                requests_left, tokens_left = _refill(requests_left, tokens_left, rpm, tpm, now - updated)
+                wait = _wait_time(requests_left, tokens_left, rpm, tpm, tokens)
+                if wait == 0:
+                    requests_left -= 1
+                    tokens_left -= tokens
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO llm_buckets (key, requests, tokens, updated) VALUES (?, ?, ?, ?)",
+                    (key, requests_left, tokens_left, now)
+                )
+                self._connection.execute("COMMIT")
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+        return wait
+
+    def adjust(self, key: str, tokens: int):
+        with self._lock:
+            self._connection.execute("UPDATE llm_buckets SET tokens = tokens + ? WHERE key = ?", (tokens, key))
+
+    def levels(self, key: str, rpm: int, tpm: int) -> Tuple[float, float]:
+        with self._lock:
+            now = time.time()
+            requests_left, tokens_left, updated = self._read(key, rpm, tpm, now)
+        return _refill(requests_left, tokens_left, rpm, tpm, now - updated)
+
+
+def _refill(requests_left: float, tokens_left: float, rpm: int, tpm: int, elapsed: float) -> Tuple[float, float]:
+    elapsed = max(elapsed, 0.0)
+    return (min(rpm, requests_left + elapsed * rpm / 60.0),
+            min(tpm, tokens_left + elapsed * tpm / 60.0))
+
+
+def _wait_time(requests_left: float, tokens_left: float, rpm: int, tpm: int, tokens: int) -> float:
+    # A request larger than the whole minute budget only waits for a full bucket
+    tokens = min(tokens, tpm)
+    request_wait = max(0.0, (1 - requests_left) * 60.0 / rpm)
+    token_wait = max(0.0, (tokens - tokens_left) * 60.0 / tpm)
+    return max(request_wait, token_wait)
+
+
+class ModelRateLimiter:
+    """
+    Requests/minute and tokens/minute budget for one provider and model.
+
+    Callers are served strictly in arrival order: the first waiter holds the
+    lock while it sleeps for budget, so later callers queue behind it instead
+    of racing for tokens and failing with 429s.
+    """
+
+    def __init__(self, key: str, rpm: int, tpm: int, buckets):
+        self.key = key
+        self.rpm = rpm
+        self.tpm = tpm
+        self._buckets = buckets
+        self._lock = asyncio.Lock()
+        self._waiting = 0
+        self.requests = 0
+        self.tokens = 0
+        self.wait_seconds = 0.0
+
+    async def acquire(self, tokens: int):
+        """Wait until one request with the estimated number of tokens fits in the budget."""
+        started = time.monotonic()
+        self._waiting += 1
+        try:
+            async with self._lock:
+                while True:
+                    wait = await self._call(self._buckets.try_consume, self.key, self.rpm, self.tpm, tokens)
+                    if wait == 0:
+                        break
+                    await asyncio.sleep(wait)
+        finally:
+            self._waiting -= 1
+        self.requests += 1
+        self.wait_seconds += time.monotonic() - started
+
+    async def settle(self, estimated: int, actual: int):
+        """Correct the token bucket once the real token usage of a request is known."""
+        self.tokens += actual
+        if actual != estimated:
+            await self._call(self._buckets.adjust, self.key, estimated - actual)
+
+    async def _call(self, method, *args):
+        # Shared buckets wait on a file lock, so keep them off the event loop
+        if self._buckets.blocking:
+            return await asyncio.to_thread(method, *args)
+        return method(*args)
+
+    def utilization(self) -> dict:
+        """Return the current budget usage of this model."""
+        requests_left, tokens_left = self._buckets.levels(self.key, self.rpm, self.tpm)
+        return {
+            "requests_per_minute": self.rpm,
+            "tokens_per_minute": self.tpm,
+            "request_utilization": round(1 - requests_left / self.rpm, 3),
+            "token_utilization": round(1 - tokens_left / self.tpm, 3),
+            "waiting": self._waiting,
+            "total_requests": self.requests,
+            "total_tokens": self.tokens,
+            "total_wait_seconds": round(self.wait_seconds, 2)
+        }
+
+
+def estimate_tokens(messages: List[BaseMessage]) -> int:
+    """Roughly estimate the prompt tokens of a list of messages (about 4 characters per token)."""
+    characters = 0
+    images = 0
+    for message in messages:
+        if isinstance(message.content, str):
+            characters += len(message.content)
+            continue
+        for part in message.content:
+            if isinstance(part, str):
+                characters += len(part)
+            elif part.get("type") == "image_url":
+                images += 1
+            else:
+                characters += len(str(part.get("text", "")))
+    return characters // 4 + images * IMAGE_TOKENS
+
+
+class RateLimitCallbackHandler(AsyncCallbackHandler):
+    """Callback that makes every call of a chat model wait for its rate limit budget."""
+
+    run_inline = True
+
+    def __init__(self, limiter: ModelRateLimiter):
+        self.limiter = limiter
+        self._estimates: Dict[UUID, int] = {}
+
+    async def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[BaseMessage]], *,
+                                  run_id: UUID, **kwargs: Any) -> None:
+        estimate = sum(estimate_tokens(batch) for batch in messages)
+        await self.limiter.acquire(estimate)
+        self._estimates[run_id] = estimate
+
+    async def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        estimate = self._estimates.pop(run_id, 0)
+        actual = 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    actual += usage.get("total_tokens", 0)
+        await self.limiter.settle(estimate, actual or estimate)
+
+    async def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._estimates.pop(run_id, None)
+
+
+class RateLimiterRegistry:
+    """Process-wide set of per-model limiters."""
+
+    def __init__(self, shared_path: Optional[str] = None):
+        self._buckets = SQLiteBuckets(shared_path) if shared_path else LocalBuckets()
+        self._limiters: Dict[str, ModelRateLimiter] = {}
+
+    @classmethod
+    def from_env(cls) -> "RateLimiterRegistry":
+        """Create a registry, sharing budgets between processes if LLM_RATE_LIMIT_SHARED is set."""
+        shared = os.environ.get('LLM_RATE_LIMIT_SHARED', 'false').lower() == 'true'
+        return cls(data_path('llm_rate_limits.db') if shared else None)
+
+    def get(self, provider: str, model: str) -> ModelRateLimiter:
+        """Return the limiter of a provider and model, configured from <PROVIDER>_RPM/<PROVIDER>_TPM."""
+        key = f"{provider}:{model}"
+        limiter = self._limiters.get(key)
+        if limiter is None:
+            default_rpm, default_tpm = DEFAULT_LIMITS.get(provider, DEFAULT_LIMITS["openai"])
+            rpm = int(os.environ.get(f'{provider.upper()}_RPM', str(default_rpm)))
+            tpm = int(os.environ.get(f'{provider.upper()}_TPM', str(default_tpm)))
+            limiter = ModelRateLimiter(key, rpm, tpm, self._buckets)
+            self._limiters[key] = limiter
+        return limiter
+
+    def utilization(self) -> dict:
+        """Return the utilization of every limiter in use."""
+        return {key: limiter.utilization() for key, limiter in self._limiters.items()}
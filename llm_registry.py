@@ -0,0 +1,148 @@
+import os
+import asyncio
+import logging
+from typing import Any, Dict, Iterable, Optional
+import httpx
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_openai import ChatOpenAI
+from langchain_anthropic import ChatAnthropic
+from llm_rate_limiter import RateLimiterRegistry, RateLimitCallbackHandler
+from llm_usage import UsageCallbackHandler
+
+logger = logging.getLogger(__name__)
+
+
+EPHEMERAL_CACHE = {"type": "ephemeral"}
+
+
+def provider_for(model: str) -> str:
+    """Return the LLM provider serving the given model name."""
+    return "openai" if model.startswith("gpt") else "anthropic"
+
+
+def _with_cache_control(content: Any) -> Any:
+    """Mark the last block of a message content as an Anthropic cache breakpoint."""
+    if isinstance(content, str):
+        return [{"type": "text", "text": content, "cache_control": EPHEMERAL_CACHE}] if content else content
+    if isinstance(content, list) and content and isinstance(content[-1], dict):
+        return content[:-1] + [{**content[-1], "cache_control": EPHEMERAL_CACHE}]
+    return content
+
+
+class PromptCachingChatAnthropic(ChatAnthropic):
+    """
+    ChatAnthropic that sets prompt cache breakpoints on every request.
+
+    The system prompt (which carries the static booking instructions) is cached
+    across jobs, and the message before the latest browser state is cached so
+    each agent step re-reads the previous steps from the cache.
+    """
+
+    def _get_request_payload(self, input_: Any, *, stop: Optional[list] = None, **kwargs: Any) -> dict:
+        payload = super()._get_request_payload(input_, stop=stop, **kwargs)
+        if payload.get("system"):
+            payload["system"] = _with_cache_control(payload["system"])
+        messages = payload.get("messages") or []
+        if len(messages) >= 2:
+            messages[-2] = {**messages[-2], "content": _with_cache_control(messages[-2]["content"])}
+        return payload
+
+
+class LLMRegistry:
+    """
+    Process-wide registry of chat model clients.
+
+    Each model is built once and reused by every booking, so its HTTP
+    connections (and TLS sessions) are kept alive between agent steps and
+    between jobs. OpenAI clients share one explicitly sized keep-alive pool;
+    Anthropic clients reuse the SDK's process-wide default pool. Every call
+    of a registered model waits for its provider rate limit budget first.
+    """
+
+    def __init__(self, max_connections: int = 20, keepalive_expiry: float = 60.0,
+                 rate_limiters: Optional[RateLimiterRegistry] = None):
+        self.max_connections = max_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.rate_limiters = rate_limiters or RateLimiterRegistry()
+        self._models: Dict[str, BaseChatModel] = {}
+        self._http_client: Optional[httpx.Client] = None
+        self._http_async_client: Optional[httpx.AsyncClient] = None
+
+    @classmethod
+    def from_env(cls) -> "LLMRegistry":
+        """Create a registry configured from LLM_* environment variables."""
+        return cls(
+            max_connections=int(os.environ.get('LLM_MAX_CONNECTIONS', '20')),
+            keepalive_expiry=float(os.environ.get('LLM_KEEPALIVE_EXPIRY', '60')),
+            rate_limiters=RateLimiterRegistry.from_env()
+        )
+
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(max_connections=self.max_connections,
+                            max_keepalive_connections=self.max_connections,
+                            keepalive_expiry=self.keepalive_expiry)
+
+    def _build(self, model: str) -> BaseChatModel:
+        provider = provider_for(model)
+        callbacks = [RateLimitCallbackHandler(self.rate_limiters.get(provider, model)), UsageCallbackHandler()]
+        if provider == "openai":
+            if self._http_async_client is None:
+                self._http_client = httpx.Client(limits=self._limits())
+                self._http_async_client = httpx.AsyncClient(limits=self._limits())
+            return ChatOpenAI(model=model, http_client=self._http_client,
+                              http_async_client=self._http_async_client, callbacks=callbacks)
+        if os.environ.get('ANTHROPIC_PROMPT_CACHING', 'true').lower() == 'true':
+            return PromptCachingChatAnthropic(model_name=model, callbacks=callbacks)
+        return ChatAnthropic(model_name=model, callbacks=callbacks)
+
+    def get(self, model: str) -> BaseChatModel:
+        """Return the shared client for a model, building it on first use."""
+        llm = self._models.get(model)
+        if llm is None:
+            llm = self._build(model)
+            self._models[model] = llm
+        return llm
+
+    async def _preconnect(self, model: str):
+        # Listing models is free and opens a pooled, authenticated connection
+        llm = self.get(model)
+        if isinstance(llm, ChatOpenAI):
+            await llm.root_async_client.models.list()
+        else:
+            await llm._async_client.models.list(limit=1)
+
+    async def preconnect(self, models: Iterable[str]):
+        """Open warm connections to the providers of the given models."""
+        models = list(models)
+        results = await asyncio.gather(*(self._preconnect(model) for model in models),
+                                       return_exceptions=True)
+        for model, result in zip(models, results):
+            if isinstance(result, Exception):
+                logger.warning(f"Could not pre-connect LLM {model}: {result}")
+            else:
+                logger.info(f"Pre-connected LLM {model}")
+
+    async def close(self):
+        """Close the shared HTTP connection pool."""
+        if self._http_async_client is not None:
+            await self._http_async_client.aclose()
+            self._http_client.close()
+            self._http_async_client = None
+            self._http_client = None
+        self._models.clear()
+
+
+_registry: Optional[LLMRegistry] = None
+
+
+def get_registry() -> LLMRegistry:
+    """Return the process-wide LLMRegistry, creating it on first use."""
+    global _registry
+    if _registry is None:
+        _registry = LLMRegistry.from_env()
+    return _registry
+
+
+def get_llm(model: str) -> BaseChatModel:
+    """Return the shared chat model client for a model name."""
+    return get_registry().get(model)
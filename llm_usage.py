@@ -0,0 +1,61 @@
+from contextvars import ContextVar
+from typing import Any, Optional
+from uuid import UUID
+from langchain_core.callbacks import AsyncCallbackHandler
+from langchain_core.outputs import LLMResult
+
+
+class LLMUsage:
+    """Token usage of the LLM calls made for one job, including prompt cache hits."""
+
+    __slots__ = ("calls", "input_tokens", "output_tokens", "cache_read_tokens", "cache_creation_tokens")
+
+    def __init__(self):
+        self.calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cache_read_tokens = 0
+        self.cache_creation_tokens = 0
+
+    def add(self, usage_metadata: dict):
+        details = usage_metadata.get("input_token_details") or {}
+        self.calls += 1
+        self.input_tokens += usage_metadata.get("input_tokens", 0)
+        self.output_tokens += usage_metadata.get("output_tokens", 0)
+        self.cache_read_tokens += details.get("cache_read", 0) or 0
+        self.cache_creation_tokens += details.get("cache_creation", 0) or 0
+
+    def as_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "cache_read_tokens": self.cache_read_tokens,
+            "cache_creation_tokens": self.cache_creation_tokens,
+            "cache_hit_ratio": round(self.cache_read_tokens / self.input_tokens, 3) if self.input_tokens else 0.0
+        }
+
+
+# Usage accumulator of the job running in the current asyncio task
+current_usage: ContextVar[Optional[LLMUsage]] = ContextVar("current_usage", default=None)
+
+
+class UsageCallbackHandler(AsyncCallbackHandler):
+    """
+    Callback that adds the token usage of every call to the current job.
+
+    Models are shared between jobs, so the job is found through the
+    current_usage context variable rather than stored on the handler.
+    """
+
+    run_inline = True
+
+    async def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        usage = current_usage.get()
+        if usage is None:
+            return
+        for generations in response.generations:
+            for generation in generations:
+                usage_metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage_metadata:
+                    usage.add(usage_metadata)
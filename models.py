@@ -0,0 +1,48 @@
+from typing import List, Optional
+from pydantic import BaseModel
+
+# Define the output format as Pydantic models
+class RestaurantDetails(BaseModel):
+    name: str
+    address: str
+    phone_number: Optional[str] = None
+    rating: Optional[float] = None
+    price_range: Optional[str] = None
+    cuisine_type: Optional[str] = None
+    popular_dishes: Optional[List[str]] = None
+    opening_hours: Optional[str] = None
+    # Location as shown by Google Maps, used to build the local restaurant catalog
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    maps_url: Optional[str] = None
+    # Page of the reservation provider, so later bookings can start on it
+    reservation_url: Optional[str] = None
+
+class BookingDetails(BaseModel):
+    confirmation_number: Optional[str] = None
+    date: str
+    time: str
+    party_size: int
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+    special_requests: Optional[str] = None
+    status: str = "confirmed"
+
+class SkippedRestaurant(BaseModel):
+    name: str
+    address: Optional[str] = None
+    # fully_booked, requires_prepayment or no_reservation
+    reason: str
+
+class BookingResult(BaseModel):
+    restaurant: RestaurantDetails
+    booking: Optional[BookingDetails] = None
+    additional_notes: Optional[str] = None
+    # Restaurants tried and left before the booked one, remembered as dead ends
+    skipped_restaurants: Optional[List[SkippedRestaurant]] = None
+
+class ProbeResult(BaseModel):
+    available: bool
+    requires_prepayment: bool = False
+    fully_booked: bool = False
+    notes: Optional[str] = None
@@ -0,0 +1,199 @@
+import re
+import json
+from datetime import date as Date
+from typing import List, Optional, Sequence, Tuple
+
+MINUTES_PER_DAY = 24 * 60
+
+# Weekday names and abbreviations, Monday first
+WEEKDAYS = (
+    ("monday", "mon"), ("tuesday", "tue", "tues"), ("wednesday", "wed"), ("thursday", "thu", "thur", "thurs"),
+    ("friday", "fri"), ("saturday", "sat"), ("sunday", "sun")
+)
+DAY_GROUPS = {"daily": range(7), "every day": range(7), "weekdays": range(5), "weekends": range(5, 7)}
+_DAY_NUMBERS = {name: number for number, names in enumerate(WEEKDAYS) for name in names}
+
+_TOKEN = re.compile(
+    r"(?P<group>daily|every day|weekdays|weekends)\b"
+    r"|(?P<day>" + "|".join(sorted(_DAY_NUMBERS, key=len, reverse=True)) + r")\b\.?"
+    r"|(?P<always>open 24 hours|24 hours|24/7)"
+    r"|(?P<closed>closed)"
+    r"|(?P<time>(?P<hour>\d{1,2})(?:[:.](?P<minute>\d{2}))?\s*(?P<meridiem>[ap])\.?m\b\.?|noon|midnight"
+    r"|(?P<hour24>\d{1,2})(?:[:.h](?P<minute24>\d{2}))?)"
+    r"|(?P<dash>-)"
+)
+
+# An interval is (start, end) in minutes since midnight; an end after midnight
+# is stored past MINUTES_PER_DAY and spills over into the next day
+Interval = Tuple[int, int]
+
+
+def _minutes(match) -> Tuple[int, Optional[str]]:
+    """Return the minutes since midnight of a time token, and its meridiem if it has one."""
+    text = match.group("time")
+    if text == "noon":
+        return 12 * 60, "p"
+    if text == "midnight":
+        return 0, "a"
+    if match.group("hour24") is not None:
+        return int(match.group("hour24")) * 60 + int(match.group("minute24") or 0), None
+    meridiem = match.group("meridiem")
+    hours = int(match.group("hour")) % 12 + (12 if meridiem == "p" else 0)
+    return hours * 60 + int(match.group("minute") or 0), meridiem
+
+
+def _interval(start: int, start_meridiem: Optional[str], end: int, end_meridiem: Optional[str]) -> Interval:
+    # "5-10 pm" shares the end's meridiem, unless that would put the start after the end ("11-2 pm")
+    if start_meridiem is None and end_meridiem == "p" and start < 12 * 60 and start + 12 * 60 <= end:
+        start += 12 * 60
+    if end <= start:
+        end += MINUTES_PER_DAY
+    return start, end
+
+
+class OpeningHours:
+    """
+    Weekly opening hours as sorted intervals per weekday.
+
+    Each weekday (Monday first) holds a tuple of intervals, an empty tuple
+    when the restaurant is closed all day, or None when the hours of that day
+    are unknown.
+    """
+
+    __slots__ = ("days",)
+
+    def __init__(self, days: Sequence[Optional[Sequence[Interval]]]):
+        self.days = tuple(None if day is None else tuple(sorted(tuple(interval) for interval in day))
+                          for day in days)
+
+    @classmethod
+    def parse(cls, text: Optional[str], observed_on: Optional[str] = None) -> Optional["OpeningHours"]:
+        """
+        Parse free-text opening hours as shown by Google Maps.
+
+        Understands day names and ranges before or after the hours ("Mon-Fri
+        9-17", "9:00-17:00 (Monday to Friday)"), 12 and 24 hour times ("5-10
+        PM", "11:30-23:00"), several intervals per day, "Closed" and "Open 24
+        hours". Hours without any day are usually those of a single date, so
+        they only apply to the weekday of observed_on; the other days stay
+        unknown.
+
+        Args:
+            text: The opening hours as shown
+            observed_on: Date (YYYY-MM-DD) the hours were shown for
+
+        Returns:
+            OpeningHours: The parsed hours, or None if no hours were recognized
+        """
+        if not text:
+            return None
+        text = text.casefold().replace("–", "-").replace("—", "-").replace(" to ", " - ")
+        days: List[Optional[List[Interval]]] = [None] * 7
+        # Each group is (weekdays, intervals, closed); a day after some hours starts a new group
+        groups: List[Tuple[List[int], List[Interval], bool]] = []
+        current_days: List[int] = []
+        intervals: List[Interval] = []
+        closed = False
+        pending: Optional[Tuple[int, Optional[str]]] = None
+        range_from: Optional[int] = None
+        previous = None
+        # Whether the days of the current group followed its hours
+        trailing_days = False
+
+        def close_group():
+            if intervals or closed:
+                groups.append((list(current_days), list(intervals), closed))
+
+        for match in _TOKEN.finditer(text):
+            kind = match.lastgroup if match.lastgroup in ("group", "day", "always", "closed", "dash") else "time"
+            if kind in ("group", "day", "dash"):
+                pass
+            elif trailing_days:
+                # Hours after trailing days start the next group
+                close_group()
+                current_days, intervals, closed, trailing_days = [], [], False, False
+            if kind in ("group", "day"):
+                if (intervals or closed) and not current_days:
+                    # Days after the hours qualify them, as in "9-17 (Mon-Fri)"
+                    trailing_days = True
+                elif (intervals or closed) and not trailing_days:
+                    close_group()
+                    current_days, intervals, closed = [], [], False
+                if kind == "group":
+                    current_days.extend(DAY_GROUPS[match.group("group")])
+                    range_from = None
+                else:
+                    number = _DAY_NUMBERS[match.group("day")]
+                    if previous == "dash" and range_from is not None:
+                        # Day range such as Mon-Fri, possibly wrapping around the week
+                        span = (number - range_from) % 7
+                        current_days.extend((range_from + offset) % 7 for offset in range(1, span + 1))
+                    else:
+                        current_days.append(number)
+                    range_from = number
+                pending = None
+            elif kind == "always":
+                intervals.append((0, MINUTES_PER_DAY))
+            elif kind == "closed":
+                closed = True
+            elif kind == "time":
+                minutes, meridiem = _minutes(match)
+                if pending is not None and previous == "dash":
+                    intervals.append(_interval(pending[0], pending[1], minutes, meridiem))
+                    pending = None
+                else:
+                    pending = (minutes, meridiem)
+            if kind not in ("day", "dash"):
+                range_from = None
+            previous = kind
+        close_group()
+
+        if not groups:
+            return None
+        for group_days, group_intervals, group_closed in groups:
+            if not group_days:
+                if observed_on is None:
+                    continue
+                group_days = [Date.fromisoformat(observed_on).weekday()]
+            for day in group_days:
+                days[day] = (days[day] or []) + group_intervals
+        if all(day is None for day in days):
+            return None
+        return cls(days)
+
+    @classmethod
+    def from_json(cls, data: Optional[str]) -> Optional["OpeningHours"]:
+        """Load hours stored with to_json, or None if nothing was stored."""
+        return cls(json.loads(data)) if data else None
+
+    def merged_with(self, older: Optional["OpeningHours"]) -> "OpeningHours":
+        """Return these hours, with the days they leave unknown taken from older hours."""
+        if older is None:
+            return self
+        return OpeningHours([older_day if day is None else day for day, older_day in zip(self.days, older.days)])
+
+    def to_json(self) -> str:
+        """Serialize the hours compactly, e.g. [[[720,1320]],[],null,...]."""
+        return json.dumps([None if day is None else [list(interval) for interval in day] for day in self.days],
+                          separators=(",", ":"))
+
+    def is_open(self, weekday: int, minute: int) -> Optional[bool]:
+        """
+        Tell whether the restaurant is open at a minute of a weekday.
+
+        Returns:
+            bool: Whether it is open, or None if the hours of that day are unknown
+        """
+        # Intervals of the previous day may run past midnight
+        yesterday = self.days[(weekday - 1) % 7]
+        if yesterday and any(start <= minute + MINUTES_PER_DAY < end for start, end in yesterday):
+            return True
+        today = self.days[weekday]
+        if today is None:
+            return None
+        return any(start <= minute < end for start, end in today)
+
+    def is_open_at(self, date: str, time_of_day: str) -> Optional[bool]:
+        """Tell whether the restaurant is open on a date (YYYY-MM-DD) at a time (HH:MM)."""
+        hours, minutes = (int(part) for part in time_of_day.split(":")[:2])
+        return self.is_open(Date.fromisoformat(date).weekday(), hours * 60 + minutes)
@@ -0,0 +1,130 @@
+import os
+import time
+import sqlite3
+import threading
+from datetime import date as Date
+from typing import Dict, Iterable, Optional, Tuple
+from storage import data_path
+
+# Upper bounds of the party size buckets; larger parties share the last bucket
+PARTY_SIZE_BUCKETS = (2, 4, 6)
+
+
+def slot_bucket(date: str, time_of_day: str, party_size: int, hour_bucket_hours: int) -> Tuple[int, int, int]:
+    """
+    Map a requested slot to its (weekday, hour bucket, party size bucket).
+
+    Weekdays count from Monday (0); hour buckets are hour_bucket_hours wide.
+    """
+    weekday = Date.fromisoformat(date).weekday()
+    hour_bucket = int(time_of_day.split(":")[0]) // hour_bucket_hours
+    party_bucket = next((index for index, bound in enumerate(PARTY_SIZE_BUCKETS) if party_size <= bound),
+                        len(PARTY_SIZE_BUCKETS))
+    return weekday, hour_bucket, party_bucket
+
+
+class OutcomeLog:
+    """
+    Booking outcomes per restaurant and slot bucket, kept as success counts in SQLite.
+
+    Every outcome increments one (successes, failures) pair, so the log stays
+    as small as the number of buckets seen. The success rate of a bucket is a
+    Beta posterior mean shrunk towards the restaurant's rate over all buckets,
+    which in turn is shrunk towards even odds: a bucket with few outcomes is
+    estimated mostly from the restaurant, a restaurant with few outcomes
+    mostly from the uniform prior.
+    """
+
+    def __init__(self, path: str, hour_bucket_hours: int = 2, prior_strength: float = 2.0):
+        self.path = path
+        self.hour_bucket_hours = hour_bucket_hours
+        self.prior_strength = prior_strength
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS booking_outcomes ("
+                "key TEXT NOT NULL, weekday INTEGER NOT NULL, hour_bucket INTEGER NOT NULL, "
+                "party_bucket INTEGER NOT NULL, successes INTEGER NOT NULL DEFAULT 0, "
+                "failures INTEGER NOT NULL DEFAULT 0, updated_at REAL NOT NULL, "
+                "PRIMARY KEY (key, weekday, hour_bucket, party_bucket))"
+            )
+
+    @classmethod
+    def from_env(cls) -> "OutcomeLog":
+        """Create a log configured from OUTCOME_* environment variables."""
+        return cls(
+            os.environ.get('OUTCOME_LOG_PATH') or data_path('outcomes.db'),
+            hour_bucket_hours=int(os.environ.get('OUTCOME_HOUR_BUCKET_HOURS', '2')),
+            prior_strength=float(os.environ.get('OUTCOME_PRIOR_STRENGTH', '2'))
+        )
+
+    def record(self, key: str, date: str, time_of_day: str, party_size: int, success: bool):
+        """
+        Count one booking outcome.
+
+        Args:
+            key: Catalog key of the restaurant
+            date: Requested date (YYYY-MM-DD)
+            time_of_day: Requested time (HH:MM)
+            party_size: Requested number of people
+            success: Whether the restaurant took a free reservation for the slot
+        """
+        bucket = slot_bucket(date, time_of_day, party_size, self.hour_bucket_hours)
+        with self._lock:
+            self._connection.execute(
+                "INSERT INTO booking_outcomes (key, weekday, hour_bucket, party_bucket, successes, failures, "
+                "updated_at) VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (key, weekday, hour_bucket, party_bucket) DO UPDATE SET "
+                "successes = successes + excluded.successes, failures = failures + excluded.failures, "
+                "updated_at = excluded.updated_at",
+                (key, *bucket, int(success), int(not success), time.time())
+            )
+
+    def success_rates(self, keys: Iterable[str], date: str, time_of_day: str, party_size: int) -> Dict[str, float]:
+        """
+        Estimate the booking success rate of restaurants for a slot.
+
+        Returns:
+            dict: Estimated success rate by key, for the restaurants with at least one outcome
+        """
+        keys = list(keys)
+        if not keys:
+            return {}
+        bucket = slot_bucket(date, time_of_day, party_size, self.hour_bucket_hours)
+        placeholders = ", ".join("?" for _ in keys)
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT key, SUM(successes), SUM(failures), "
+                "SUM(CASE WHEN weekday = ? AND hour_bucket = ? AND party_bucket = ? THEN successes ELSE 0 END), "
+                "SUM(CASE WHEN weekday = ? AND hour_bucket = ? AND party_bucket = ? THEN failures ELSE 0 END) "
+                f"FROM booking_outcomes WHERE key IN ({placeholders}) GROUP BY key",
+                [*bucket, *bucket, *keys]
+            ).fetchall()
+        k = self.prior_strength
+        rates = {}
+        for key, successes, failures, bucket_successes, bucket_failures in rows:
+            restaurant_rate = (successes + k * 0.5) / (successes + failures + k)
+            rates[key] = (bucket_successes + k * restaurant_rate) / (bucket_successes + bucket_failures + k)
+        return rates
+
+    def stats(self) -> dict:
+        """Return the size of the log for monitoring."""
+        with self._lock:
+            buckets, restaurants, successes, failures = self._connection.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT key), COALESCE(SUM(successes), 0), COALESCE(SUM(failures), 0) "
+                "FROM booking_outcomes"
+            ).fetchone()
+        return {"buckets": buckets, "restaurants": restaurants, "successes": successes, "failures": failures}
+
+
+_outcome_log: Optional[OutcomeLog] = None
+
+
+def get_outcome_log() -> OutcomeLog:
+    """Return the process-wide outcome log, opening it on first use."""
+    global _outcome_log
+    if _outcome_log is None:
+        _outcome_log = OutcomeLog.from_env()
+    return _outcome_log
@@ -0,0 +1,57 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+async def first_passing(candidates: Sequence[Any], probe: Callable[[Any], Awaitable[Any]],
+                        passed: Callable[[Any], bool], concurrency: int) -> Tuple[Optional[Any], List[Tuple[Any, Any]]]:
+    """
+    Probe candidates concurrently and stop at the first one that passes.
+
+    At most concurrency probes run at the same time; the others wait for a
+    slot in candidate order. As soon as one probe passes, every other probe
+    is cancelled. A probe that raises counts as failed with a result of None.
+
+    Args:
+        candidates: The candidates to probe, best first
+        probe: Coroutine function checking one candidate and returning its result
+        passed: Tells whether a probe result is a pass
+        concurrency: Maximum number of probes running at the same time
+
+    Returns:
+        tuple: (winner, outcomes) where winner is the first candidate that passed
+            (or None) and outcomes lists (candidate, result) of every finished probe
+    """
+    slots = asyncio.Semaphore(max(concurrency, 1))
+
+    async def run(candidate):
+        async with slots:
+            try:
+                return await probe(candidate)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Probe of {candidate} failed: {e}")
+                return None
+
+    tasks = {asyncio.create_task(run(candidate)): candidate for candidate in candidates}
+    outcomes = []
+    winner = None
+    try:
+        pending = set(tasks)
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            # Among probes finishing together, prefer the better-ranked candidate
+            for task in sorted(done, key=lambda task: candidates.index(tasks[task])):
+                result = task.result()
+                outcomes.append((tasks[task], result))
+                if winner is None and result is not None and passed(result):
+                    winner = tasks[task]
+    finally:
+        # Cancel the losing probes and wait for them to release their browser contexts
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return winner, outcomes
@@ -0,0 +1,162 @@
+from typing import List, Optional, Tuple, Type, Union, get_args, get_origin
+from pydantic import BaseModel
+from models import BookingResult, ProbeResult
+
+_SCALAR_LABELS = {str: "str", int: "int", float: "float", bool: "bool"}
+
+
+def _type_label(annotation, exclude: Tuple[str, ...] = ()) -> str:
+    origin = get_origin(annotation)
+    if origin is Union:
+        # Optional[X] and similar unions are labelled by their first non-None member
+        annotation = next(arg for arg in get_args(annotation) if arg is not type(None))
+        return _type_label(annotation, exclude)
+    if origin in (list, List):
+        return f"[{_type_label(get_args(annotation)[0], exclude)}]"
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return compact_schema(annotation, exclude)
+    return _SCALAR_LABELS.get(annotation, getattr(annotation, "__name__", str(annotation)))
+
+
+def compact_schema(model: Type[BaseModel], exclude: Tuple[str, ...] = ()) -> str:
+    """
+    Render a Pydantic model as a one-line schema for the prompt.
+
+    For example {name:str,rating?:float,popular_dishes?:[str]}, where ? marks
+    optional fields. Nested models are rendered inline. Excluded fields of
+    nested models are given by their path, such as "restaurant.popular_dishes".
+    """
+    fields = [
+        f"{name}{'' if field.is_required() else '?'}:"
+        f"{_type_label(field.annotation, tuple(path[len(name) + 1:] for path in exclude if path.startswith(name + '.')))}"
+        for name, field in model.model_fields.items()
+        if name not in exclude
+    ]
+    return "{" + ",".join(fields) + "}"
+
+
+# Google Maps search for restaurants around the given coordinates
+START_URL = "https://www.google.com/maps/search/restaurants/@{latitude},{longitude},14z/data=!3m1!4b1!4m4!2m3!5m1!4e9!6e5"
+
+# The instructions never contain job-specific values, so they form a prefix
+# that is identical for every job and can be served from the provider's prompt
+# cache. Everything that changes per job goes into the task parameters below.
+BOOKING_INSTRUCTIONS = """You book restaurant tables through Google Maps. Follow these steps, using the values given in the booking parameters of the task:
+1. Go to the start URL. If a restaurant page is given, the browser already shows it: skip steps 3 and 4.
+2. Consent any cookie popups or similar dialogs.
+3. Set the rating filter to 4.5 to find top restaurants for the purpose in the city.
+4. Search for the restaurant name if given, else for the first untried known candidate, else select a popular restaurant suitable for the purpose from the list. Click reserve a table.
+5. Open the 'Reserve a table' section and set the date, the time and the number of people to the party size.
+6. If the booking is not free (prepayment or credit card required), there is no reservation or it is fully booked, add the restaurant to skipped_restaurants with reason requires_prepayment, no_reservation or fully_booked, and repeat step 4 with another restaurant.
+7. Fill in the contact form if required with the first name, last name, email and phone number.
+8. Enter the booking description in any special request field.
+9. Confirm the booking and wait for the confirmation.
+10. Capture the booking reference, the price range and cuisine type, the Maps URL and coordinates (from the page URL) and the reservation page URL.
+11. Return the result with the done action, matching this schema (? marks optional fields):
+   {booking_schema}"""
+
+TEST_MODE_INSTRUCTIONS = """You collect restaurant information through Google Maps. Follow these steps, using the values given in the booking parameters of the task:
+1. Go to the start URL.
+2. Consent any cookie popups or similar dialogs.
+3. Set the rating filter to 4.5 to find top restaurants for the purpose in the city.
+4. Select a popular restaurant suitable for the purpose from the list.
+5. Collect its name, address, phone number, rating, price range, popular dishes, opening hours for the requested date, Maps URL and coordinates (from the page URL) and reservation page URL.
+6. Return the result with the done action, matching this schema (? marks optional fields):
+   {test_mode_schema}
+7. STOP HERE - TEST MODE ACTIVE. Do not proceed with the booking process."""
+
+PROBE_INSTRUCTIONS = """You check whether a restaurant table can be booked through Google Maps, without booking it. Follow these steps, using the values given in the probe parameters of the task:
+1. Go to the start URL in the browser, unless a restaurant page is given: the browser then already shows that page, and you skip step 3.
+2. Consent any cookie consent popups or similar dialogs that may appear.
+3. Search for the restaurant in the search bar and select it from the results.
+4. Open the 'Reserve a table' or similar section. If there is none, the restaurant is not available.
+5. Set the date, the time and the number of people to the party size.
+6. Check whether the slot can be booked and whether the booking is free (no prepayment or credit card required).
+7. Do NOT fill in contact information and do NOT confirm anything.
+8. Return the result with the done action, matching this schema (? marks optional fields):
+   {probe_schema}
+   available is true only if the slot can be booked for free."""
+
+# The schemas are derived from the output models the controller enforces,
+# instead of repeating a hand-written JSON example in every prompt
+# Popular dishes, and booking fields that only echo the request, are left out
+# of the booking schema as it is sent on every agent step; the price range and
+# cuisine type stay in, as the candidate ranking scores them
+BOOKING_INSTRUCTIONS = BOOKING_INSTRUCTIONS.format(booking_schema=compact_schema(
+    BookingResult, exclude=("restaurant.popular_dishes", "booking.first_name", "booking.last_name",
+                            "booking.special_requests")
+))
+TEST_MODE_INSTRUCTIONS = TEST_MODE_INSTRUCTIONS.format(
+    test_mode_schema=compact_schema(BookingResult, exclude=("booking", "skipped_restaurants"))
+)
+PROBE_INSTRUCTIONS = PROBE_INSTRUCTIONS.format(probe_schema=compact_schema(ProbeResult))
+
+
+def build_booking_prompt(*, test_mode: bool, city: str, date: Optional[str], time: str, party_size: int,
+                         purpose: str, latitude: float, longitude: float, first_name: Optional[str] = None,
+                         last_name: Optional[str] = None, email: Optional[str] = None,
+                         phone_number: Optional[str] = None, booking_description: Optional[str] = None,
+                         restaurant_name: Optional[str] = None,
+                         candidates: Optional[List[str]] = None,
+                         restaurant_page: Optional[str] = None) -> Tuple[str, str]:
+    """
+    Build the agent prompt as a static instruction prefix and a per-job task.
+
+    Known candidates (restaurant descriptions from the local catalog) are only
+    used for bookings, to let the agent skip browsing the result list. A
+    restaurant page is the URL the browser was opened on instead of the start
+    URL, so the agent skips searching for the restaurant.
+
+    Returns:
+        tuple: (instructions, task) where instructions are identical for every job of
+            the same mode and task holds the job parameters
+    """
+    parameters = [
+        f"- Start URL: {START_URL.format(latitude=latitude, longitude=longitude)}",
+        f"- City: {city}",
+        f"- Purpose: {purpose}"
+    ]
+    if test_mode:
+        parameters.append(f"- Requested date: {date}")
+    else:
+        parameters.extend([
+            f"- Restaurant name: {restaurant_name or 'N/A'}",
+            f"- Date: {date}",
+            f"- Time: {time}",
+            f"- Party size: {party_size}",
+            f"- First name: {first_name or 'N/A'}",
+            f"- Last name: {last_name or 'N/A'}",
+            f"- Email: {email or 'N/A'}",
+            f"- Phone number: {phone_number or 'N/A'}",
+            f"- Booking description: {booking_description or 'No special requests'}"
+        ])
+        if candidates and not restaurant_name:
+            parameters.append("- Known candidates:")
+            parameters.extend(f"  {index}. {candidate}" for index, candidate in enumerate(candidates, 1))
+        if restaurant_page:
+            parameters.append(f"- Restaurant page: {restaurant_page}")
+
+    task = "Follow the steps from your instructions with these booking parameters:\n" + "\n".join(parameters)
+    instructions = TEST_MODE_INSTRUCTIONS if test_mode else BOOKING_INSTRUCTIONS
+    return instructions, task
+
+
+def build_probe_prompt(*, restaurant: str, date: str, time: str, party_size: int, latitude: float,
+                       longitude: float, restaurant_page: Optional[str] = None) -> Tuple[str, str]:
+    """
+    Build the prompt of an availability probe for one candidate restaurant.
+
+    Returns:
+        tuple: (instructions, task) where instructions are identical for every probe
+    """
+    parameters = [
+        f"- Start URL: {START_URL.format(latitude=latitude, longitude=longitude)}",
+        f"- Restaurant: {restaurant}",
+        f"- Date: {date}",
+        f"- Time: {time}",
+        f"- Party size: {party_size}"
+    ]
+    if restaurant_page:
+        parameters.append(f"- Restaurant page: {restaurant_page}")
+    task = "Follow the steps from your instructions with these probe parameters:\n" + "\n".join(parameters)
+    return PROBE_INSTRUCTIONS, task
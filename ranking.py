@@ -0,0 +1,171 @@
+import os
+from dataclasses import dataclass
+from operator import itemgetter
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+from catalog import EARTH_RADIUS_KM, restaurant_from_row
+
+
+@dataclass(frozen=True)
+class RankingWeights:
+    """Weights of the candidate score components; each component lies in [0, 1]."""
+
+    rating: float = 0.45
+    distance: float = 0.2
+    success: float = 0.2
+    popularity: float = 0.05
+    price: float = 0.05
+    cuisine: float = 0.05
+    # Distance in kilometres at which the distance component has dropped to 1/e
+    distance_scale_km: float = 1.5
+
+    @classmethod
+    def from_env(cls) -> "RankingWeights":
+        """Create weights from RANKING_WEIGHT_* environment variables, defaulting to the class values."""
+        defaults = cls()
+        return cls(**{
+            name: float(os.environ.get(f'RANKING_WEIGHT_{name.upper()}', str(getattr(defaults, name))))
+            for name in cls.__dataclass_fields__
+        })
+
+
+class CandidateSet:
+    """
+    Column-wise arrays of restaurant candidates, ready for vectorized scoring.
+
+    The arrays are read straight from the tuples of a catalog query
+    (RestaurantCatalog.nearby_rows) with C-level iteration, and restaurant
+    dicts are only built for the candidates that are picked. Missing values
+    are NaN (ratings, success rates) or 0 (price level), so the scorer can
+    fill them with neutral values in one array operation.
+    """
+
+    def __init__(self, columns: Sequence[str], rows: Sequence[tuple]):
+        self.columns = list(columns)
+        count = len(rows)
+        # Rows are kept as an object array, so selections are index operations too
+        self.rows = np.fromiter(rows, dtype=object, count=count)
+        # fromiter reads the columns that are never NULL fastest; np.array turns a NULL rating into NaN
+        self.latitudes = np.fromiter(self._values("latitude"), np.float64, count)
+        self.longitudes = np.fromiter(self._values("longitude"), np.float64, count)
+        self.ratings = np.array(self.column("rating"), dtype=np.float64)
+        self.times_chosen = np.fromiter(self._values("times_chosen"), np.float64, count)
+        self.price_levels = np.fromiter(self._values("price_level"), np.int8, count)
+        self.keys = np.array(self.column("key"), dtype=object)
+        # None where the cuisine is unknown
+        self.cuisines = np.array(self.column("cuisine_type"), dtype=object)
+        self.success_rates = np.full(count, np.nan)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def column(self, name: str) -> list:
+        """Return the values of a column, in candidate order."""
+        return list(self._values(name))
+
+    def _values(self, name: str):
+        if not len(self.rows):
+            return iter(())
+        return map(itemgetter(self.columns.index(name)), self.rows)
+
+    def select(self, mask: np.ndarray) -> "CandidateSet":
+        """Return the candidates where mask is true, keeping their success rates."""
+        indexes = np.flatnonzero(mask)
+        subset = CandidateSet.__new__(CandidateSet)
+        subset.columns = self.columns
+        for name in ("rows", "latitudes", "longitudes", "ratings", "times_chosen", "price_levels", "keys", "cuisines",
+                     "success_rates"):
+            setattr(subset, name, getattr(self, name)[indexes])
+        return subset
+
+    def within(self, latitude: float, longitude: float, radius_km: float) -> "CandidateSet":
+        """Return the candidates within a radius of a point."""
+        return self.select(self.distances_km(latitude, longitude) <= radius_km)
+
+    def set_success_rates(self, rates: Dict[str, float]):
+        """Set the booking success rates of the candidates with known outcomes, by key."""
+        positions = dict(zip(self.keys.tolist(), range(len(self))))
+        for key, rate in rates.items():
+            if key in positions:
+                self.success_rates[positions[key]] = rate
+
+    def restaurant(self, index: int) -> dict:
+        """Return a candidate as a restaurant dict, with its success rate if known."""
+        restaurant = restaurant_from_row(self.columns, self.rows[index])
+        success_rate = self.success_rates[index]
+        restaurant["success_rate"] = None if np.isnan(success_rate) else float(success_rate)
+        return restaurant
+
+    def distances_km(self, latitude: float, longitude: float) -> np.ndarray:
+        """Great-circle distances from a point to every candidate."""
+        phi1, phi2 = np.radians(latitude), np.radians(self.latitudes)
+        a = (np.sin((phi2 - phi1) / 2) ** 2
+             + np.cos(phi1) * np.cos(phi2) * np.sin(np.radians(self.longitudes - longitude) / 2) ** 2)
+        return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+class CandidateRanker:
+    """
+    Scores restaurant candidates with array operations only.
+
+    The score is a weighted sum of the rating (3 to 5 stars mapped to 0 to 1),
+    closeness to the search location, past booking success, how often the
+    restaurant was chosen for the purpose, and optional price and cuisine
+    preferences. Top-k selection uses argpartition, so only the k best are
+    sorted.
+    """
+
+    def __init__(self, weights: Optional[RankingWeights] = None):
+        self.weights = weights or RankingWeights()
+
+    def score(self, candidates: CandidateSet, latitude: float, longitude: float,
+              max_price_level: Optional[int] = None, cuisine: Optional[str] = None) -> np.ndarray:
+        """
+        Score every candidate.
+
+        Args:
+            candidates: The candidates to score
+            latitude: Latitude of the search location
+            longitude: Longitude of the search location
+            max_price_level: Preferred highest price level (number of currency symbols)
+            cuisine: Preferred cuisine; matched as a substring of the cuisine type
+
+        Returns:
+            np.ndarray: One score per candidate; higher is better
+        """
+        w = self.weights
+        # Unknown ratings count as an average 4 stars, unknown success as even odds
+        rating = np.clip((np.nan_to_num(candidates.ratings, nan=4.0) - 3.0) / 2.0, 0.0, 1.0)
+        closeness = np.exp(-candidates.distances_km(latitude, longitude) / w.distance_scale_km)
+        success = np.nan_to_num(candidates.success_rates, nan=0.5)
+        popularity = 1.0 - 1.0 / (1.0 + candidates.times_chosen)
+        scores = w.rating * rating + w.distance * closeness + w.success * success + w.popularity * popularity
+        if max_price_level is not None:
+            known = candidates.price_levels > 0
+            scores += w.price * np.where(known, candidates.price_levels <= max_price_level, 0.5)
+        if cuisine:
+            # Few cuisines are distinct, so each is matched once and the matches are mapped back
+            wanted = cuisine.casefold()
+            matches = {name: bool(name) and wanted in name.casefold() for name in set(candidates.cuisines.tolist())}
+            scores += w.cuisine * np.fromiter(map(matches.__getitem__, candidates.cuisines), np.float64,
+                                              len(candidates))
+        return scores
+
+    def top_k(self, candidates: CandidateSet, k: int, latitude: float, longitude: float,
+              max_price_level: Optional[int] = None, cuisine: Optional[str] = None) -> np.ndarray:
+        """Return the indexes of the k best candidates, best first."""
+        if not len(candidates) or k <= 0:
+            return np.empty(0, dtype=np.intp)
+        scores = self.score(candidates, latitude, longitude, max_price_level, cuisine)
+        if k < len(scores):
+            best = np.argpartition(-scores, k - 1)[:k]
+        else:
+            best = np.arange(len(scores))
+        return best[np.argsort(-scores[best], kind="stable")]
+
+
+def rank_restaurants(candidates: CandidateSet, latitude: float, longitude: float, k: int,
+                     ranker: Optional[CandidateRanker] = None, **preferences) -> List[dict]:
+    """Return the k best catalog candidates as restaurant dicts, best first."""
+    ranker = ranker or CandidateRanker(RankingWeights.from_env())
+    return [candidates.restaurant(index) for index in ranker.top_k(candidates, k, latitude, longitude, **preferences)]
@@ -0,0 +1,113 @@
+import os
+import json
+import time
+from collections import OrderedDict
+from typing import Optional, Set, Tuple
+from gazetteer import normalize_name
+
+# Coordinates are rounded to two decimals (about one kilometre) for cache keys
+COORDINATE_PRECISION = 2
+
+
+def request_cache_key(*, city: str, latitude: Optional[float], longitude: Optional[float], purpose: str,
+                      restaurant_name: Optional[str], date: Optional[str]) -> str:
+    """
+    Build the cache key of a test mode request.
+
+    The search location is the rounded coordinates when they are given and the
+    normalized city name otherwise, so nearby searches and spelling variants
+    of a city share one entry.
+    """
+    if latitude is not None and longitude is not None:
+        location = f"{round(latitude, COORDINATE_PRECISION)},{round(longitude, COORDINATE_PRECISION)}"
+    else:
+        location = normalize_name(city or "")
+    return "|".join((location, normalize_name(purpose or ""), normalize_name(restaurant_name or ""), date or ""))
+
+
+def is_cacheable(result: Optional[str]) -> bool:
+    """Tell whether an agent result holds restaurant information worth caching."""
+    try:
+        return bool(json.loads(result).get("restaurant"))
+    except (TypeError, ValueError, AttributeError):
+        return False
+
+
+class ResultCache:
+    """
+    TTL cache of test mode results with stale-while-revalidate.
+
+    A result is fresh for ttl seconds. For stale_ttl seconds after that it is
+    still served, but the first request that sees it stale is told to refresh
+    it in the background; later requests keep getting the stale result until
+    the refresh has finished. At most max_size results are kept, least
+    recently used first out.
+    """
+
+    def __init__(self, ttl: float = 6 * 3600, stale_ttl: float = 24 * 3600, max_size: int = 1000):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._refreshing: Set[str] = set()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+
+    @classmethod
+    def from_env(cls) -> "ResultCache":
+        """Create a cache configured from RESULT_CACHE_* environment variables."""
+        return cls(
+            ttl=float(os.environ.get('RESULT_CACHE_TTL', str(6 * 3600))),
+            stale_ttl=float(os.environ.get('RESULT_CACHE_STALE_TTL', str(24 * 3600))),
+            max_size=int(os.environ.get('RESULT_CACHE_MAX_SIZE', '1000'))
+        )
+
+    def get(self, key: str) -> Tuple[Optional[str], bool]:
+        """
+        Look up a result.
+
+        Returns:
+            tuple: (result, refresh) where result is None on a miss, and refresh
+                tells the caller to recompute the stale result in the background
+        """
+        entry = self._entries.get(key)
+        age = time.time() - entry[1] if entry else None
+        if entry is None or age > self.ttl + self.stale_ttl:
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None, False
+        self._entries.move_to_end(key)
+        if age <= self.ttl:
+            self.hits += 1
+            return entry[0], False
+        self.stale_hits += 1
+        if key in self._refreshing:
+            return entry[0], False
+        self._refreshing.add(key)
+        self.refreshes += 1
+        return entry[0], True
+
+    def put(self, key: str, result: str):
+        """Store a fresh result."""
+        self._entries[key] = (result, time.time())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def refresh_done(self, key: str):
+        """Allow the next stale hit of a key to start a refresh again."""
+        self._refreshing.discard(key)
+
+    def stats(self) -> dict:
+        """Return the cache size and hit/miss counters for monitoring."""
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "hit_ratio": round((self.hits + self.stale_hits) / lookups, 3) if lookups else 0.0
+        }
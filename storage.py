@@ -0,0 +1,13 @@
+import os
+
+
+def data_path(filename: str) -> str:
+    """
+    Return the path of a local state file inside the data directory.
+
+    The directory is taken from BOOKER_DATA_DIR (default: .booker) and is
+    created on first use.
+    """
+    data_dir = os.environ.get('BOOKER_DATA_DIR', '.booker')
+    os.makedirs(data_dir, exist_ok=True)
+    return os.path.join(data_dir, filename)